@@ -4,6 +4,7 @@ import os
 
 from src.config import Config
 from src.coordinator import Coordinator
+from src.corpus import REPLAY_RATES
 
 log_level = os.environ.get('LOGLEVEL', 'INFO').upper()
 logging.basicConfig(level=log_level)
@@ -12,7 +13,8 @@ logging.basicConfig(level=log_level)
 def run(args: argparse.Namespace):
     config = Config.read(args.config_path)
 
-    Coordinator.run(config, args.seeds, args.nodes, args.base_directory, args.base_binary, args.fail_fast, args.json_output)
+    Coordinator.run(config, args.seeds, args.nodes, args.base_directory, args.base_binary, args.fail_fast, args.json_output,
+                    args.processes, args.resume, args.corpus, args.replay_rate, args.saturation)
 
 
 if __name__ == '__main__':
@@ -26,6 +28,19 @@ if __name__ == '__main__':
                         default="configs/conf.yaml")
     parser.add_argument("-ff", "--fail-fast", action='store_true', help='Fail if any tx fail.', default=False)
     parser.add_argument("-j", "--json-output", action='store_true', help='Dump result as json.', default=False)
+    parser.add_argument("-p", "--processes", action='store_true', help='Run each seed in its own worker process.',
+                        default=False)
+    parser.add_argument("-r", "--resume", action='store_true',
+                        help='Restore the state from the last snapshot instead of running a full Init.', default=False)
+    parser.add_argument("--corpus", type=str, action='store', choices=['generate', 'replay'],
+                        help='Write the planned txs to corpus/<seed>.jsonl, or send a previously generated corpus.',
+                        default=None)
+    parser.add_argument("--replay-rate", type=str, action='store', choices=REPLAY_RATES,
+                        help='Replay the corpus as fast as possible or at the offsets it was planned with.',
+                        default='full')
+
+    parser.add_argument("--saturation", action='store_true',
+                        help='Search the highest rate that holds the SLOs of the saturation settings.', default=False)
 
     args = parser.parse_args()
 
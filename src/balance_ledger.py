@@ -0,0 +1,156 @@
+import logging
+import random
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from src.node_pool import NodePool
+from src.node_status import NodeStatus
+from src.store import Store
+
+# (alias, token, amount) held by an in-flight tx
+Reservation = Tuple[str, str, int]
+
+
+@dataclass
+class BalanceLedger:
+    # (alias, token) -> balance as of the last successful tx or resync, the store is kept in step with it
+    committed: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    # (alias, token) -> amount spent by the txs still in flight
+    pending: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    # bumped on every committed change, a resync racing with a tx is dropped
+    versions: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    # aliases that failed a tx for a lack of balance, resynced first
+    suspects: Set[str] = field(default_factory=set)
+    lock: Lock = field(default_factory=Lock)
+    reservations: int = field(init=False, default=0)
+    refused: int = field(init=False, default=0)
+
+    def load(self, accounts: List[Dict]):
+        with self.lock:
+            for account in accounts:
+                self.committed[(account['alias'], account['token'])] = int(account['amount'])
+
+    def available(self, alias: str, token: str) -> int:
+        with self.lock:
+            return self.committed.get((alias, token), 0) - self.pending.get((alias, token), 0)
+
+    def reserve(self, alias: str, token: str, amount: int) -> Optional[Reservation]:
+        with self.lock:
+            key = (alias, token)
+            if self.committed.get(key, 0) - self.pending.get(key, 0) < amount:
+                self.refused += 1
+                return None
+            self.pending[key] = self.pending.get(key, 0) + amount
+            self.reservations += 1
+            return alias, token, amount
+
+    def release(self, reservations: List[Reservation]):
+        with self.lock:
+            for alias, token, amount in reservations:
+                key = (alias, token)
+                self.pending[key] -= amount
+                if self.pending[key] <= 0:
+                    del self.pending[key]
+
+    def apply(self, alias: str, token: str, delta_amount: int):
+        with self.lock:
+            key = (alias, token)
+            self.committed[key] = self.committed.get(key, 0) + delta_amount
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def suspect(self, aliases: List[str]):
+        with self.lock:
+            self.suspects.update(aliases)
+
+    def sample(self, size: int) -> List[str]:
+        with self.lock:
+            aliases = list(self.suspects)[:size]
+            self.suspects.difference_update(aliases)
+            others = list({alias for alias, _ in self.committed.keys()}.difference(aliases))
+        return aliases + random.sample(others, min(size - len(aliases), len(others)))
+
+    def state_of(self, alias: str) -> Tuple[bool, Dict[str, int]]:
+        # (busy, token -> version), taken before querying the chain
+        with self.lock:
+            busy = any([key[0] == alias for key in self.pending.keys()])
+            return busy, {token: self.versions.get((key_alias, token), 0)
+                          for key_alias, token in self.committed.keys() if key_alias == alias}
+
+    def resync(self, alias: str, token: str, amount: int, version: int) -> Optional[int]:
+        # returns the drift applied, None when a tx changed the balance while the chain was queried
+        with self.lock:
+            key = (alias, token)
+            if self.versions.get(key, 0) != version or key in self.pending:
+                return None
+            drift = amount - self.committed.get(key, 0)
+            if drift != 0:
+                self.committed[key] = amount
+                self.versions[key] = version + 1
+            return drift
+
+
+@dataclass
+class BalanceReconciler:
+    ledger: BalanceLedger
+    store: Store
+    # (alias, node) -> token -> amount, see Init.query_balances
+    query: Callable[[str, str], Dict[str, int]]
+    node_pool: NodePool
+    seed: int
+    every_blocks: int = 10
+    sample_size: int = 8
+    poll_interval: float = 2
+    last_height: Optional[int] = field(init=False, default=None)
+    resynced: int = field(init=False, default=0)
+    drifted: int = field(init=False, default=0)
+    total_drift: int = field(init=False, default=0)
+    stopped: Event = field(init=False, default_factory=Event)
+
+    @staticmethod
+    def from_config(ledger: BalanceLedger, store: Store, query: Callable[[str, str], Dict[str, int]],
+                    node_pool: NodePool, seed: int, data: Dict) -> 'BalanceReconciler':
+        return BalanceReconciler(ledger, store, query, node_pool, seed, int(data.get('reconcile_blocks', 10)),
+                                 int(data.get('sample_size', 8)), float(data.get('poll_interval', 2)))
+
+    def start(self):
+        Thread(target=self._reconcile_loop, name='reconciler:{}'.format(self.seed), daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def reconcile(self, node: str, height: int):
+        resynced, drifted, drift_amount = 0, 0, 0
+        for alias in self.ledger.sample(self.sample_size):
+            busy, versions = self.ledger.state_of(alias)
+            if busy:
+                continue
+            balances = self.query(alias, node)
+            for token, version in versions.items():
+                drift = self.ledger.resync(alias, token, balances.get(token, 0), version)
+                if drift is None:
+                    continue
+                if drift != 0:
+                    self.store.accounts.update_account_balance(alias, token, drift, self.seed)
+                    drifted += 1
+                    drift_amount += abs(drift)
+            resynced += 1
+
+        self.resynced += resynced
+        self.drifted += drifted
+        self.total_drift += drift_amount
+        logging.info("reconciler:{} - Resynced {} accounts at height {}, {} balances drifted by {} in total".format(
+            self.seed, resynced, height, drifted, drift_amount))
+
+    def _reconcile_loop(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                node = self.node_pool.pick()
+                height = NodeStatus.fetch(node).latest_block_height
+                if self.last_height is None:
+                    self.last_height = height
+                elif height - self.last_height >= self.every_blocks:
+                    self.last_height = height
+                    self.reconcile(node, height)
+            except Exception as e:
+                logging.warning("reconciler:{} - Can't reconcile balances: {}".format(self.seed, e))
@@ -0,0 +1,202 @@
+import base64
+import calendar
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set, Tuple
+
+import requests
+
+from src.histogram import Histogram, Latencies, copy_latencies
+from src.node_pool import NodePool
+from src.node_status import NodeStatus
+
+
+def parse_block_time(value: str) -> float:
+    # rfc3339 with up to nanoseconds, strptime only takes whole seconds
+    date, _, fraction = value.rstrip('Z').partition('.')
+    seconds = calendar.timegm(time.strptime(date, '%Y-%m-%dT%H:%M:%S'))
+    return seconds + float('0.' + fraction) if fraction else float(seconds)
+
+
+def get_result(session: requests.Session, node: str, path: str, timeout: float) -> Dict:
+    body = session.get("http://{}/{}".format(node, path), timeout=timeout).json()
+    if 'error' in body:
+        raise Exception("{} failed on {}: {}".format(path, node, body['error']))
+    return body['result'] if 'result' in body else body
+
+
+def tx_hash(tx: str) -> str:
+    # tendermint hashes the raw tx bytes, /block and /unconfirmed_txs return them in base64
+    return hashlib.sha256(base64.b64decode(tx)).hexdigest().upper()
+
+
+def _decode(value: Optional[str]) -> str:
+    # tendermint 0.34 base64 encodes the event attributes, later versions don't
+    if not value:
+        return ''
+    try:
+        decoded = base64.b64decode(value, validate=True).decode()
+        return decoded if decoded.isprintable() else value
+    except (ValueError, UnicodeDecodeError):
+        return value
+
+
+def event_hashes(events: List[Dict]) -> Set[str]:
+    # namada prints the hash of its tx events, which isn't the hash of the raw tx bytes
+    hashes = set()
+    for event in events or []:
+        for attribute in event.get('attributes') or []:
+            if _decode(attribute.get('key')) == 'hash':
+                hashes.add(_decode(attribute.get('value')).upper())
+    return hashes
+
+
+@dataclass
+class BlockWatcher:
+    node_pool: NodePool
+    seed: int
+    poll_interval: float = 1
+    # also poll /unconfirmed_txs, for the time each tx entered the mempool
+    mempool: bool = True
+    # blocks fetched per poll at most, when the watcher falls behind
+    max_blocks: int = 50
+    # seconds a submitted tx is waited for, then counted as not included
+    timeout: float = 120
+    # seconds the hashes of the blocks and of the mempool are kept, the client only returns once the tx is applied
+    retention: float = 600
+    timeout_seconds: float = 5
+    session: requests.Session = field(init=False, default_factory=requests.Session)
+    # tx hash -> (task name, submission time)
+    pending: Dict[str, Tuple[str, float]] = field(init=False, default_factory=dict)
+    # tx hash -> (height, block time)
+    included: Dict[str, Tuple[int, float]] = field(init=False, default_factory=dict)
+    # tx hash -> first time it was seen in the mempool
+    mempool_seen: Dict[str, float] = field(init=False, default_factory=dict)
+    # height -> [txs in the block, txs of this seed]
+    blocks: Dict[int, List[int]] = field(init=False, default_factory=dict)
+    latencies: Latencies = field(init=False, default_factory=dict)
+    last_height: Optional[int] = field(init=False, default=None)
+    matched: int = field(init=False, default=0)
+    unmatched: int = field(init=False, default=0)
+    lock: Lock = field(init=False, default_factory=Lock)
+    stopped: Event = field(init=False, default_factory=Event)
+    thread: Optional[Thread] = field(init=False, default=None)
+
+    @staticmethod
+    def from_config(node_pool: NodePool, seed: int, data: Dict) -> 'BlockWatcher':
+        return BlockWatcher(node_pool, seed, float(data.get('poll_interval', 1)), data.get('mempool', True),
+                            int(data.get('max_blocks', 50)), float(data.get('timeout', 120)),
+                            float(data.get('retention', 600)))
+
+    def start(self):
+        self.thread = Thread(target=self._watch_loop, name='watcher:{}'.format(self.seed), daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        # the txs sent last are only in the next blocks, wait for them a little
+        deadline = time.monotonic() + 3 * self.poll_interval
+        while self.pending and time.monotonic() < deadline and self.thread is not None and self.thread.is_alive():
+            time.sleep(min(self.poll_interval, 0.2))
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def track(self, task_name: str, hash_: str, submitted_at: float):
+        with self.lock:
+            self.pending[hash_.upper()] = (task_name, submitted_at)
+            self._match()
+
+    def poll(self):
+        node = self.node_pool.pick()
+        height = NodeStatus.fetch(node, self.session, self.timeout_seconds).latest_block_height
+        if self.last_height is None:
+            self.last_height = height - 1
+        if self.mempool:
+            self._poll_mempool(node)
+        # the oldest missing blocks are skipped when too far behind
+        for block_height in range(max(self.last_height + 1, height - self.max_blocks + 1), height + 1):
+            self._fetch_block(node, block_height)
+        self.last_height = max(self.last_height, height)
+        with self.lock:
+            self._match()
+            self._expire()
+
+    def copy_latencies(self) -> Latencies:
+        with self.lock:
+            return copy_latencies(self.latencies)
+
+    def summary(self) -> Dict[str, float]:
+        with self.lock:
+            blocks = list(self.blocks.values())
+            summary = {'included': self.matched, 'not_included': self.unmatched, 'pending': len(self.pending),
+                       'blocks': len(blocks)}
+        if blocks:
+            summary['txs_per_block'] = round(sum([txs for txs, _ in blocks]) / len(blocks), 2)
+            summary['max_txs_per_block'] = max([txs for txs, _ in blocks])
+            summary['own_txs_per_block'] = round(sum([own for _, own in blocks]) / len(blocks), 2)
+        return summary
+
+    def _get(self, node: str, path: str) -> Dict:
+        return get_result(self.session, node, path, self.timeout_seconds)
+
+    def _poll_mempool(self, node: str):
+        txs = self._get(node, 'unconfirmed_txs?limit=100').get('txs') or []
+        now = time.time()
+        with self.lock:
+            for tx in txs:
+                self.mempool_seen.setdefault(tx_hash(tx), now)
+
+    def _fetch_block(self, node: str, height: int):
+        block = self._get(node, 'block?height={}'.format(height))['block']
+        block_time = parse_block_time(block['header']['time'])
+        txs = block['data'].get('txs') or []
+        hashes = set([tx_hash(tx) for tx in txs])
+        try:
+            results = self._get(node, 'block_results?height={}'.format(height))
+            for key in ['begin_block_events', 'end_block_events', 'finalize_block_events']:
+                hashes.update(event_hashes(results.get(key)))
+            for tx_result in results.get('txs_results') or []:
+                hashes.update(event_hashes(tx_result.get('events')))
+        except Exception as e:
+            logging.debug("watcher:{} - No block results at height {}: {}".format(self.seed, height, e))
+        with self.lock:
+            self.blocks[height] = [len(txs), 0]
+            for hash_ in hashes:
+                self.included[hash_] = (height, block_time)
+
+    def _match(self):
+        for hash_ in [hash_ for hash_ in self.pending.keys() if hash_ in self.included]:
+            task_name, submitted_at = self.pending.pop(hash_)
+            height, block_time = self.included[hash_]
+            if height in self.blocks:
+                self.blocks[height][1] += 1
+            phases = {'submit_to_block': block_time - submitted_at}
+            mempool_time = self.mempool_seen.get(hash_)
+            if mempool_time is not None:
+                phases['submit_to_mempool'] = mempool_time - submitted_at
+                phases['mempool_to_block'] = block_time - mempool_time
+            task_latencies = self.latencies.setdefault(task_name, {})
+            for phase, seconds in phases.items():
+                task_latencies.setdefault(phase, Histogram()).record(seconds)
+            self.matched += 1
+
+    def _expire(self):
+        now = time.time()
+        for hash_ in [hash_ for hash_, (_, submitted_at) in self.pending.items() if now - submitted_at > self.timeout]:
+            del self.pending[hash_]
+            self.unmatched += 1
+        self.included = {hash_: (height, block_time) for hash_, (height, block_time) in self.included.items()
+                         if now - block_time <= self.retention}
+        self.mempool_seen = {hash_: seen for hash_, seen in self.mempool_seen.items() if now - seen <= self.retention}
+
+    def _watch_loop(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.warning("watcher:{} - Can't poll blocks: {}".format(self.seed, e))
@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import requests
+
+from src.block_watcher import get_result, parse_block_time
+from src.node_status import NodeStatus
+
+
+@dataclass
+class BlockStats:
+    height: int
+    time: float
+    # seconds since the previous block, None for the first block of the window
+    interval: Optional[float]
+    txs: int
+    failed: int
+    gas_used: int
+
+
+@dataclass
+class ChainAnalyzer:
+    # what the chain processed during the run, to compare with what the load tester sent
+    nodes: List[str]
+    # seconds per row of the timeline
+    bucket: float = 10
+    # blocks fetched at most, the most recent ones are kept
+    max_blocks: int = 10000
+    timeout: float = 5
+    # committed over sent tx/s below which the chain, not the load tester, is the limit
+    saturation_ratio: float = 0.9
+    session: requests.Session = field(init=False, default_factory=requests.Session)
+    last_height: Optional[int] = field(init=False, default=None)
+    last_time: Optional[float] = field(init=False, default=None)
+
+    @staticmethod
+    def from_config(nodes: List[str], data: Dict) -> 'ChainAnalyzer':
+        return ChainAnalyzer(nodes, float(data.get('bucket', 10)), int(data.get('max_blocks', 10000)),
+                             float(data.get('timeout', 5)), float(data.get('saturation_ratio', 0.9)))
+
+    def height(self) -> int:
+        return max([self._status(node).latest_block_height for node in self.nodes])
+
+    def collect(self, start_height: int, end_height: int) -> List[BlockStats]:
+        start_height = max(start_height, end_height - self.max_blocks + 1, 1)
+        # the block before the window gives the interval of the first one
+        previous_time = self._fetch(start_height - 1, None).time if start_height > 1 else None
+        blocks = []
+        for height in range(start_height, end_height + 1):
+            blocks.append(self._fetch(height, previous_time))
+            previous_time = blocks[-1].time
+        return blocks
+
+    def follow(self) -> List[BlockStats]:
+        # blocks committed since the previous call, for the live metrics
+        height = self.height()
+        if self.last_height is None:
+            self.last_height = height
+            return []
+        blocks = []
+        for block_height in range(max(self.last_height + 1, height - self.max_blocks + 1), height + 1):
+            blocks.append(self._fetch(block_height, self.last_time))
+            self.last_time = blocks[-1].time
+        self.last_height = max(self.last_height, height)
+        return blocks
+
+    def timeline(self, blocks: List[BlockStats], sent: Dict[int, int]) -> List[Dict]:
+        # one row per bucket, the txs sent by every seed next to the blocks committed by the chain
+        if not blocks and not sent:
+            return []
+        start = min([block.time for block in blocks] + list(sent.keys()))
+        end = max([block.time for block in blocks] + list(sent.keys()))
+        rows = [{'time': round(start + index * self.bucket, 3), 'sent': 0, 'blocks': 0, 'txs': 0, 'failed': 0,
+                 'gas_used': 0, 'intervals': []} for index in range(int((end - start) // self.bucket) + 1)]
+        for second, count in sent.items():
+            rows[int((second - start) // self.bucket)]['sent'] += count
+        for block in blocks:
+            row = rows[int((block.time - start) // self.bucket)]
+            row['blocks'] += 1
+            row['txs'] += block.txs
+            row['failed'] += block.failed
+            row['gas_used'] += block.gas_used
+            if block.interval is not None:
+                row['intervals'].append(block.interval)
+        for row in rows:
+            intervals = row.pop('intervals')
+            row['sent_tx_per_s'] = round(row['sent'] / self.bucket, 3)
+            row['chain_tx_per_s'] = round(row['txs'] / self.bucket, 3)
+            row['txs_per_block'] = round(row['txs'] / row['blocks'], 2) if row['blocks'] else None
+            row['block_interval'] = round(sum(intervals) / len(intervals), 3) if intervals else None
+        return rows
+
+    def summary(self, blocks: List[BlockStats], sent: Dict[int, int]) -> Dict:
+        summary = {'blocks': len(blocks), 'sent': sum(sent.values())}
+        if len(blocks) < 2:
+            return summary
+        duration = max(blocks[-1].time - blocks[0].time, 1e-6)
+        intervals = sorted([block.interval for block in blocks if block.interval is not None])
+        txs = [block.txs for block in blocks]
+        sent_in_window = sum([count for second, count in sent.items() if blocks[0].time <= second <= blocks[-1].time])
+        summary.update({
+            'duration': round(duration, 3),
+            'txs': sum(txs),
+            'failed': sum([block.failed for block in blocks]),
+            'gas_used': sum([block.gas_used for block in blocks]),
+            'txs_per_block': round(sum(txs) / len(blocks), 2),
+            'max_txs_per_block': max(txs),
+            'block_interval': round(sum(intervals) / len(intervals), 3) if intervals else None,
+            'max_block_interval': round(intervals[-1], 3) if intervals else None,
+            'sent_tx_per_s': round(sent_in_window / duration, 3),
+            'chain_tx_per_s': round(sum(txs[1:]) / duration, 3),
+        })
+        summary['bottleneck'] = self._bottleneck(summary)
+        return summary
+
+    def _bottleneck(self, summary: Dict) -> str:
+        # the chain also counts txs from other senders, a chain keeping up with what was sent points at the harness
+        if summary['sent_tx_per_s'] == 0:
+            return 'idle'
+        if summary['chain_tx_per_s'] >= self.saturation_ratio * summary['sent_tx_per_s']:
+            return 'load_tester'
+        return 'chain'
+
+    def _status(self, node: str) -> NodeStatus:
+        return NodeStatus.fetch(node, self.session, self.timeout)
+
+    def _fetch(self, height: int, previous_time: Optional[float]) -> BlockStats:
+        # any node of the run can serve the window, the next one is tried when a node can't
+        error = None
+        for node in self.nodes:
+            try:
+                block = get_result(self.session, node, 'block?height={}'.format(height), self.timeout)['block']
+                results = get_result(self.session, node, 'block_results?height={}'.format(height), self.timeout)
+                break
+            except Exception as e:
+                error = e
+        else:
+            raise Exception("Can't fetch block {}: {}".format(height, error))
+
+        block_time = parse_block_time(block['header']['time'])
+        txs_results = results.get('txs_results') or []
+        return BlockStats(height, block_time, None if previous_time is None else round(block_time - previous_time, 3),
+                          len(block['data'].get('txs') or []),
+                          len([result for result in txs_results if int(result.get('code', 0)) != 0]),
+                          sum([int(result.get('gas_used') or 0) for result in txs_results]))
+
+
+def format_chain_summary(summary: Dict) -> List[str]:
+    if summary['blocks'] < 2:
+        return ["- {} blocks committed during the run.".format(summary['blocks'])]
+    return [
+        "- {0} blocks in {1}s, block interval {2}s (max {3}s)".format(
+            summary['blocks'], summary['duration'], summary['block_interval'], summary['max_block_interval']),
+        "- {0} txs ({1} failed), {2} txs per block (max {3}), {4} gas used".format(
+            summary['txs'], summary['failed'], summary['txs_per_block'], summary['max_txs_per_block'],
+            summary['gas_used']),
+        "- sent {0} tx/s, chain committed {1} tx/s: {2} bound".format(
+            summary['sent_tx_per_s'], summary['chain_tx_per_s'], summary['bottleneck'].replace('_', ' ')),
+    ]
@@ -95,6 +95,10 @@ class ClientCommands(Command):
         return self._get_full_command(self.sub_binary, "init-proposal --data-path {0}".format(proposal_path),
                                       ledger_address)
 
+    def dump_tx(self, command: List[str], output_folder: str) -> List[str]:
+        # the tx is built and signed, then written to output_folder instead of being sent
+        return command + "--dump-tx --output-folder-path {0}".format(output_folder).split(' ')
+
     def vote_proposal(self, proposal_id: int, vote: str, signer: str, ledger_address: str):
         return self._get_full_command(self.sub_binary,
                                       "vote-proposal --proposal-id {0} --vote {1} --signer {2}".format(proposal_id,
@@ -1,6 +1,6 @@
 import sys
 from dataclasses import dataclass
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 from ruamel import yaml
 
@@ -27,8 +27,68 @@ class Config:
     def get_dry_run(self) -> bool:
         return self.get_settings()['dry_run']
 
+    def get_engine(self) -> str:
+        return self.get_settings().get('engine', 'thread')
+
+    def get_concurrency(self) -> int:
+        return self.get_settings().get('concurrency', 1)
+
+    def get_command_timeout(self) -> int:
+        return self.get_settings().get('command_timeout', 130)
+
+    def get_rpc(self) -> Optional[Dict]:
+        return self.get_settings().get('rpc', None)
+
+    def get_init(self) -> Dict:
+        return self.get_settings().get('init', {})
+
+    def get_store(self) -> Dict:
+        return self.get_settings().get('store', {'backend': 'sqlite'})
+
+    def get_epoch_cache(self) -> Optional[Dict]:
+        return self.get_settings().get('epoch_cache', None)
+
+    def get_leases(self) -> Optional[Dict]:
+        return self.get_settings().get('leases', None)
+
+    def get_inclusion(self) -> Optional[Dict]:
+        return self.get_settings().get('inclusion', None)
+
+    def get_pipeline(self) -> Optional[Dict]:
+        return self.get_settings().get('pipeline', None)
+
+    def get_saturation(self) -> Dict:
+        return self.get_settings().get('saturation', {})
+
+    def get_chain(self) -> Optional[Dict]:
+        return self.get_settings().get('chain', None)
+
+    def get_balances(self) -> Optional[Dict]:
+        return self.get_settings().get('balances', None)
+
+    def get_wallets(self) -> Dict:
+        return self.get_settings().get('wallets', {})
+
+    def get_readiness(self) -> Dict:
+        return self.get_settings().get('readiness', {})
+
+    def get_node_pool(self) -> Dict:
+        return self.get_settings().get('node_pool', {})
+
+    def get_logs(self) -> Dict:
+        return self.get_settings().get('logs', {})
+
+    def get_metrics(self) -> Optional[Dict]:
+        return self.get_settings().get('metrics', None)
+
+    def get_scheduler(self) -> Optional[Dict]:
+        return self.get_settings().get('scheduler', None)
+
     def get_nodes(self) -> List[str]:
         return self.data['nodes']
 
+    def get_workload(self) -> Optional[Dict]:
+        return self.data.get('workload', None)
+
     def get_tasks(self) -> List[Dict[str, Union[str, int]]]:
         return self.data['tasks']
@@ -5,6 +5,8 @@ INVALID_TRANSACTION_EXECUTION_OUTPUT = 'Error trying to apply a transaction'
 ACCOUNT_FORMAT = 'lt-account'
 TOKENS = ['NAM', 'DOT', 'ETH', 'BTC']
 TOKEN_PROBABILITIES = [70, 10, 10, 10]
+# larger bonds, e.g. the self-bonds of the validators, are never unbonded
+MAX_UNBOND_AMOUNT = 50000
 LOCAL_LEDGER_ADDRESS = "127.0.0.1:27657"
 NOT_ENOUGH_BALANCE = "doesn't have enough balance"
 SKIPPING_KEY = "Skipping a value for key"
\ No newline at end of file
@@ -1,53 +1,76 @@
 import json
 import logging
-from dataclasses import dataclass
-from multiprocessing import Queue
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from threading import Thread
-from time import sleep
-from typing import List
-
-import requests
+from queue import Queue, Empty
+from threading import Thread, Lock
+from typing import List, Dict, Optional, Tuple, Callable
 
+from src.chain_analyzer import ChainAnalyzer, format_chain_summary
 from src.config import Config
-from src.constants import STATUS_ENDPOINT
+from src.histogram import merge_latencies, summarize_latencies, format_latencies
 from src.manager import Manager, ManagerResult
+from src.metrics import LiveMetrics
+from src.node_pool import NodePool
+from src.readiness import Readiness
+from src.saturation import SaturationSearch, format_report
 from src.store import connect
+from src.wallets import Wallets
 
 
 @dataclass
 class Coordinator:
 
     @staticmethod
-    def run(config: Config, seeds: List[str], nodes: List[str], base_directory: str, base_binary: str, fail_fast: bool, json_output: bool):
-        Path("db.db").unlink(missing_ok=True)
-        connect()
+    def run(config: Config, seeds: List[str], nodes: List[str], base_directory: str, base_binary: str, fail_fast: bool,
+            json_output: bool, processes: bool = False, resume: bool = False, corpus_mode: Optional[str] = None,
+            replay_rate: str = 'full', saturation: bool = False):
+        nodes = Readiness.from_config(nodes, config.get_readiness()).wait()
+
+        if saturation:
+            if processes or corpus_mode is not None:
+                raise Exception("The saturation search runs the seeds as threads, without a corpus.")
+            Coordinator._run_saturation(config, seeds, nodes, base_directory, base_binary, json_output, resume)
+            return
+
+        analyzer = None
+        if config.get_chain() is not None and corpus_mode != 'generate':
+            analyzer = ChainAnalyzer.from_config(nodes, config.get_chain())
+            start_height = analyzer.height()
+
+        modes = (resume, corpus_mode, replay_rate)
+        if processes:
+            results = Coordinator._run_processes(config, seeds, nodes, base_directory, base_binary, fail_fast, modes)
+        else:
+            results = Coordinator._run_threads(config, seeds, nodes, base_directory, base_binary, fail_fast, modes)
+
+        # generating a corpus sends nothing, there are no stats to report
+        if corpus_mode != 'generate':
+            Coordinator._dump_stats(results, json_output)
+        if analyzer is not None:
+            Coordinator._dump_chain(analyzer, start_height, results, json_output)
+
+    @staticmethod
+    def _run_threads(config: Config, seeds: List[str], nodes: List[str], base_directory: str, base_binary: str,
+                     fail_fast: bool, modes: Tuple[bool, Optional[str], str]) -> List[ManagerResult]:
+        managers, node_pool, wallets = Coordinator._init_managers(config, seeds, nodes, base_directory, base_binary,
+                                                                  modes)
 
         managers_queue = Queue()
-        managers = [Manager('manager:{}'.format(seed), config, int(seed)) for seed in set(seeds)]
         threads = [
-            Thread(target=Coordinator._run_manager, args=(manager, base_directory, nodes, fail_fast, managers_queue))
+            Thread(target=Coordinator._run_manager, args=(manager, wallets.base_directory(manager.seed), nodes,
+                                                          fail_fast, managers_queue))
             for manager in managers
         ]
 
-        # waiting for nodes to be synced
-        waiting_sync_node = [True for _ in nodes]
-        while any(waiting_sync_node):
-            for index, node in enumerate(nodes):
-                node_status = requests.get("http://{}/{}".format(node, STATUS_ENDPOINT), timeout=5)
-                body = node_status.json()
-                if 'result' in body:
-                    is_catching_up = node_status.json()['result']['sync_info']['catching_up']
-                else:
-                    is_catching_up = node_status.json()['sync_info']['catching_up']
-                logging.info("Node {} is caught up: {}".format(node, not is_catching_up))
-                waiting_sync_node[index] = is_catching_up
-            sleep(3)
-
-        for manager in managers:
-            manager.run_init_task(base_directory, base_binary, nodes)
-
         logging.info("coordinator - Starting load testing with {}...".format(', '.join(seeds)))
+        metrics = Coordinator._start_metrics(config, nodes,
+                                             lambda: [manager.current_result() for manager in managers])
 
         for t in threads:
             t.start()
@@ -55,9 +78,100 @@ class Coordinator:
         for t in threads:
             t.join()
 
+        if metrics is not None:
+            metrics.stop()
+        node_pool.stop()
+
         logging.info("coordinator - Done load testing!")
 
-        Coordinator._dump_stats(managers_queue, json_output)
+        return [managers_queue.get() for _ in range(managers_queue.qsize())]
+
+    @staticmethod
+    def _init_managers(config: Config, seeds: List[str], nodes: List[str], base_directory: str, base_binary: str,
+                       modes: Tuple[bool, Optional[str], str]) -> Tuple[List[Manager], NodePool, Wallets]:
+        Path("db.db").unlink(missing_ok=True)
+        connect()
+
+        managers = [Manager('manager:{}'.format(seed), config, int(seed), *modes) for seed in set(seeds)]
+        node_pool = Coordinator._start_node_pool(config, nodes)
+        for manager in managers:
+            manager.node_pool = node_pool
+        wallets = Wallets.from_config(base_directory, config.get_wallets())
+
+        if wallets.isolated:
+            # every seed has its own wallet, the Inits don't contend on a wallet file lock
+            with ThreadPoolExecutor(max_workers=len(managers), thread_name_prefix='init') as executor:
+                list(executor.map(lambda manager: manager.run_init_task(wallets.prepare(manager.seed), base_binary,
+                                                                        nodes), managers))
+        else:
+            for manager in managers:
+                manager.run_init_task(base_directory, base_binary, nodes)
+        return managers, node_pool, wallets
+
+    @staticmethod
+    def _run_saturation(config: Config, seeds: List[str], nodes: List[str], base_directory: str, base_binary: str,
+                        json_output: bool, resume: bool):
+        search = SaturationSearch.from_config(config.get_saturation())
+        managers, node_pool, wallets = Coordinator._init_managers(config, seeds, nodes, base_directory, base_binary,
+                                                                  (resume, None, 'full'))
+        for manager in managers:
+            manager.start()
+        try:
+            rate = search.next_rate()
+            while rate is not None:
+                logging.info("coordinator - Probing {} tx/s for {}s...".format(round(rate, 3), search.step_duration))
+                probe = Coordinator._run_probe(managers, wallets, nodes, search, rate)
+                search.record(probe)
+                logging.info("coordinator - {} tx/s offered, {} tx/s sent, success rate {}, p99 {}ms: {}".format(
+                    probe.rate, probe.achieved_rate, probe.success_rate, probe.p99_ms,
+                    ', '.join(probe.violations) or 'within the SLOs'))
+                rate = search.next_rate()
+        finally:
+            for manager in managers:
+                manager.stop()
+            node_pool.stop()
+
+        report = search.report()
+        if json_output:
+            with open('result_saturation.json', "w") as f:
+                f.write(json.dumps(report, sort_keys=True, indent=4))
+        else:
+            print("Saturation search:")
+            for line in format_report(report):
+                print(line)
+
+    @staticmethod
+    def _run_probe(managers: List[Manager], wallets: Wallets, nodes: List[str], search: SaturationSearch,
+                   rate: float):
+        scheduler = search.scheduler(rate, len(managers))
+        threads = [Thread(target=manager.run_load, args=(wallets.base_directory(manager.seed), nodes, False,
+                                                         scheduler)) for manager in managers]
+        for t in threads:
+            t.start()
+        # the counters at the end of the settle time are the baseline of the probe
+        time.sleep(search.settle)
+        window_start = time.time()
+        before = [manager.current_result() for manager in managers]
+        for t in threads:
+            t.join()
+        return search.measure(rate, window_start, before, [manager.current_result() for manager in managers])
+
+    @staticmethod
+    def _start_node_pool(config: Config, nodes: List[str]) -> NodePool:
+        node_pool = NodePool.from_config(nodes, config.get_node_pool())
+        node_pool.start()
+        return node_pool
+
+    @staticmethod
+    def _start_metrics(config: Config, nodes: List[str],
+                       collect: Callable[[], List[ManagerResult]]) -> Optional[LiveMetrics]:
+        if config.get_metrics() is None:
+            return None
+        metrics = LiveMetrics.from_config(config.get_metrics(), collect)
+        if config.get_chain() is not None:
+            metrics.analyzer = ChainAnalyzer.from_config(nodes, config.get_chain())
+        metrics.start()
+        return metrics
 
     @staticmethod
     def _run_manager(manager: Manager, base_directory: str, nodes: List[str], fail_fast: bool, queue: Queue):
@@ -65,9 +179,98 @@ class Coordinator:
         queue.put(result)
 
     @staticmethod
-    def _dump_stats(queue: Queue, json_output):
-        while not queue.empty():
-            result: ManagerResult = queue.get()
+    def _run_processes(config: Config, seeds: List[str], nodes: List[str], base_directory: str, base_binary: str,
+                       fail_fast: bool, modes: Tuple[bool, Optional[str], str]) -> List[ManagerResult]:
+        # spawn, so that workers don't inherit the coordinator's sqlite connection or logging handlers
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        init_lock = context.Lock()
+        processes = {
+            int(seed): context.Process(target=Coordinator._run_manager_process, name='manager:{}'.format(seed),
+                                       args=(config, int(seed), base_directory, base_binary, nodes, fail_fast,
+                                             modes, init_lock, queue))
+            for seed in set(seeds)
+        }
+
+        logging.info("coordinator - Starting load testing with {} worker processes...".format(len(processes)))
+
+        for process in processes.values():
+            process.start()
+
+        # last result reported by each worker, sampled by the live metrics
+        latest: Dict[int, ManagerResult] = {}
+        latest_lock = Lock()
+
+        def collect() -> List[ManagerResult]:
+            with latest_lock:
+                return list(latest.values())
+
+        metrics = Coordinator._start_metrics(config, nodes, collect)
+
+        results: Dict[int, ManagerResult] = {}
+        finished = set()
+        while len(finished) < len(processes):
+            try:
+                kind, seed, payload = queue.get(timeout=1)
+            except Empty:
+                for seed, process in processes.items():
+                    if seed not in finished and not process.is_alive() and queue.empty():
+                        logging.error("coordinator - manager:{} exited with code {}".format(seed, process.exitcode))
+                        finished.add(seed)
+                continue
+
+            if kind in ['progress', 'result']:
+                with latest_lock:
+                    latest[seed] = payload
+            if kind == 'progress':
+                total_tx = sum([sum(task_stats.values()) for task_stats in payload.stats.values()])
+                logging.info("coordinator - manager:{} progress: {} txs".format(seed, total_tx))
+            elif kind == 'result':
+                results[seed] = payload
+                finished.add(seed)
+            elif kind == 'error':
+                logging.error("coordinator - manager:{} failed: {}".format(seed, payload))
+                finished.add(seed)
+
+        for process in processes.values():
+            process.join()
+
+        if metrics is not None:
+            metrics.stop()
+
+        logging.info("coordinator - Done load testing!")
+
+        return list(results.values())
+
+    @staticmethod
+    def _run_manager_process(config: Config, seed: int, base_directory: str, base_binary: str, nodes: List[str],
+                             fail_fast: bool, modes: Tuple[bool, Optional[str], str], init_lock, queue):
+        logging.basicConfig(level=os.environ.get('LOGLEVEL', 'INFO').upper())
+
+        try:
+            # each worker owns its store, so workers never contend on the same sqlite file
+            database = 'db_{}.db'.format(seed)
+            Path(database).unlink(missing_ok=True)
+            connect(database)
+
+            manager = Manager('manager:{}'.format(seed), config, seed, *modes)
+            manager.progress_callback = lambda result: queue.put(('progress', seed, result))
+            manager.node_pool = Coordinator._start_node_pool(config, nodes)
+
+            wallets = Wallets.from_config(base_directory, config.get_wallets())
+            seed_directory = wallets.prepare(seed)
+            # workaround cause of namada wallet bug with file_lock, only needed while the seeds share one wallet
+            with nullcontext() if wallets.isolated else init_lock:
+                manager.run_init_task(seed_directory, base_binary, nodes)
+
+            queue.put(('result', seed, manager.run(seed_directory, nodes, fail_fast)))
+        except Exception as e:
+            logging.exception("manager:{} - Worker crashed".format(seed))
+            queue.put(('error', seed, str(e)))
+
+    @staticmethod
+    def _dump_stats(results: List[ManagerResult], json_output):
+        for result in results:
             if json_output:
                 json_result = result.to_json()
                 with open('result_{}.json'.format(json_result['seed']), "w") as f:
@@ -76,3 +279,37 @@ class Coordinator:
                 result.print()
                 print("---------------------------")
 
+        # percentiles can't be averaged, the histograms of every seed are merged instead
+        latencies = merge_latencies([result.latencies for result in results])
+        if json_output:
+            with open('result_latencies.json', "w") as f:
+                f.write(json.dumps(summarize_latencies(latencies), sort_keys=True, indent=4))
+        else:
+            print("All seeds latencies:")
+            for line in format_latencies(latencies):
+                print(line)
+
+    @staticmethod
+    def _dump_chain(analyzer: ChainAnalyzer, start_height: int, results: List[ManagerResult], json_output: bool):
+        sent: Dict[int, int] = {}
+        for result in results:
+            for second, count in result.sent.items():
+                sent[second] = sent.get(second, 0) + count
+        try:
+            blocks = analyzer.collect(start_height + 1, analyzer.height())
+        except Exception as e:
+            logging.warning("coordinator - Can't analyze the chain: {}".format(e))
+            return
+        if sent:
+            # the blocks of the Init txs aren't part of the load
+            blocks = [block for block in blocks if block.time >= min(sent.keys())]
+
+        summary = analyzer.summary(blocks, sent)
+        if json_output:
+            with open('result_chain.json', "w") as f:
+                f.write(json.dumps({'summary': summary, 'timeline': analyzer.timeline(blocks, sent),
+                                    'blocks': [asdict(block) for block in blocks]}, sort_keys=True, indent=4))
+        else:
+            print("Chain:")
+            for line in format_chain_summary(summary):
+                print(line)
@@ -0,0 +1,48 @@
+import json
+import os
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional
+
+CORPUS_PATH = 'corpus/{}.jsonl'
+REPLAY_RATES = ['full', 'recorded']
+
+
+@dataclass
+class CorpusEntry:
+    index: int
+    offset: float
+    task_name: str
+    node: str
+    command: List[str]
+    # files the command reads (path -> content), e.g. proposal json
+    files: Dict[str, str] = field(default_factory=dict)
+
+    def serialize(self) -> str:
+        # sorted keys and no whitespace variation, the same corpus always replays the same bytes
+        return json.dumps(asdict(self), sort_keys=True, separators=(',', ':'))
+
+
+@dataclass
+class Corpus:
+    seed: int
+    entries: List[CorpusEntry] = field(default_factory=list)
+
+    @staticmethod
+    def load(seed: int) -> Optional['Corpus']:
+        file_path = CORPUS_PATH.format(seed)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r") as f:
+            return Corpus(seed, [CorpusEntry(**json.loads(line)) for line in f if line.strip()])
+
+    def add(self, entry: CorpusEntry):
+        self.entries.append(entry)
+
+    def dump(self) -> str:
+        file_path = CORPUS_PATH.format(self.seed)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path + '.tmp', "w") as f:
+            for entry in self.entries:
+                f.write(entry.serialize() + '\n')
+        os.replace(file_path + '.tmp', file_path)
+        return file_path
@@ -0,0 +1,59 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Callable, Optional
+
+from src.node_pool import NodePool
+
+
+@dataclass
+class EpochTracker:
+    query: Callable[[str], int]
+    node_pool: NodePool
+    refresh_interval: float = 5
+    max_staleness: float = 10
+    epoch: Optional[int] = field(init=False, default=None)
+    updated_at: float = field(init=False, default=0.0)
+    queries: int = field(init=False, default=0)
+    lock: Lock = field(init=False, default_factory=Lock)
+    stopped: Event = field(init=False, default_factory=Event)
+
+    def start(self):
+        # a node down at startup only leaves the cache empty, tasks query the epoch themselves until a refresh works
+        self._try_refresh()
+        Thread(target=self._refresh_loop, name='epoch-tracker', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get(self) -> Optional[int]:
+        # None means the cached epoch is too old to be trusted, callers query the node themselves
+        with self.lock:
+            if self.epoch is None or time.monotonic() - self.updated_at > self.max_staleness:
+                return None
+            return self.epoch
+
+    def observe(self, epoch: Optional[int]):
+        if epoch is None:
+            return
+        with self.lock:
+            # epochs only move forward, an older value means a lagging node
+            if self.epoch is None or epoch >= self.epoch:
+                self.epoch = epoch
+                self.updated_at = time.monotonic()
+
+    def refresh(self):
+        # through the pool, nodes it ejected or readiness dropped aren't queried
+        self.queries += 1
+        self.observe(self.query(self.node_pool.pick()))
+
+    def _try_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.warning("epoch-tracker - Can't refresh epoch: {}".format(e))
+
+    def _refresh_loop(self):
+        while not self.stopped.wait(self.refresh_interval):
+            self._try_refresh()
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import random
+import sys
+import time
+from string import Template
+from typing import Dict, List, Optional, Tuple
+
+# A stand-in for the namada binary, answering the commands of the load tester from output templates so the harness
+# can be profiled without a chain. Point --base-binary at bin/fake-namada, it is configured through the environment:
+#   FAKE_NAMADA_QUERY_LATENCY / FAKE_NAMADA_TX_LATENCY  latency distribution in seconds, see sample_latency
+#   FAKE_NAMADA_FAILURE_RATE                            share of txs answered 'Transaction is invalid.'
+#   FAKE_NAMADA_ERROR_RATE                              share of commands failing on stderr
+#   FAKE_NAMADA_EPOCH_LENGTH                            seconds per epoch
+#   FAKE_NAMADA_FIXTURES                                directory of recorded outputs overriding FIXTURES
+
+STATE_DIRECTORY = 'fake-namada'
+TOKENS = ['NAM', 'DOT', 'ETH', 'BTC']
+
+# $-placeholders are filled per command, recorded outputs replace these as <name>.txt
+FIXTURES: Dict[str, str] = {
+    'address_list': "Known addresses:\n",
+    'address_entry': '  "${alias}": Established: ${address}\n',
+    'gen_key': "Successfully added a key and an address with alias: \"${alias}\"\n",
+    'init_account': "Transaction is valid.\nTransaction hash: ${hash}\nAdded alias ${alias} for address ${address}.\n",
+    'epoch': "Last committed epoch: ${epoch}\n",
+    'bonded_stake': "Last committed epoch: ${epoch}\nConsensus validators:\n"
+                    "  atest1v4ehgw36x3prswzxggunzv6pxqmnvdj9xvcyzvpsggeyvs3cg9qnywf589qnwvfsg5erg3fkl09rg5:"
+                    " 1000000\nTotal bonded stake: 1000000\n",
+    'bonds': "Last committed epoch: ${epoch}\n\n",
+    'balance': "Last committed epoch: ${epoch}\n" + ''.join(["Token {}\n  Balance owned by ${{owner}}: 1000000\n".format(
+        token) for token in TOKENS]),
+    'proposals': "Last committed epoch: ${epoch}\nProposals:\n\n",
+    'tx_valid': "Transaction is valid.\nTransaction hash: ${hash}\nGas used: 24\nLast committed epoch: ${epoch}\n",
+    'tx_invalid': "Transaction is invalid.\nTransaction hash: ${hash}\n",
+    'tx_dumped': "Transaction serialized to ${path}.\n",
+    'unbond': "Transaction is valid.\nTransaction hash: ${hash}\nGas used: 24\nLast committed epoch: ${epoch}\n"
+              "Amount ${amount} withdrawable starting from epoch ${withdraw_epoch}.\n",
+    'error': "Error: fake-namada failure\n",
+}
+TX_COMMANDS = ['transfer', 'bond', 'unbond', 'withdraw', 'init-proposal', 'vote-proposal']
+QUERY_COMMANDS = {'epoch': 'epoch', 'bonded-stake': 'bonded_stake', 'bonds': 'bonds', 'balance': 'balance',
+                  'query-proposal': 'proposals'}
+
+
+def sample_latency(spec: str) -> float:
+    # const:<s> | uniform:<low>:<high> | normal:<mean>:<stddev> | lognormal:<mu>:<sigma> | exp:<mean>
+    kind, *values = spec.split(':')
+    values = [float(value) for value in values]
+    if kind == 'uniform':
+        return random.uniform(values[0], values[1])
+    elif kind == 'normal':
+        return max(random.gauss(values[0], values[1]), 0)
+    elif kind == 'lognormal':
+        return random.lognormvariate(values[0], values[1])
+    elif kind == 'exp':
+        return random.expovariate(1 / values[0])
+    return values[0] if values else float(kind)
+
+
+def load_fixture(name: str) -> Template:
+    directory = os.environ.get('FAKE_NAMADA_FIXTURES')
+    if directory and os.path.exists(os.path.join(directory, '{}.txt'.format(name))):
+        with open(os.path.join(directory, '{}.txt'.format(name)), 'r') as f:
+            return Template(f.read())
+    return Template(FIXTURES[name])
+
+
+def address_of(alias: str) -> str:
+    return 'atest1' + hashlib.sha256(alias.encode()).hexdigest()[:74]
+
+
+def option(args: List[str], name: str, default: Optional[str] = None) -> Optional[str]:
+    return args[args.index(name) + 1] if name in args else default
+
+
+class FakeNamada:
+    def __init__(self, base_directory: str):
+        self.directory = os.path.join(base_directory, STATE_DIRECTORY)
+        os.makedirs(self.directory, exist_ok=True)
+        self.epoch_length = float(os.environ.get('FAKE_NAMADA_EPOCH_LENGTH', '60'))
+
+    def current_epoch(self) -> int:
+        # every process of the run agrees on the epoch through the genesis time kept with the wallet
+        path = os.path.join(self.directory, 'genesis')
+        try:
+            with open(path, 'x') as f:
+                f.write(str(time.time()))
+        except FileExistsError:
+            pass
+        with open(path, 'r') as f:
+            genesis = float(f.read() or time.time())
+        return int((time.time() - genesis) / self.epoch_length)
+
+    def accounts(self) -> List[str]:
+        path = os.path.join(self.directory, 'wallet')
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def add_account(self, alias: str):
+        # a single small append is atomic, concurrent init-accounts don't need a lock
+        with open(os.path.join(self.directory, 'wallet'), 'a') as f:
+            f.write(alias + '\n')
+
+    def handle(self, args: List[str]) -> Tuple[int, str, str]:
+        command = ' '.join(args)
+        is_tx = any(' {} '.format(tx_command) in ' {} '.format(command) for tx_command in TX_COMMANDS) \
+            or 'init-account' in args
+        time.sleep(sample_latency(os.environ.get('FAKE_NAMADA_TX_LATENCY' if is_tx else 'FAKE_NAMADA_QUERY_LATENCY',
+                                                 '0')))
+        if random.random() < float(os.environ.get('FAKE_NAMADA_ERROR_RATE', '0')):
+            return 1, '', load_fixture('error').safe_substitute()
+
+        values = {'epoch': self.current_epoch(),
+                  'hash': hashlib.sha256('{}{}'.format(command, random.random()).encode()).hexdigest().upper()}
+        if 'address' in args and 'list' in args:
+            entry = load_fixture('address_entry')
+            return 0, load_fixture('address_list').safe_substitute(values) + ''.join([
+                entry.safe_substitute(alias=alias, address=address_of(alias)) for alias in self.accounts()]), ''
+        if 'key' in args and 'gen' in args:
+            return 0, load_fixture('gen_key').safe_substitute(alias=option(args, '--alias')), ''
+        if 'init-account' in args:
+            alias = option(args, '--alias')
+            self.add_account(alias)
+            return 0, load_fixture('init_account').safe_substitute(values, alias=alias, address=address_of(alias)), ''
+        for query, fixture in QUERY_COMMANDS.items():
+            if query in args:
+                return 0, load_fixture(fixture).safe_substitute(values, owner=option(args, '--owner', '')), ''
+        if '--dump-tx' in args:
+            # a stand-in for the signed tx, unique so the mempool of src.mock_rpc accepts each one once
+            tx = '{} {}'.format(command, random.random()).encode()
+            path = os.path.join(option(args, '--output-folder-path', '.'),
+                                '{}.tx'.format(hashlib.sha256(tx).hexdigest().upper()))
+            with open(path, 'wb') as f:
+                f.write(tx)
+            return 0, load_fixture('tx_dumped').safe_substitute(values, path=path), ''
+        if random.random() < float(os.environ.get('FAKE_NAMADA_FAILURE_RATE', '0')):
+            return 0, load_fixture('tx_invalid').safe_substitute(values), ''
+        if 'unbond' in args:
+            return 0, load_fixture('unbond').safe_substitute(values, amount=option(args, '--amount', '0'),
+                                                             withdraw_epoch=values['epoch'] + 2), ''
+        return 0, load_fixture('tx_valid').safe_substitute(values), ''
+
+
+def main(argv: List[str]) -> int:
+    base_directory = option(argv, '--base-dir', '.')
+    args = [arg for index, arg in enumerate(argv)
+            if arg != '--base-dir' and (index == 0 or argv[index - 1] != '--base-dir')]
+    code, stdout, stderr = FakeNamada(base_directory).handle(args)
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
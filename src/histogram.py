@@ -0,0 +1,99 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# like HdrHistogram: values keep 3 significant digits, so the relative error stays under 0.1% at any magnitude
+SIGNIFICANT_DIGITS = 3
+PERCENTILES = [50, 90, 99, 99.9]
+PHASES = ['total', 'spawn', 'epoch', 'submit', 'inclusion', 'submit_to_mempool', 'mempool_to_block', 'submit_to_block']
+
+
+def _bucket(value_us: int) -> int:
+    if value_us < 10 ** SIGNIFICANT_DIGITS:
+        return value_us
+    scale = 10 ** (len(str(value_us)) - SIGNIFICANT_DIGITS)
+    return value_us // scale * scale
+
+
+@dataclass
+class Histogram:
+    # bucket lower bound in microseconds -> count
+    counts: Dict[int, int] = field(default_factory=dict)
+    total: int = 0
+    max_us: int = 0
+
+    def record(self, seconds: float):
+        value_us = max(int(seconds * 1000000), 0)
+        bucket = _bucket(value_us)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other: 'Histogram'):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.max_us = max(self.max_us, other.max_us)
+
+    def subtract(self, previous: 'Histogram') -> 'Histogram':
+        # values recorded since the previous copy of this histogram was taken
+        counts = {bucket: count - previous.counts.get(bucket, 0) for bucket, count in self.counts.items()
+                  if count > previous.counts.get(bucket, 0)}
+        if self.max_us > previous.max_us or not counts:
+            max_us = self.max_us if counts else 0
+        else:
+            max_us = max(counts.keys())
+        return Histogram(counts, self.total - previous.total, max_us)
+
+    def copy(self) -> 'Histogram':
+        return Histogram(dict(self.counts), self.total, self.max_us)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if self.total == 0:
+            return None
+        rank = percentile * self.total / 100
+        seen = 0
+        for bucket in sorted(self.counts.keys()):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket / 1000
+        return self.max_us / 1000
+
+    def summary(self) -> Dict[str, float]:
+        # milliseconds
+        summary = {'count': self.total, 'max': self.max_us / 1000}
+        for percentile in PERCENTILES:
+            summary['p{}'.format(percentile)] = self.percentile(percentile)
+        return summary
+
+
+Latencies = Dict[str, Dict[str, Histogram]]
+
+
+def copy_latencies(latencies: Latencies) -> Latencies:
+    return {task_name: {phase: histogram.copy() for phase, histogram in phases.items()}
+            for task_name, phases in latencies.items()}
+
+
+def merge_latencies(all_latencies: List[Latencies]) -> Latencies:
+    merged: Latencies = {}
+    for latencies in all_latencies:
+        for task_name, phases in latencies.items():
+            for phase, histogram in phases.items():
+                merged.setdefault(task_name, {}).setdefault(phase, Histogram()).merge(histogram)
+    return merged
+
+
+def summarize_latencies(latencies: Latencies) -> Dict[str, Dict[str, Dict[str, float]]]:
+    return {task_name: {phase: histogram.summary() for phase, histogram in phases.items()}
+            for task_name, phases in latencies.items()}
+
+
+def format_latencies(latencies: Latencies) -> List[str]:
+    lines = []
+    for task_name, phases in latencies.items():
+        for phase in [phase for phase in PHASES if phase in phases]:
+            summary = phases[phase].summary()
+            lines.append("- {0} - {1} latency (ms): {2}, max {3} ({4} txs)".format(
+                task_name, phase, ', '.join(['p{} {}'.format(percentile, summary['p{}'.format(percentile)])
+                                             for percentile in PERCENTILES]), summary['max'], summary['count']))
+    return lines
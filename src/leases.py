@@ -0,0 +1,115 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from threading import Condition
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+EXHAUSTED_POLICIES = ['skip', 'wait']
+
+T = TypeVar('T')
+
+
+class LeasesExhausted(Exception):
+    # raised instead of blocking when the caller can't wait on a thread condition (asyncio engine), see wait_async
+    def __init__(self, releases: int):
+        super().__init__()
+        # releases seen when every signer was busy
+        self.releases = releases
+
+
+@dataclass
+class AccountLeases:
+    # in-flight txs per signer, two txs signed by the same account at once would collide on chain
+    limit: int = 1
+    on_exhausted: str = 'skip'
+    wait_timeout: float = 5
+    # random picks tried before the eligible accounts are considered exhausted
+    attempts: int = 8
+    # False on the asyncio engine, the caller awaits a release on LeasesExhausted without blocking the event loop
+    blocking: bool = field(init=False, default=True)
+    leased: Dict[str, int] = field(init=False, default_factory=dict)
+    condition: Condition = field(init=False, default_factory=Condition)
+    releases: int = field(init=False, default=0)
+    # futures of the coroutines waiting for a release, with their event loop
+    waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = field(init=False, default_factory=list)
+    checkouts: int = field(init=False, default=0)
+    contended: int = field(init=False, default=0)
+    exhausted: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        if self.on_exhausted not in EXHAUSTED_POLICIES:
+            raise Exception("Unknown leases on_exhausted {}, expected one of {}.".format(
+                self.on_exhausted, ', '.join(EXHAUSTED_POLICIES)))
+        if self.limit <= 0:
+            raise Exception("Leases limit must be positive.")
+
+    @staticmethod
+    def from_config(data: Dict[str, Union[str, int, float]]) -> 'AccountLeases':
+        return AccountLeases(
+            limit=int(data.get('limit', 1)),
+            on_exhausted=data.get('on_exhausted', 'skip'),
+            wait_timeout=float(data.get('wait_timeout', 5)),
+            attempts=int(data.get('attempts', 8))
+        )
+
+    def checkout(self, pick: Callable[[], Optional[T]], key: Callable[[T], str]) -> Tuple[Optional[T], List[str]]:
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            for _ in range(self.attempts):
+                # the store is queried outside of the lock, only the lease itself is serialized
+                record = pick()
+                if record is None:
+                    return None, []
+                lease_key = key(record)
+                with self.condition:
+                    if self.leased.get(lease_key, 0) < self.limit:
+                        self.leased[lease_key] = self.leased.get(lease_key, 0) + 1
+                        self.checkouts += 1
+                        return record, [lease_key]
+                    self.contended += 1
+
+            with self.condition:
+                remaining = deadline - time.monotonic()
+                if self.on_exhausted == 'skip' or remaining <= 0:
+                    self.exhausted += 1
+                    return None, []
+                if not self.blocking:
+                    raise LeasesExhausted(self.releases)
+                self.condition.wait(remaining)
+
+    def release(self, lease_keys: List[str]):
+        if not lease_keys:
+            return
+        with self.condition:
+            for lease_key in lease_keys:
+                self.leased[lease_key] -= 1
+                if self.leased[lease_key] <= 0:
+                    del self.leased[lease_key]
+            self.releases += 1
+            self.condition.notify_all()
+            # one waiting coroutine per signer given back, the oldest first, instead of all of them picking again
+            woken, self.waiters = self.waiters[:len(lease_keys)], self.waiters[len(lease_keys):]
+            for loop, waiter in woken:
+                loop.call_soon_threadsafe(_wake, waiter)
+
+    async def wait_async(self, releases: int, timeout: float) -> bool:
+        # False when no signer was given back in time, counted as exhausted
+        waiter = asyncio.get_running_loop().create_future()
+        with self.condition:
+            if self.releases != releases:
+                # given back between the failed checkout and now
+                return True
+            self.waiters.append((asyncio.get_running_loop(), waiter))
+        try:
+            await asyncio.wait_for(waiter, max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            with self.condition:
+                self.waiters = [(loop, other) for loop, other in self.waiters if other is not waiter]
+                self.exhausted += 1
+            return False
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
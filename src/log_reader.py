@@ -0,0 +1,53 @@
+import argparse
+import gzip
+import json
+from typing import Dict, Iterator, List, Optional
+
+from src.log_sink import list_segments
+
+
+def read_results(seed: int, directory: str = 'logs') -> Iterator[Dict]:
+    for path in list_segments(seed, directory):
+        with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path, 'r')) as f:
+            for line in f:
+                # the last line of a segment may be cut short if the run was killed
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def query(seed: int, directory: str = 'logs', outcomes: Optional[List[str]] = None,
+          task_names: Optional[List[str]] = None, contains: Optional[str] = None) -> Iterator[Dict]:
+    for record in read_results(seed, directory):
+        if outcomes and record.get('outcome') not in outcomes:
+            continue
+        if task_names and record.get('task_name') not in task_names:
+            continue
+        if contains and contains not in record.get('stdout', '') and contains not in record.get('stderr', ''):
+            continue
+        yield record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the transaction logs of a load test run.')
+    parser.add_argument("-s", "--seed", type=int, action='store', required=True, help='Seed of the run.')
+    parser.add_argument("-d", "--directory", type=str, action='store', default='logs', help='Logs directory.')
+    parser.add_argument("-f", "--failed", action='store_true', default=False, help='Only failed transactions.')
+    parser.add_argument("-o", "--outcomes", nargs='*', action='store', default=None,
+                        help='Space separated list of outcomes (succeeded, failed, skipped).')
+    parser.add_argument("-t", "--tasks", nargs='*', action='store', default=None,
+                        help='Space separated list of task types.')
+    parser.add_argument("-g", "--contains", type=str, action='store', default=None,
+                        help='Only transactions whose stdout or stderr contains this text.')
+    parser.add_argument("-c", "--count", action='store_true', default=False, help='Only print the count.')
+    args = parser.parse_args()
+
+    outcomes = ['failed'] if args.failed else args.outcomes
+    total = 0
+    for record in query(args.seed, args.directory, outcomes, args.tasks, args.contains):
+        total += 1
+        if not args.count:
+            print(json.dumps(record, sort_keys=True))
+    if args.count:
+        print(total)
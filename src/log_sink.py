@@ -0,0 +1,113 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from queue import Queue, Empty
+from threading import Thread, Lock
+from typing import Dict, IO, List, Optional
+
+from src.task import TaskResult
+
+LOGS_DIRECTORY = 'logs/{}'
+SEGMENT_NAME = 'segment-{:06d}.jsonl'
+LOG_FORMATS = ['segments', 'files']
+
+
+def outcome(task_result: TaskResult) -> str:
+    if task_result.is_skipped():
+        return 'skipped'
+    return 'failed' if task_result.is_error() else 'succeeded'
+
+
+def list_segments(seed: int, directory: str = 'logs') -> List[str]:
+    seed_directory = os.path.join(directory, str(seed))
+    if not os.path.isdir(seed_directory):
+        return []
+    return [os.path.join(seed_directory, file_name) for file_name in sorted(os.listdir(seed_directory))
+            if file_name.startswith('segment-')]
+
+
+@dataclass
+class LogSink:
+    # one background writer per manager: results are appended to rotating jsonl segments instead of a file per tx
+    seed: int
+    segment_size: int = 64 * 1024 * 1024
+    compress: bool = False
+    queue_size: int = 10000
+    batch_size: int = 500
+    queue: Queue = field(init=False)
+    segment_index: int = field(init=False, default=0)
+    segment_bytes: int = field(init=False, default=0)
+    segment: Optional[IO] = field(init=False, default=None)
+    writer: Thread = field(init=False)
+    closed: bool = field(init=False, default=False)
+    close_lock: Lock = field(init=False, default_factory=Lock)
+
+    def __post_init__(self):
+        # bounded, a slow disk slows the producers down instead of growing the memory without limit
+        self.queue = Queue(maxsize=self.queue_size)
+        os.makedirs(LOGS_DIRECTORY.format(self.seed), exist_ok=True)
+        # resumed runs keep the previous segments and continue after the last one
+        self.segment_index = len(list_segments(self.seed))
+        self.writer = Thread(target=self._write_loop, name='log-sink:{}'.format(self.seed), daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def from_config(seed: int, data: Dict) -> 'LogSink':
+        return LogSink(seed, int(float(data.get('segment_size', 64)) * 1024 * 1024), data.get('compress', False),
+                       data.get('queue_size', 10000))
+
+    def write(self, task_result: TaskResult):
+        record = task_result.serialize()
+        record['outcome'] = outcome(task_result)
+        record['time_elapsed'] = task_result.time_elapsed
+        self.queue.put(record)
+
+    def close(self):
+        with self.close_lock:
+            if self.closed:
+                return
+            self.closed = True
+        # the sentinel is queued after every pending record, joining the writer flushes them all
+        self.queue.put(None)
+        self.writer.join()
+
+    def _write_loop(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = batch[:batch.index(None)]
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logging.error("log-sink:{} - Can't write {} results: {}".format(self.seed, len(batch), e))
+        if self.segment is not None:
+            self.segment.close()
+
+    def _write_batch(self, batch: List[Dict]):
+        if not batch:
+            return
+        lines = ''.join([json.dumps(record, sort_keys=True) + '\n' for record in batch])
+        if self.segment is None or self.segment_bytes >= self.segment_size:
+            self._rotate()
+        self.segment.write(lines)
+        self.segment.flush()
+        self.segment_bytes += len(lines)
+
+    def _rotate(self):
+        if self.segment is not None:
+            self.segment.close()
+        path = os.path.join(LOGS_DIRECTORY.format(self.seed), SEGMENT_NAME.format(self.segment_index))
+        self.segment = gzip.open(path + '.gz', 'wt') if self.compress else open(path, 'w')
+        self.segment_index += 1
+        self.segment_bytes = 0
@@ -1,11 +1,32 @@
+import asyncio
 import logging
 import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from shutil import rmtree
-from typing import List, Tuple, Dict, Union
+from threading import Event, Lock, BoundedSemaphore
+from typing import List, Tuple, Dict, Union, Callable, Optional
 
+from src.balance_ledger import BalanceLedger, BalanceReconciler
+from src.block_watcher import BlockWatcher
 from src.config import Config
-from src.task import Task
+from src.corpus import Corpus, CorpusEntry
+from src.epoch_tracker import EpochTracker
+from src.histogram import Histogram, Latencies, copy_latencies, format_latencies, merge_latencies, summarize_latencies
+from src.leases import AccountLeases
+from src.log_sink import LogSink, LOG_FORMATS
+from src.memory_store import MemoryStore
+from src.node_pool import NodePool
+from src.node_status import NodeStatus
+from src.pipeline import LifecyclePipeline
+from src.rpc import RpcClient, RpcSubmitter, TxTemplateExporter, TxTemplates
+from src.scheduler import Scheduler
+from src.snapshot import Snapshot
+from src.store import Store, sqlite_store
+from src.task import Task, TaskResult, TransactionTask, TaskPlan
 from src.tasks.delegate import Delegate
 from src.tasks.faucet import Faucet
 from src.tasks.init import Init
@@ -14,16 +35,28 @@ from src.tasks.transfer import Transfer
 from src.tasks.unbond import Unbond
 from src.tasks.vote_proposal import VoteProposal
 from src.tasks.withdraw import Withdraw
-
+from src.workload import Phase, TaskSampler, Workload
 
 @dataclass
 class ManagerResult:
     seed: int
     stats: Dict[str, Dict[str, int]]
+    late: int = 0
+    dropped: int = 0
+    latencies: Latencies = field(default_factory=dict)
+    node_stats: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    node_latencies: Dict[str, Histogram] = field(default_factory=dict)
+    in_flight: int = 0
+    # src.block_watcher.BlockWatcher.summary
+    inclusion: Dict[str, float] = field(default_factory=dict)
+    # unix second -> txs sent, lined up with the blocks by src.chain_analyzer
+    sent: Dict[int, int] = field(default_factory=dict)
 
     def print(self) -> None:
         total_tx = sum([self.stats[key]['succeeded'] + self.stats[key]['failed'] + self.stats[key]['skipped'] for key in self.stats.keys()])
         print("Manager {} result ({} txs):".format(self.seed, total_tx))
+        if self.late or self.dropped:
+            print("- {} dispatches late, {} dispatches dropped.".format(self.late, self.dropped))
         for task_name in self.stats.keys():
             succeeded = self.stats[task_name]['succeeded']
             failed = self.stats[task_name]['failed']
@@ -31,6 +64,15 @@ class ManagerResult:
             percentage = 100 if succeeded == 0 and failed == 0 else int((succeeded / (succeeded + failed)) * 100)
             print("- {0} - {1} / {2} ({3}%)".format(task_name, succeeded, failed, percentage))
             print("- {0} - {1} txs skipped.".format(task_name, skipped))
+        for line in format_latencies(self.latencies):
+            print(line)
+        if self.inclusion:
+            print("- {0} txs included, {1} not included, {2} still pending.".format(
+                self.inclusion['included'], self.inclusion['not_included'], self.inclusion['pending']))
+        if self.inclusion.get('blocks'):
+            print("- {0} blocks, {1} txs per block (max {2}), {3} of this seed.".format(
+                self.inclusion['blocks'], self.inclusion['txs_per_block'], self.inclusion['max_txs_per_block'],
+                self.inclusion['own_txs_per_block']))
 
     def to_json(self) -> Dict[str, Union[int, Dict]]:
         succeeded_tx = sum([self.stats[key]['succeeded'] for key in self.stats.keys()])
@@ -39,7 +81,10 @@ class ManagerResult:
         total_tx = succeeded_tx + failed_tx + skipped_tx
         succeeded_percentage = 100 if total_tx == 0 else int((succeeded_tx / total_tx) * 100)
 
-        return {'seed': self.seed, 'stats': self.stats, 'total_tx': total_tx, 'successful_percentage': succeeded_percentage, 'skipped_tx': skipped_tx}
+        return {'seed': self.seed, 'stats': self.stats, 'total_tx': total_tx, 'successful_percentage': succeeded_percentage, 'skipped_tx': skipped_tx,
+                'late_dispatches': self.late, 'dropped_dispatches': self.dropped,
+                'latencies_ms': summarize_latencies(self.latencies), 'nodes': self.node_stats,
+                'inclusion': self.inclusion}
 
 
 @dataclass
@@ -47,79 +92,717 @@ class Manager:
     name: str
     config: Config
     seed: int
+    resume: bool = False
+    corpus_mode: Optional[str] = None
+    replay_rate: str = 'full'
     all_tasks: Dict[str, Task] = field(init=False)
     stats: Dict[str, Dict[str, int]] = field(init=False)
     r: random.Random = field(init=False)
+    late: int = field(init=False, default=0)
+    dropped: int = field(init=False, default=0)
+    latencies: Latencies = field(init=False, default_factory=dict)
+    node_stats: Dict[str, Dict[str, int]] = field(init=False, default_factory=dict)
+    node_latencies: Dict[str, Histogram] = field(init=False, default_factory=dict)
+    in_flight: int = field(init=False, default=0)
+    sent: Dict[int, int] = field(init=False, default_factory=dict)
+    stats_lock: Lock = field(init=False, default_factory=Lock)
+    store: Store = field(init=False)
+    log_sink: Optional[LogSink] = field(init=False, default=None)
+    leases: Optional[AccountLeases] = field(init=False, default=None)
+    ledger: Optional[BalanceLedger] = field(init=False, default=None)
+    reconciler: Optional[BalanceReconciler] = field(init=False, default=None)
+    watcher: Optional[BlockWatcher] = field(init=False, default=None)
+    pipeline: Optional[LifecyclePipeline] = field(init=False, default=None)
+    # scheduler settings of the current load run, replacing the configured ones, see run_load
+    scheduler: Optional[Dict] = field(init=False, default=None)
+    sampler: TaskSampler = field(init=False)
+    workload: Optional[Workload] = field(init=False, default=None)
+    phase: Optional[Phase] = field(init=False, default=None)
+    # monotonic time the current phase ends at
+    deadline: Optional[float] = field(init=False, default=None)
+    # indexes keep counting over the phases of a run
+    last_index: int = field(init=False, default=0)
+    # shared by the managers of a process, see Coordinator
+    node_pool: Optional[NodePool] = field(init=False, default=None)
+    corpus: Optional[Corpus] = field(init=False, default=None)
+    epoch_tracker: Optional[EpochTracker] = field(init=False, default=None)
+    progress_callback: Optional[Callable[[ManagerResult], None]] = field(init=False, default=None)
+    last_progress: float = field(init=False, default=0.0)
+    PROGRESS_INTERVAL = 5
 
     def __post_init__(self):
         tasks = self.config.get_tasks()
-        self.stats = {task_name: {'succeeded': 0, 'failed': 0, 'skipped': 0} for task_name in [task['type'] for task in tasks]}
+        self.sampler = TaskSampler.from_config(tasks)
+        task_types = self.sampler.task_types
+        if self.config.get_workload() is not None:
+            self.workload = Workload.from_config(self.config.get_workload(), tasks)
+            task_types = task_types + self.workload.task_types()
+        self.stats = {task_name: {'succeeded': 0, 'failed': 0, 'skipped': 0} for task_name in task_types}
 
         self.r = random.Random(self.seed)
         random.seed(self.seed)
 
-        rmtree("logs/{}".format(self.seed), ignore_errors=True)
+        if not self.resume:
+            rmtree("logs/{}".format(self.seed), ignore_errors=True)
+
+    def _build_store(self) -> Store:
+        store_config = self.config.get_store()
+        if store_config['backend'] == 'memory':
+            return MemoryStore.build(self.seed, store_config.get('write_behind', None))
+        elif store_config['backend'] == 'sqlite':
+            return sqlite_store()
+        raise Exception("Unknown store backend {}.".format(store_config['backend']))
+
+    def _build_leases(self) -> Optional[AccountLeases]:
+        leases_config = self.config.get_leases()
+        if leases_config is None:
+            return None
+        leases = AccountLeases.from_config(leases_config)
+        # tasks are prepared on the event loop, blocking there would also block the releases it waits for
+        leases.blocking = self.config.get_engine() != 'async'
+        return leases
 
-    # workaround cause of namada wallet bug with file_lock
+    def _build_log_sink(self) -> Optional[LogSink]:
+        logs_config = self.config.get_logs()
+        log_format = logs_config.get('format', 'segments')
+        if log_format == 'segments':
+            return LogSink.from_config(self.seed, logs_config)
+        elif log_format == 'files':
+            return None
+        raise Exception("Unknown logs format {}, expected one of {}.".format(log_format, ', '.join(LOG_FORMATS)))
+
+    # kept apart from run(): seeds sharing a wallet run it one at a time, namada wallet bug with file_lock
     def run_init_task(self, base_directory: str, base_binary: str, nodes: List[str]):
-        ledger_address = self._get_random_node_address(nodes)
+        if self.node_pool is None:
+            self.node_pool = NodePool(nodes)
+        ledger_address = self.node_pool.pick()
+        self.store = self._build_store()
+        self.log_sink = self._build_log_sink()
+        self.leases = self._build_leases()
+        inclusion_config = self.config.get_inclusion()
+        if inclusion_config is not None and self.corpus_mode != 'generate':
+            self.watcher = BlockWatcher.from_config(self.node_pool, self.seed, inclusion_config)
         self.all_tasks = self._build_all_tasks(base_directory, base_binary, self.seed)
-        logging.info("{0}-{1} - Running {2} against {3}...".format(self.name, 0, 'Init', ledger_address))
-        self.all_tasks['Init'].run(0, base_directory, ledger_address, False)
+        for task in self.all_tasks.values():
+            task.command_timeout = self.config.get_command_timeout()
+            task.store = self.store
+            task.leases = self.leases
+            task.r = self.r
+
+        if self.corpus_mode == 'replay':
+            # every command is already in the corpus, replaying needs no state
+            self.corpus = Corpus.load(self.seed)
+            if self.corpus is None:
+                raise Exception("Can't find a corpus for seed {}, generate it first.".format(self.seed))
+            logging.info("{0} - Loaded corpus of {1} txs".format(self.name, len(self.corpus.entries)))
+            return
+
+        self.all_tasks['Init'].workers = self.config.get_init().get('workers', 8)
+        self.all_tasks['Init'].global_bonds = self.config.get_init().get('global_bonds', True)
+        self.all_tasks['Init'].provisioning = self.config.get_init()
+
+        snapshot = Snapshot.load(self.seed) if self.resume else None
+        if snapshot is not None and snapshot.chain_id != NodeStatus.fetch(ledger_address).chain_id:
+            logging.warning("{0} - Snapshot is for chain {1}, running a full Init".format(self.name, snapshot.chain_id))
+            snapshot = None
+
+        if snapshot is not None:
+            logging.info("{0}-{1} - Resuming from snapshot taken at height {2}, reconciling against {3}...".format(
+                self.name, 0, snapshot.block_height, ledger_address))
+            self.store.restore(self.seed, snapshot.state)
+            self.all_tasks['Init'].reconcile(0, ledger_address, snapshot.state['accounts'])
+        else:
+            logging.info("{0}-{1} - Running {2} against {3}...".format(self.name, 0, 'Init', ledger_address))
+            self.all_tasks['Init'].run(0, base_directory, ledger_address, False)
         logging.info("{0}-{1} - Done {2} task".format(self.name, 0, 'Init'))
+        Snapshot.capture(self.store, self.seed, NodeStatus.fetch(ledger_address)).dump()
+
+        if self.corpus_mode == 'generate':
+            self.corpus = self._generate_corpus(nodes, ledger_address)
+            logging.info("{0} - Wrote corpus of {1} txs to {2}".format(self.name, len(self.corpus.entries),
+                                                                       self.corpus.dump()))
+            return
+
+        balances_config = self.config.get_balances()
+        if balances_config is not None:
+            self.ledger = BalanceLedger()
+            self.ledger.load(self.store.export(self.seed)['accounts'])
+            self.reconciler = BalanceReconciler.from_config(self.ledger, self.store,
+                                                            self.all_tasks['Init'].query_balances, self.node_pool,
+                                                            self.seed, balances_config)
+            for task in self.all_tasks.values():
+                task.ledger = self.ledger
+
+        epoch_cache = self.config.get_epoch_cache()
+        if epoch_cache is not None:
+            self.epoch_tracker = EpochTracker(self.all_tasks['Init'].query_current_epoch, self.node_pool,
+                                              epoch_cache.get('refresh_interval', 5),
+                                              epoch_cache.get('max_staleness', 10))
+            for task in self.all_tasks.values():
+                task.epoch_tracker = self.epoch_tracker
+
+        pipeline_config = self.config.get_pipeline()
+        if pipeline_config is not None:
+            self.pipeline = LifecyclePipeline.from_config(pipeline_config)
+            self.pipeline.load(self.store.export(self.seed), self.all_tasks['Init'].query_current_epoch(ledger_address))
+            for task in self.all_tasks.values():
+                task.pipeline = self.pipeline
+
+        rpc = self.config.get_rpc()
+        if rpc is not None:
+            templates_dir = rpc['templates_dir'].format(seed=self.seed)
+            if rpc.get('export', 0) > 0:
+                self._export_templates(TxTemplateExporter(templates_dir, rpc['export'],
+                                                          self.config.get_command_timeout()), ledger_address)
+            else:
+                # the txs are sent as they are, without prepare and complete
+                logging.warning("{0} - Txs broadcast from templates don't update the store, later picks can drift "
+                                "from the chain".format(self.name))
+            submitter = RpcSubmitter(RpcClient(rpc.get('pool_size', 32), rpc.get('timeout', 10)),
+                                     TxTemplates(templates_dir), rpc.get('mode', 'sync'))
+            for task in self.all_tasks.values():
+                task.submitter = submitter
+
+    def _export_templates(self, exporter: TxTemplateExporter, ledger_address: str):
+        current_epoch = self.all_tasks['Init'].query_current_epoch(ledger_address)
+        for task_name in self.stats.keys():
+            exported = exporter.export(self.all_tasks[task_name], ledger_address, current_epoch)
+            logging.info("{0} - Exported {1} {2} templates to {3}".format(self.name, exported, task_name,
+                                                                         exporter.templates_dir))
 
     def run(self, base_directory: str, nodes: List[str], fail_fast: bool) -> ManagerResult:
-        tasks = self.config.get_tasks()
+        self.start()
+        try:
+            if self.workload is not None and self.corpus_mode is None:
+                return self.run_workload(base_directory, nodes, fail_fast)
+            return self.run_load(base_directory, nodes, fail_fast)
+        finally:
+            self.stop()
+
+    def start(self):
+        if self.epoch_tracker:
+            self.epoch_tracker.start()
+        if self.reconciler:
+            self.reconciler.start()
+        if self.watcher:
+            self.watcher.start()
+
+    def run_load(self, base_directory: str, nodes: List[str], fail_fast: bool,
+                 scheduler: Optional[Dict] = None) -> ManagerResult:
+        # can run several times between start and stop, the counters keep adding up, see src.saturation
+        self.scheduler = scheduler
+        result = self._run(base_directory, nodes, fail_fast)
+        if self.watcher:
+            # the txs sent last are only in the next blocks
+            self.watcher.drain()
+            result = self._build_result()
+        return result
+
+    def run_workload(self, base_directory: str, nodes: List[str], fail_fast: bool) -> ManagerResult:
+        result = self._build_result()
+        for phase in self.workload.phases:
+            logging.info("{0} - Phase {1}: {2}".format(self.name, phase.name, phase.describe()))
+            first_index = self.last_index
+            self.phase = phase
+            self.deadline = time.monotonic() + phase.duration if phase.duration is not None else None
+            try:
+                result = self.run_load(base_directory, nodes, fail_fast, phase.scheduler(self.config.get_scheduler()))
+            finally:
+                self.phase, self.deadline = None, None
+            logging.info("{0} - Phase {1} done, {2} txs dispatched".format(self.name, phase.name,
+                                                                           self.last_index - first_index))
+            if fail_fast and any([stats['failed'] for stats in result.stats.values()]):
+                break
+        return result
+
+    def stop(self):
+        if self.corpus_mode is None:
+            self._capture_snapshot()
+        if self.log_sink is not None:
+            self.log_sink.close()
+        self.store.close()
+        if self.leases:
+            logging.info("{0} - Account leases: {1} checkouts, {2} busy picks, {3} times exhausted".format(
+                self.name, self.leases.checkouts, self.leases.contended, self.leases.exhausted))
+        if self.reconciler:
+            self.reconciler.stop()
+            logging.info("{0} - Balance ledger: {1} reservations, {2} txs refused, {3} accounts resynced, "
+                         "{4} balances drifted by {5} in total".format(
+                             self.name, self.ledger.reservations, self.ledger.refused, self.reconciler.resynced,
+                             self.reconciler.drifted, self.reconciler.total_drift))
+        if self.watcher:
+            self.watcher.stop()
+        if self.pipeline:
+            logging.info("{0} - Lifecycle pipeline: {1} follow-ups fired, {2} picks redirected, {3} pending".format(
+                self.name, self.pipeline.fired, self.pipeline.redirected, self.pipeline.pending()))
+        if self.epoch_tracker:
+            self.epoch_tracker.stop()
+            logging.info("{0} - Epoch tracker queried the ledger {1} times".format(self.name,
+                                                                                  self.epoch_tracker.queries))
+
+    def _capture_snapshot(self):
+        # the load bonded, unbonded and withdrew, a resume must start from that state and not from the Init one
+        try:
+            Snapshot.capture(self.store, self.seed, NodeStatus.fetch(self.node_pool.pick())).dump()
+        except Exception as e:
+            logging.warning("{0} - Can't snapshot the state at the end of the run: {1}".format(self.name, e))
+
+    def _run(self, base_directory: str, nodes: List[str], fail_fast: bool) -> ManagerResult:
+        if self.corpus_mode == 'generate':
+            return self._build_result()
+        if self.corpus_mode == 'replay':
+            if self.config.get_engine() == 'async':
+                return asyncio.run(self._replay_async(fail_fast))
+            return self._replay(fail_fast)
+        if self.config.get_engine() == 'async':
+            return asyncio.run(self._run_async(base_directory, nodes, fail_fast))
+        if self._get_scheduler():
+            return self._run_open_loop(base_directory, nodes, fail_fast)
 
-        task_types, task_probabilities = self._build_task_with_probabilities(tasks)
+        dry_run = self.config.get_dry_run()
+        total_transactions = self._get_total_transaction()
+        for index in range(self.last_index + 1, self.last_index + total_transactions + 1):
+            if self._is_past_deadline():
+                break
+            self.last_index = index
+            node_address = self.node_pool.acquire()
+            next_task = self._get_next_task()
+            task_result = self._execute_task(index, next_task, base_directory, node_address, dry_run)
+
+            if not self._record_result(index, task_result, node_address, fail_fast):
+                logging.info("{0}-{1} - Shutting down manager...".format(self.name, index))
+                return self._build_result()
+
+        logging.info("Manager {0} completed!".format(self.name))
+
+        return self._build_result()
 
+    def _run_open_loop(self, base_directory: str, nodes: List[str], fail_fast: bool) -> ManagerResult:
+        scheduler = Scheduler.from_config(self._get_scheduler())
         dry_run = self.config.get_dry_run()
+        total_transactions = self._get_total_transaction()
+        in_flight = [0]
+        stop = Event()
+
+        def dispatch(index: int, task: Task, node_address: str):
+            try:
+                task_result = self._execute_task(index, task, base_directory, node_address, dry_run)
+                if not self._record_result(index, task_result, node_address, fail_fast):
+                    stop.set()
+            except Exception as e:
+                if not self._record_exception(index, task, node_address, e, fail_fast):
+                    stop.set()
+            finally:
+                with self.stats_lock:
+                    in_flight[0] -= 1
+
+        logging.info("{0} - Open-loop scheduling at {1} tx/s ({2} profile, {3} max in-flight)".format(
+            self.name, scheduler.rate, scheduler.profile, scheduler.max_in_flight))
+
+        start_time = time.monotonic()
+        offset = 0.0
+        with ThreadPoolExecutor(max_workers=scheduler.max_in_flight, thread_name_prefix=self.name) as executor:
+            for index in range(self.last_index + 1, self.last_index + total_transactions + 1):
+                if stop.is_set() or scheduler.is_over(offset) or self._is_past_deadline():
+                    break
+
+                # dispatch on the clock: never wait for earlier transactions to complete
+                delay = start_time + offset - time.monotonic()
+                if delay > 0:
+                    # nothing more is sent once the run stopped or its phase ended during the wait
+                    if stop.wait(delay) or self._is_past_deadline():
+                        break
+                elif -delay > scheduler.late_threshold:
+                    self.late += 1
+                offset = scheduler.next_offset(offset)
+                self.last_index = index
+
+                with self.stats_lock:
+                    if in_flight[0] >= scheduler.max_in_flight:
+                        self.dropped += 1
+                        continue
+                    in_flight[0] += 1
+
+                node_address = self.node_pool.acquire()
+                next_task = self._get_next_task()
+                executor.submit(dispatch, index, next_task, node_address)
+
+        if stop.is_set():
+            logging.info("{0} - Shutting down manager...".format(self.name))
+        else:
+            logging.info("Manager {0} completed!".format(self.name))
+
+        return self._build_result()
+
+    async def _run_async(self, base_directory: str, nodes: List[str], fail_fast: bool) -> ManagerResult:
+        scheduler = Scheduler.from_config(self._get_scheduler()) if self._get_scheduler() else None
+        concurrency = scheduler.max_in_flight if scheduler else self.config.get_concurrency()
+        dry_run = self.config.get_dry_run()
+        total_transactions = self._get_total_transaction()
+        stop = asyncio.Event()
+        in_flight = set()
+
+        async def dispatch(index: int, task: Task, node_address: str):
+            try:
+                task_result = await self._execute_task_async(index, task, base_directory, node_address, dry_run)
+                if not self._record_result(index, task_result, node_address, fail_fast):
+                    stop.set()
+            except Exception as e:
+                if not self._record_exception(index, task, node_address, e, fail_fast):
+                    stop.set()
+
+        async def worker(indexes):
+            for index in indexes:
+                if stop.is_set() or self._is_past_deadline():
+                    return
+                self.last_index = index
+                node_address = self.node_pool.acquire()
+                next_task = self._get_next_task()
+                await dispatch(index, next_task, node_address)
+
+        logging.info("{0} - Async engine with {1} concurrent commands".format(self.name, concurrency))
+
+        if scheduler is None:
+            # closed loop: each worker sends its next tx as soon as the previous one completes
+            indexes = iter(range(self.last_index + 1, self.last_index + total_transactions + 1))
+            workers = [asyncio.ensure_future(worker(indexes)) for _ in range(concurrency)]
+            in_flight.update(workers)
+        else:
+            loop = asyncio.get_event_loop()
+            start_time = loop.time()
+            offset = 0.0
+            for index in range(self.last_index + 1, self.last_index + total_transactions + 1):
+                if stop.is_set() or scheduler.is_over(offset) or self._is_past_deadline():
+                    break
+
+                delay = start_time + offset - loop.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(stop.wait(), delay)
+                        break
+                    except asyncio.TimeoutError:
+                        if self._is_past_deadline():
+                            break
+                elif -delay > scheduler.late_threshold:
+                    self.late += 1
+                offset = scheduler.next_offset(offset)
+                self.last_index = index
+
+                if len(in_flight) >= concurrency:
+                    self.dropped += 1
+                    continue
+
+                node_address = self.node_pool.acquire()
+                next_task = self._get_next_task()
+                future = asyncio.ensure_future(dispatch(index, next_task, node_address))
+                in_flight.add(future)
+                future.add_done_callback(in_flight.discard)
+
+        await self._drain(in_flight, stop)
+
+        if stop.is_set():
+            logging.info("{0} - Shutting down manager...".format(self.name))
+        else:
+            logging.info("Manager {0} completed!".format(self.name))
+
+        return self._build_result()
+
+    @staticmethod
+    async def _drain(in_flight: set, stop: asyncio.Event):
+        pending = list(in_flight)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if stop.is_set():
+                # fail fast: cancel the commands still running, their processes are killed
+                for future in pending:
+                    future.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+
+    def _generate_corpus(self, nodes: List[str], ledger_address: str) -> Corpus:
+        scheduler = Scheduler.from_config(self.config.get_scheduler()) if self.config.get_scheduler() else None
         total_transactions = self.config.get_total_transaction()
+        if total_transactions == sys.maxsize and (scheduler is None or scheduler.duration is None):
+            raise Exception("A corpus needs a bounded total_tx or scheduler duration.")
+
+        current_epoch = self.all_tasks['Init'].query_current_epoch(ledger_address)
+        corpus = Corpus(self.seed)
+        # planning is sequential and every draw comes from the reseeded generator of this manager, the same Init state
+        # and epoch always give the same corpus
+        self.r.seed(self.seed)
+        offset = 0.0
         for index in range(1, total_transactions + 1):
-            node_address = self._get_random_node_address(nodes)
-            next_task = self._get_next_task(task_types, task_probabilities)
-            logging.info(
-                "{0}-{1} - Running {2} against {3}...".format(self.name, index, next_task.task_name, node_address))
-            task_result = next_task.run(index, base_directory, node_address, dry_run)
-            task_result.dump()
+            if scheduler is not None and scheduler.is_over(offset):
+                break
+            # nodes in turn, the health of the pool changes from one generation to the next
+            node_address = nodes[index % len(nodes)]
+            next_task = self._get_next_task()
+            plan = next_task.plan(index, node_address, current_epoch)
+            if plan is None:
+                with self.stats_lock:
+                    self.stats[next_task.task_name]['skipped'] += 1
+            else:
+                corpus.add(CorpusEntry(index, round(offset, 6), next_task.task_name, node_address, plan.command,
+                                       plan.files))
+            if scheduler is not None:
+                offset = scheduler.next_offset(offset)
+        return corpus
+
+    def _replay_settings(self) -> Tuple[int, float]:
+        scheduler = Scheduler.from_config(self.config.get_scheduler()) if self.config.get_scheduler() else None
+        if self.replay_rate == 'recorded' and scheduler is not None:
+            return scheduler.max_in_flight, scheduler.late_threshold
+        return self.config.get_concurrency(), 0.05
+
+    def _replay(self, fail_fast: bool) -> ManagerResult:
+        concurrency, late_threshold = self._replay_settings()
+        slots = BoundedSemaphore(concurrency)
+        stop = Event()
+
+        def dispatch(entry: CorpusEntry):
+            node_address = self.node_pool.acquire(entry.node)
+            try:
+                task_result = self._replay_entry(entry, node_address)
+                if not self._record_result(entry.index, task_result, node_address, fail_fast):
+                    stop.set()
+            except Exception as e:
+                if not self._record_exception(entry.index, self.all_tasks[entry.task_name], node_address, e,
+                                              fail_fast):
+                    stop.set()
+            finally:
+                slots.release()
+
+        logging.info("{0} - Replaying {1} txs at {2} rate with {3} concurrent commands".format(
+            self.name, len(self.corpus.entries), self.replay_rate, concurrency))
+
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=self.name) as executor:
+            for entry in self.corpus.entries:
+                if stop.is_set():
+                    break
+                if self.replay_rate == 'recorded':
+                    delay = start_time + entry.offset - time.monotonic()
+                    if delay > 0:
+                        if stop.wait(delay):
+                            break
+                    elif -delay > late_threshold:
+                        self.late += 1
+                    if not slots.acquire(blocking=False):
+                        self.dropped += 1
+                        continue
+                else:
+                    slots.acquire()
+                executor.submit(dispatch, entry)
+
+        if stop.is_set():
+            logging.info("{0} - Shutting down manager...".format(self.name))
+        else:
+            logging.info("Manager {0} completed!".format(self.name))
+
+        return self._build_result()
+
+    async def _replay_async(self, fail_fast: bool) -> ManagerResult:
+        concurrency, late_threshold = self._replay_settings()
+        slots = asyncio.Semaphore(concurrency)
+        stop = asyncio.Event()
+        in_flight = set()
+
+        async def dispatch(entry: CorpusEntry):
+            node_address = self.node_pool.acquire(entry.node)
+            try:
+                task_result = await self._replay_entry_async(entry, node_address)
+                if not self._record_result(entry.index, task_result, node_address, fail_fast):
+                    stop.set()
+            except Exception as e:
+                if not self._record_exception(entry.index, self.all_tasks[entry.task_name], node_address, e,
+                                              fail_fast):
+                    stop.set()
+            finally:
+                slots.release()
+
+        logging.info("{0} - Replaying {1} txs at {2} rate with {3} concurrent commands".format(
+            self.name, len(self.corpus.entries), self.replay_rate, concurrency))
+
+        loop = asyncio.get_event_loop()
+        start_time = loop.time()
+        for entry in self.corpus.entries:
+            if stop.is_set():
+                break
+            if self.replay_rate == 'recorded':
+                delay = start_time + entry.offset - loop.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(stop.wait(), delay)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                elif -delay > late_threshold:
+                    self.late += 1
+                if slots.locked():
+                    self.dropped += 1
+                    continue
+            await slots.acquire()
+            future = asyncio.ensure_future(dispatch(entry))
+            in_flight.add(future)
+            future.add_done_callback(in_flight.discard)
+
+        await self._drain(in_flight, stop)
+
+        if stop.is_set():
+            logging.info("{0} - Shutting down manager...".format(self.name))
+        else:
+            logging.info("Manager {0} completed!".format(self.name))
+
+        return self._build_result()
 
+    def _replay_entry(self, entry: CorpusEntry, node_address: str) -> TaskResult:
+        logging.info("{0}-{1} - Replaying {2} against {3}...".format(self.name, entry.index, entry.task_name,
+                                                                      node_address))
+        with self._in_flight():
+            task_result = self.all_tasks[entry.task_name].replay(entry.index, self._replay_plan(entry, node_address))
+        self._dump_result(task_result)
+        return task_result
+
+    async def _replay_entry_async(self, entry: CorpusEntry, node_address: str) -> TaskResult:
+        logging.info("{0}-{1} - Replaying {2} against {3}...".format(self.name, entry.index, entry.task_name,
+                                                                      node_address))
+        with self._in_flight():
+            task_result = await self.all_tasks[entry.task_name].replay_async(entry.index,
+                                                                             self._replay_plan(entry, node_address))
+        self._dump_result(task_result)
+        return task_result
+
+    @staticmethod
+    def _replay_plan(entry: CorpusEntry, node_address: str) -> TaskPlan:
+        # the pool replaced a recorded node it doesn't know, the command goes to the node it picked instead
+        command = [node_address if arg == entry.node else arg for arg in entry.command]
+        return TaskPlan(command, {}, entry.files)
+
+    def _execute_task(self, index: int, task: Task, base_directory: str, node_address: str, dry_run: bool) -> TaskResult:
+        logging.info("{0}-{1} - Running {2} against {3}...".format(self.name, index, task.task_name, node_address))
+        with self._in_flight():
+            task_result = task.run(index, base_directory, node_address, dry_run)
+        self._dump_result(task_result)
+        return task_result
+
+    async def _execute_task_async(self, index: int, task: TransactionTask, base_directory: str, node_address: str,
+                                  dry_run: bool) -> TaskResult:
+        logging.info("{0}-{1} - Running {2} against {3}...".format(self.name, index, task.task_name, node_address))
+        with self._in_flight():
+            task_result = await task.run_async(index, base_directory, node_address, dry_run)
+        self._dump_result(task_result)
+        return task_result
+
+    @contextmanager
+    def _in_flight(self):
+        with self.stats_lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.stats_lock:
+                self.in_flight -= 1
+
+    def _record_exception(self, index: int, task: Task, node_address: str, error: Exception, fail_fast: bool) -> bool:
+        logging.error("{0}-{1} - Error while running {2}: {3}".format(self.name, index, task.task_name, error))
+        with self.stats_lock:
+            self.stats[task.task_name]['failed'] += 1
+            self._node_stats(node_address)['failed'] += 1
+        self.node_pool.release(node_address, None, False)
+        if self.pipeline is not None:
+            self.pipeline.settle(task.task_name, 'failed')
+        self._report_progress()
+        return not fail_fast
+
+    def _record_result(self, index: int, task_result: TaskResult, node_address: str, fail_fast: bool) -> bool:
+        with self.stats_lock:
             if task_result.is_skipped():
                 logging.info("{0}-{1} - Skipped {2} ({3}s)".format(self.name, index, task_result.task_name,
                                                                   task_result.time_elapsed))
-                self.stats[task_result.task_name]['skipped'] += 1
-            elif task_result.is_error() and fail_fast:
+                outcome = 'skipped'
+            elif task_result.is_error():
                 logging.info("{0}-{1} - Failed {2} ({3}s)".format(self.name, index, task_result.task_name,
                                                                   task_result.time_elapsed))
-                logging.info("{0}-{1} - Shutting down manager...".format(self.name, index))
-                self.stats[task_result.task_name]['failed'] += 1
-                return ManagerResult(self.seed, self.stats)
-            elif task_result.is_error():
-                logging.info(
-                    "{0}-{1} - Failed {2} ({3}s)".format(self.name, index, task_result.task_name,
-                                                                         task_result.time_elapsed))
-                self.stats[task_result.task_name]['failed'] += 1
+                outcome = 'failed'
             else:
                 logging.info(
                     "{0}-{1} - Successfully completed {2} ({3}s)".format(self.name, index, task_result.task_name,
                                                                          task_result.time_elapsed))
-                self.stats[task_result.task_name]['succeeded'] += 1
+                outcome = 'succeeded'
+            self.stats[task_result.task_name][outcome] += 1
+            self._node_stats(node_address)[outcome] += 1
 
-        logging.info("Manager {0} completed!".format(self.name))
+            if outcome != 'skipped':
+                task_latencies = self.latencies.setdefault(task_result.task_name, {})
+                for phase, seconds in task_result.phases.items():
+                    task_latencies.setdefault(phase, Histogram()).record(seconds)
+                if 'total' in task_result.phases:
+                    self.node_latencies.setdefault(node_address, Histogram()).record(task_result.phases['total'])
+                submitted_at = task_result.submitted_at or time.time() - task_result.phases.get('total', 0)
+                self.sent[int(submitted_at)] = self.sent.get(int(submitted_at), 0) + 1
+        self.node_pool.release(node_address, None if outcome == 'skipped' else task_result.phases.get('total'),
+                               outcome != 'failed')
+        if self.pipeline is not None:
+            self.pipeline.settle(task_result.task_name, outcome)
+        if self.watcher is not None and task_result.tx_hash is not None:
+            self.watcher.track(task_result.task_name, task_result.tx_hash, task_result.submitted_at)
+        self._report_progress()
+        return not (fail_fast and outcome == 'failed')
 
-        return ManagerResult(self.seed, self.stats)
+    def _node_stats(self, node_address: str) -> Dict[str, int]:
+        return self.node_stats.setdefault(node_address, {'succeeded': 0, 'failed': 0, 'skipped': 0})
 
-    @staticmethod
-    def _get_random_node_address(nodes: List[str]):
-        return random.choice(nodes)
+    def _dump_result(self, task_result: TaskResult):
+        if self.log_sink is not None:
+            self.log_sink.write(task_result)
+        else:
+            task_result.dump()
 
-    def _get_next_task(self, task_types: List[str], task_probabilities: List[int]) -> Task:
-        return self.all_tasks[self.r.choices(task_types, task_probabilities).pop()]
+    def current_result(self) -> ManagerResult:
+        return self._build_result()
 
-    @staticmethod
-    def _build_task_with_probabilities(tasks: List[Dict[str, Union[str, int]]]) -> Tuple[List[str], List[int]]:
-        task_types = [task['type'] for task in tasks]
-        task_probabilities = [task['probability'] for task in tasks]
-        return task_types, task_probabilities
+    def _report_progress(self):
+        if self.progress_callback is None or time.monotonic() - self.last_progress < self.PROGRESS_INTERVAL:
+            return
+        self.last_progress = time.monotonic()
+        self.progress_callback(self._build_result())
+
+    def _build_result(self) -> ManagerResult:
+        with self.stats_lock:
+            # copy, results may be pickled while the manager is still running
+            stats = {task_name: dict(task_stats) for task_name, task_stats in self.stats.items()}
+            latencies = copy_latencies(self.latencies)
+            node_stats = {node: dict(counts) for node, counts in self.node_stats.items()}
+            node_latencies = {node: histogram.copy() for node, histogram in self.node_latencies.items()}
+            in_flight = self.in_flight
+            sent = dict(self.sent)
+        inclusion = {}
+        if self.watcher is not None:
+            # the inclusion phases are only known once the blocks are polled, they're kept by the watcher
+            latencies = merge_latencies([latencies, self.watcher.copy_latencies()])
+            inclusion = self.watcher.summary()
+        return ManagerResult(self.seed, stats, self.late, self.dropped, latencies, node_stats, node_latencies,
+                             in_flight, inclusion, sent)
+
+    def _get_scheduler(self) -> Optional[Dict]:
+        return self.scheduler or self.config.get_scheduler()
+
+    def _get_total_transaction(self) -> int:
+        if self.phase is not None:
+            return self.phase.total_tx or sys.maxsize
+        # a load run with its own scheduler settings is bounded by their duration
+        return sys.maxsize if self.scheduler else self.config.get_total_transaction()
+
+    def _get_next_task(self) -> Task:
+        sampler = self.phase.sampler if self.phase else self.sampler
+        if self.pipeline is None:
+            return self.all_tasks[sampler.pick(self.r)]
+        # tasks with a cached epoch don't query it, the pipeline gets it here
+        self.pipeline.observe(self.epoch_tracker.get() if self.epoch_tracker else None)
+        return self.all_tasks[self.pipeline.route(sampler, self.r)]
+
+    def _is_past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
 
     @staticmethod
     def _build_all_tasks(base_directory: str, base_binary: str, seed: int) -> Dict[str, Task]:
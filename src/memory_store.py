@@ -0,0 +1,338 @@
+import logging
+import random
+import sys
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field, asdict
+from threading import RLock, Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+from src.constants import MAX_UNBOND_AMOUNT, TOKENS
+from src.store import Store, Account, Validator, Delegation, Withdrawal, Proposal, db
+
+
+@dataclass
+class Record:
+    id: int
+
+    def get_id(self) -> int:
+        return self.id
+
+
+@dataclass
+class AccountRecord(Record):
+    alias: str
+    address: str
+    token: str
+    amount: int
+    seed: int
+
+
+@dataclass
+class ValidatorRecord(Record):
+    address: str
+    seed: int
+
+
+@dataclass
+class DelegationRecord(Record):
+    account_id: int
+    validator_id: int
+    amount: int
+    epoch: int
+    seed: int
+
+
+@dataclass
+class WithdrawalRecord(Record):
+    account_id: int
+    validator_id: int
+    amount: int
+    epoch: int
+    seed: int
+
+
+@dataclass
+class ProposalRecord(Record):
+    proposal_id: int
+    author: int
+    voting_start_epoch: int
+    voting_end_epoch: int
+    seed: int
+
+
+def _pick_in_ranges(ranges: List[Tuple[List, int, int]], r: Optional[random.Random]):
+    # uniform pick over the union of several [start, end) slices
+    total = sum([end - start for _, start, end in ranges])
+    if total == 0:
+        return None
+    index = (r or random).randrange(total)
+    for entries, start, end in ranges:
+        if index < end - start:
+            return entries[start + index]
+        index -= end - start
+    return None
+
+
+@dataclass
+class _Index:
+    lock: RLock
+    rows: Dict[int, Record] = field(default_factory=dict)
+    next_id: int = 1
+    dirty: bool = False
+
+    def _insert(self, record: Record) -> Record:
+        self.rows[record.id] = record
+        self.next_id += 1
+        self.dirty = True
+        return record
+
+    def get_by_id(self, record_id: int):
+        return self.rows.get(int(record_id))
+
+    def snapshot(self) -> List[Record]:
+        self.dirty = False
+        return [type(record)(**asdict(record)) for record in self.rows.values()]
+
+
+@dataclass
+class AccountIndex(_Index):
+    by_alias_token: Dict[Tuple[str, str], AccountRecord] = field(default_factory=dict)
+    by_address: Dict[str, AccountRecord] = field(default_factory=dict)
+    by_token: Dict[str, List[int]] = field(default_factory=dict)
+    # token -> sorted (amount, id), answers "balance greater than" with a bisection
+    balances: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+
+    def create_account(self, alias: str, address: str, token: str, amount: int, seed: int) -> AccountRecord:
+        with self.lock:
+            record = AccountRecord(self.next_id, alias, address, token, int(amount), seed)
+            self.by_alias_token[(alias, token)] = record
+            self.by_address.setdefault(address, record)
+            self.by_token.setdefault(token, []).append(record.id)
+            insort(self.balances.setdefault(token, []), (record.amount, record.id))
+            return self._insert(record)
+
+    def get_random_account(self, seed: int, tokens: List[str] = TOKENS,
+                           r: Optional[random.Random] = None) -> Optional[AccountRecord]:
+        with self.lock:
+            ranges = [(self.by_token.get(token, []), 0, len(self.by_token.get(token, []))) for token in tokens]
+            record_id = _pick_in_ranges(ranges, r)
+            return None if record_id is None else self.rows[record_id]
+
+    def get_random_account_with_positive_balance(self, seed: int, tokens: List[str] = TOKENS,
+                                                 r: Optional[random.Random] = None) -> Optional[AccountRecord]:
+        return self.get_random_account_with_balance_greater_than(0, seed, tokens, r)
+
+    def get_random_account_with_balance_greater_than(self, amount: int, seed: int, tokens: List[str] = TOKENS,
+                                                     r: Optional[random.Random] = None) -> Optional[AccountRecord]:
+        with self.lock:
+            ranges = []
+            for token in tokens:
+                entries = self.balances.get(token, [])
+                ranges.append((entries, bisect_right(entries, (amount, sys.maxsize)), len(entries)))
+            entry = _pick_in_ranges(ranges, r)
+            return None if entry is None else self.rows[entry[1]]
+
+    def get_by_address(self, address: str, seed: int) -> Optional[AccountRecord]:
+        return self.by_address.get(address)
+
+    def update_account_balance(self, alias: str, token: str, delta_amount: int, seed: int) -> int:
+        with self.lock:
+            record = self.by_alias_token.get((alias, token))
+            if record is None:
+                return 0
+            entries = self.balances[token]
+            del entries[bisect_left(entries, (record.amount, record.id))]
+            record.amount += delta_amount
+            insort(entries, (record.amount, record.id))
+            self.dirty = True
+            return 1
+
+
+@dataclass
+class ValidatorIndex(_Index):
+    ids: List[int] = field(default_factory=list)
+    by_address: Dict[str, ValidatorRecord] = field(default_factory=dict)
+
+    def create_validator(self, address: str, seed: int) -> ValidatorRecord:
+        with self.lock:
+            record = ValidatorRecord(self.next_id, address, seed)
+            self.ids.append(record.id)
+            self.by_address[address] = record
+            return self._insert(record)
+
+    def get_random_validator(self, seed: int, r: Optional[random.Random] = None) -> Optional[ValidatorRecord]:
+        with self.lock:
+            return self.rows[(r or random).choice(self.ids)] if self.ids else None
+
+    def get_by_address(self, address: str, seed: int) -> Optional[ValidatorRecord]:
+        return self.by_address.get(address)
+
+
+@dataclass
+class DelegationIndex(_Index):
+    # sorted (epoch, id) of the delegations that can be unbonded, bucketed by the epoch they become valid
+    valid: List[Tuple[int, int]] = field(default_factory=list)
+
+    def create_delegation(self, account_id: int, validator_id: int, amount: int, epoch: int,
+                          seed: int) -> DelegationRecord:
+        with self.lock:
+            record = DelegationRecord(self.next_id, int(account_id), int(validator_id), int(amount), int(epoch), seed)
+            if record.amount < MAX_UNBOND_AMOUNT:
+                insort(self.valid, (record.epoch, record.id))
+            return self._insert(record)
+
+    def get_random_valid_delegation(self, current_epoch: int, seed: int,
+                                    r: Optional[random.Random] = None) -> Optional[DelegationRecord]:
+        with self.lock:
+            entry = _pick_in_ranges([(self.valid, 0, bisect_right(self.valid, (current_epoch, sys.maxsize)))], r)
+            return None if entry is None else self.rows[entry[1]]
+
+    def delete_by_id(self, record_id: int) -> int:
+        with self.lock:
+            record = self.rows.pop(int(record_id), None)
+            if record is None:
+                return 0
+            position = bisect_left(self.valid, (record.epoch, record.id))
+            if position < len(self.valid) and self.valid[position] == (record.epoch, record.id):
+                del self.valid[position]
+            self.dirty = True
+            return 1
+
+
+@dataclass
+class WithdrawalIndex(_Index):
+    by_epoch: List[Tuple[int, int]] = field(default_factory=list)
+    by_pair: Dict[Tuple[int, int], List[Tuple[int, int]]] = field(default_factory=dict)
+
+    def create_withdrawal(self, account_id: int, validator_id: int, amount: int, epoch: int,
+                          seed: int) -> WithdrawalRecord:
+        with self.lock:
+            record = WithdrawalRecord(self.next_id, int(account_id), int(validator_id), int(amount), int(epoch), seed)
+            insort(self.by_epoch, (record.epoch, record.id))
+            insort(self.by_pair.setdefault((record.account_id, record.validator_id), []), (record.epoch, record.id))
+            return self._insert(record)
+
+    def get_random_withdrawable_withdraw(self, current_epoch: int, seed: int,
+                                         r: Optional[random.Random] = None) -> Optional[WithdrawalRecord]:
+        with self.lock:
+            entry = _pick_in_ranges([(self.by_epoch, 0, bisect_right(self.by_epoch, (current_epoch, sys.maxsize)))],
+                                    r)
+            return None if entry is None else self.rows[entry[1]]
+
+    def get_compatible_withdrawals(self, delegator_id: int, validator_id: int, epoch: int,
+                                   seed: int) -> List[WithdrawalRecord]:
+        with self.lock:
+            entries = self.by_pair.get((int(delegator_id), int(validator_id)), [])
+            return [self.rows[record_id] for _, record_id in entries[:bisect_right(entries, (epoch, sys.maxsize))]]
+
+    def delete_by_id(self, record_id: int) -> int:
+        with self.lock:
+            record = self.rows.pop(int(record_id), None)
+            if record is None:
+                return 0
+            for entries in [self.by_epoch, self.by_pair[(record.account_id, record.validator_id)]]:
+                del entries[bisect_left(entries, (record.epoch, record.id))]
+            self.dirty = True
+            return 1
+
+    def delete_all(self, seed: int) -> int:
+        with self.lock:
+            deleted = len(self.rows)
+            self.rows.clear()
+            self.by_epoch.clear()
+            self.by_pair.clear()
+            self.dirty = True
+            return deleted
+
+
+@dataclass
+class ProposalIndex(_Index):
+    last_proposal_id: Optional[int] = None
+
+    def create_proposal(self, proposal_id: int, author_id: int, voting_start_epoch: int, voting_end_epoch: int,
+                        seed: int) -> ProposalRecord:
+        with self.lock:
+            record = ProposalRecord(self.next_id, int(proposal_id), int(author_id), int(voting_start_epoch),
+                                    int(voting_end_epoch), seed)
+            if self.last_proposal_id is None or record.proposal_id > self.last_proposal_id:
+                self.last_proposal_id = record.proposal_id
+            return self._insert(record)
+
+    def total_proposals(self, seed: int) -> int:
+        return len(self.rows)
+
+    def get_last_proposal_id(self, seed: int) -> Optional[int]:
+        return self.last_proposal_id
+
+    def get_random_votable_proposal(self, epoch: int, seed: int,
+                                    r: Optional[random.Random] = None) -> Optional[ProposalRecord]:
+        # only a handful of proposals are live at once, a scan is cheaper than maintaining an interval index
+        with self.lock:
+            votable = [record for record in self.rows.values()
+                       if record.voting_start_epoch <= epoch and record.voting_end_epoch >= epoch - 1]
+            return (r or random).choice(votable) if votable else None
+
+
+@dataclass
+class MemoryStore(Store):
+    seed: int = 0
+    write_behind_interval: Optional[float] = None
+    stopped: Event = field(default_factory=Event)
+
+    @staticmethod
+    def build(seed: int, write_behind_interval: Optional[float] = None) -> 'MemoryStore':
+        lock = RLock()
+        store = MemoryStore(AccountIndex(lock), ValidatorIndex(lock), DelegationIndex(lock), WithdrawalIndex(lock),
+                            ProposalIndex(lock), seed, write_behind_interval)
+        if write_behind_interval:
+            Thread(target=store._write_behind_loop, name='write-behind:{}'.format(seed), daemon=True).start()
+        return store
+
+    def export(self, seed: int) -> Dict[str, List[Dict]]:
+        with self.accounts.lock:
+            return {name: [asdict(record) for record in table.rows.values()] for name, table in self.tables()}
+
+    def close(self):
+        self.stopped.set()
+        if self.write_behind_interval:
+            self.flush()
+
+    def flush(self):
+        # rewrite this seed's rows, sqlite ids are assigned on insert so foreign keys are remapped
+        indexes = [self.accounts, self.validators, self.delegations, self.withdrawals, self.proposals]
+        if not any([index.dirty for index in indexes]):
+            return
+        # all the indexes share the same lock, take a consistent snapshot of every table at once
+        with self.accounts.lock:
+            accounts, validators, delegations, withdrawals, proposals = [index.snapshot() for index in indexes]
+
+        with db.atomic():
+            for model in [Proposal, Withdrawal, Delegation, Validator, Account]:
+                model.delete().where(model.seed == self.seed).execute()
+
+            account_ids = {record.id: Account.insert(**self._row(record)).execute() for record in accounts}
+            validator_ids = {record.id: Validator.insert(**self._row(record)).execute() for record in validators}
+            for model, records in [(Delegation, delegations), (Withdrawal, withdrawals)]:
+                rows = [dict(self._row(record), account_id=account_ids[record.account_id],
+                             validator_id=validator_ids[record.validator_id]) for record in records]
+                self._insert_many(model, rows)
+            self._insert_many(Proposal, [dict(self._row(record), author=account_ids[record.author])
+                                         for record in proposals])
+
+    @staticmethod
+    def _row(record: Record) -> Dict:
+        row = asdict(record)
+        del row['id']
+        return row
+
+    @staticmethod
+    def _insert_many(model, rows: List[Dict]):
+        for start in range(0, len(rows), 100):
+            model.insert_many(rows[start:start + 100]).execute()
+
+    def _write_behind_loop(self):
+        while not self.stopped.wait(self.write_behind_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning("write-behind:{} - Can't flush the memory store: {}".format(self.seed, e))
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Union
+
+from src.chain_analyzer import BlockStats, ChainAnalyzer
+from src.histogram import Histogram, PERCENTILES
+from src.manager import ManagerResult
+
+OUTCOMES = ['succeeded', 'failed', 'skipped']
+
+
+def _sum_counts(counts: List[Dict[str, int]]) -> Dict[str, int]:
+    return {outcome: sum([count.get(outcome, 0) for count in counts]) for outcome in OUTCOMES}
+
+
+def _merge_histograms(histograms: List[Histogram]) -> Histogram:
+    merged = Histogram()
+    for histogram in histograms:
+        merged.merge(histogram)
+    return merged
+
+
+def _total_latency(result: ManagerResult, task_name: str) -> Histogram:
+    return result.latencies.get(task_name, {}).get('total', Histogram())
+
+
+@dataclass
+class LiveMetrics:
+    # returns the current result of every manager, sampled every interval while the load test runs
+    collect: Callable[[], List[ManagerResult]]
+    interval: float = 10
+    jsonl_path: Optional[str] = None
+    port: Optional[int] = None
+    previous: Dict[int, ManagerResult] = field(init=False, default_factory=dict)
+    previous_time: float = field(init=False, default_factory=time.monotonic)
+    exposition: str = field(init=False, default='')
+    lock: Lock = field(init=False, default_factory=Lock)
+    stopped: Event = field(init=False, default_factory=Event)
+    server: Optional[ThreadingHTTPServer] = field(init=False, default=None)
+    # adds a row of the blocks committed over each interval, next to the rows of what was sent
+    analyzer: Optional[ChainAnalyzer] = field(init=False, default=None)
+
+    @staticmethod
+    def from_config(data: Dict[str, Union[str, int, float]],
+                    collect: Callable[[], List[ManagerResult]]) -> 'LiveMetrics':
+        if 'jsonl' not in data and 'port' not in data:
+            raise Exception("Metrics need a jsonl path, a port, or both.")
+        return LiveMetrics(collect, float(data.get('interval', 10)), data.get('jsonl', None), data.get('port', None))
+
+    def start(self):
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(('0.0.0.0', int(self.port)), self._build_handler())
+            Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+            logging.info("metrics - Serving prometheus metrics on :{}/metrics".format(self.port))
+        self.previous_time = time.monotonic()
+        Thread(target=self._sample_loop, name='metrics', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        # one last sample, so the tail of the run is in the time series too
+        self.sample()
+        if self.server is not None:
+            self.server.shutdown()
+
+    def sample(self):
+        with self.lock:
+            self._sample()
+
+    def _sample(self):
+        results = self.collect()
+        now = time.monotonic()
+        elapsed = max(now - self.previous_time, 1e-6)
+        timestamp = round(time.time(), 3)
+
+        rows = []
+        for result in sorted(results, key=lambda result: result.seed):
+            previous = self.previous.get(result.seed, ManagerResult(result.seed, {}))
+            rows.extend(self._seed_rows(timestamp, elapsed, result, previous))
+        chain_rows = []
+        if self.analyzer is not None:
+            try:
+                chain_rows.append(self._chain_row(timestamp, elapsed, self.analyzer.follow()))
+            except Exception as e:
+                logging.warning("metrics - Can't follow the chain: {}".format(e))
+
+        if self.jsonl_path is not None:
+            if os.path.dirname(self.jsonl_path):
+                os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+            with open(self.jsonl_path, "a") as f:
+                for row in rows + chain_rows:
+                    f.write(json.dumps(row, sort_keys=True) + '\n')
+
+        self.exposition = self._render(results, rows) + self._render_chain(chain_rows)
+        self.previous = {result.seed: result for result in results}
+        self.previous_time = now
+
+    def _seed_rows(self, timestamp: float, elapsed: float, result: ManagerResult,
+                   previous: ManagerResult) -> List[Dict]:
+        task_names = list(result.stats.keys())
+        seed_row = self._row(timestamp, elapsed, result.seed, 'seed', str(result.seed),
+                             _sum_counts(list(result.stats.values())), _sum_counts(list(previous.stats.values())),
+                             _merge_histograms([_total_latency(result, task_name) for task_name in task_names]),
+                             _merge_histograms([_total_latency(previous, task_name) for task_name in task_names]))
+        seed_row['in_flight'] = result.in_flight
+        seed_row['late'] = result.late - previous.late
+        seed_row['dropped'] = result.dropped - previous.dropped
+
+        rows = [seed_row]
+        for task_name in task_names:
+            rows.append(self._row(timestamp, elapsed, result.seed, 'task', task_name, result.stats[task_name],
+                                  previous.stats.get(task_name, {}), _total_latency(result, task_name),
+                                  _total_latency(previous, task_name)))
+        for node, counts in result.node_stats.items():
+            rows.append(self._row(timestamp, elapsed, result.seed, 'node', node, counts,
+                                  previous.node_stats.get(node, {}), result.node_latencies.get(node, Histogram()),
+                                  previous.node_latencies.get(node, Histogram())))
+        return rows
+
+    @staticmethod
+    def _row(timestamp: float, elapsed: float, seed: int, scope: str, name: str, counts: Dict[str, int],
+             previous_counts: Dict[str, int], latency: Histogram, previous_latency: Histogram) -> Dict:
+        # every rate is over the last interval only, cumulative numbers would hide a node saturating mid-run
+        delta = {outcome: counts.get(outcome, 0) - previous_counts.get(outcome, 0) for outcome in OUTCOMES}
+        sent = delta['succeeded'] + delta['failed']
+        total = sent + delta['skipped']
+        return {
+            'time': timestamp,
+            'interval': round(elapsed, 3),
+            'seed': seed,
+            'scope': scope,
+            'name': name,
+            'tx_per_s': round(sent / elapsed, 3),
+            'success_rate': None if sent == 0 else round(delta['succeeded'] / sent, 4),
+            'skip_rate': None if total == 0 else round(delta['skipped'] / total, 4),
+            'latency_ms': latency.subtract(previous_latency).summary(),
+            **delta
+        }
+
+    @staticmethod
+    def _chain_row(timestamp: float, elapsed: float, blocks: List[BlockStats]) -> Dict:
+        txs = sum([block.txs for block in blocks])
+        intervals = [block.interval for block in blocks if block.interval is not None]
+        return {
+            'time': timestamp,
+            'interval': round(elapsed, 3),
+            'scope': 'chain',
+            'name': 'chain',
+            'height': blocks[-1].height if blocks else None,
+            'blocks': len(blocks),
+            'txs': txs,
+            'failed': sum([block.failed for block in blocks]),
+            'gas_used': sum([block.gas_used for block in blocks]),
+            'tx_per_s': round(txs / elapsed, 3),
+            'txs_per_block': round(txs / len(blocks), 2) if blocks else None,
+            'block_interval': round(sum(intervals) / len(intervals), 3) if intervals else None,
+        }
+
+    @staticmethod
+    def _render_chain(rows: List[Dict]) -> str:
+        lines = []
+        for metric, key in [('namada_chain_tx_rate', 'tx_per_s'), ('namada_chain_txs_per_block', 'txs_per_block'),
+                            ('namada_chain_block_interval_seconds', 'block_interval'),
+                            ('namada_chain_failed_txs', 'failed'), ('namada_chain_gas_used', 'gas_used')]:
+            values = [row[key] for row in rows if row[key] is not None]
+            if values:
+                lines.append('# TYPE {} gauge'.format(metric))
+                lines.append('{} {}'.format(metric, values[-1]))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    @staticmethod
+    def _render(results: List[ManagerResult], rows: List[Dict]) -> str:
+        lines = ['# TYPE namada_load_txs_total counter']
+        for result in results:
+            for task_name, counts in result.stats.items():
+                for outcome in OUTCOMES:
+                    lines.append('namada_load_txs_total{{seed="{}",task="{}",outcome="{}"}} {}'.format(
+                        result.seed, task_name, outcome, counts[outcome]))
+        lines.append('# TYPE namada_load_node_txs_total counter')
+        for result in results:
+            for node, counts in result.node_stats.items():
+                for outcome in OUTCOMES:
+                    lines.append('namada_load_node_txs_total{{seed="{}",node="{}",outcome="{}"}} {}'.format(
+                        result.seed, node, outcome, counts[outcome]))
+        lines.append('# TYPE namada_load_in_flight gauge')
+        for result in results:
+            lines.append('namada_load_in_flight{{seed="{}"}} {}'.format(result.seed, result.in_flight))
+
+        for metric, key in [('namada_load_tx_rate', 'tx_per_s'), ('namada_load_success_rate', 'success_rate'),
+                            ('namada_load_skip_rate', 'skip_rate')]:
+            lines.append('# TYPE {} gauge'.format(metric))
+            for row in rows:
+                if row[key] is not None:
+                    lines.append('{}{{seed="{}",scope="{}",name="{}"}} {}'.format(metric, row['seed'], row['scope'],
+                                                                               row['name'], row[key]))
+        # percentiles of the last interval, a summary would need the cumulative sum and count of the same series
+        for percentile in PERCENTILES + ['max']:
+            key = 'max' if percentile == 'max' else 'p{}'.format(percentile)
+            metric = 'namada_load_latency_{}_seconds'.format(key.replace('.', '_'))
+            lines.append('# TYPE {} gauge'.format(metric))
+            for row in rows:
+                if row['latency_ms'][key] is not None:
+                    lines.append('{}{{seed="{}",scope="{}",name="{}"}} {}'.format(
+                        metric, row['seed'], row['scope'], row['name'], row['latency_ms'][key] / 1000))
+        return '\n'.join(lines) + '\n'
+
+    def _build_handler(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                with metrics.lock:
+                    payload = metrics.exposition.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _sample_loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logging.warning("metrics - Can't sample metrics: {}".format(e))
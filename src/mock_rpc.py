@@ -0,0 +1,142 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Set, Tuple
+
+from src.constants import STATUS_ENDPOINT
+
+
+@dataclass
+class MockChain:
+    chain_id: str = 'mock-chain'
+    failure_rate: float = 0.0
+    height: int = 1
+    # seconds per block, 0 keeps the height fixed
+    block_time: float = 0
+    started: float = field(default_factory=time.time)
+    seen: Set[str] = field(default_factory=set)
+    # base64 txs waiting for the next block
+    mempool: List[str] = field(default_factory=list)
+    # height -> base64 txs, only kept for the blocks produced since start
+    blocks: Dict[int, List[str]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def current_height(self) -> int:
+        if not self.block_time:
+            return self.height
+        return self.height + int((time.time() - self.started) / self.block_time)
+
+    def block_time_of(self, height: int) -> str:
+        seconds = self.started + max(height - self.height, 0) * self.block_time
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + '.{:06d}Z'.format(
+            int(seconds % 1 * 1000000))
+
+    def _produce_blocks(self) -> int:
+        # blocks are produced lazily, the next one takes the whole mempool
+        height = self.current_height()
+        if height > self.height and height not in self.blocks:
+            self.blocks[height] = self.mempool
+            self.mempool = []
+        return height
+
+    def status(self) -> Dict:
+        with self.lock:
+            height = self._produce_blocks()
+        return {'node_info': {'network': self.chain_id},
+                'sync_info': {'catching_up': False, 'latest_block_height': str(height),
+                              'latest_block_time': self.block_time_of(height)}}
+
+    def block(self, height: int) -> Tuple[Dict, Dict]:
+        with self.lock:
+            self._produce_blocks()
+            txs = self.blocks.get(height, [])
+        block = {'block': {'header': {'height': str(height), 'time': self.block_time_of(height)},
+                           'data': {'txs': txs}}}
+        results = {'height': str(height), 'txs_results': [{'code': 0, 'gas_used': '24', 'events': []} for _ in txs]}
+        return block, results
+
+    def unconfirmed_txs(self) -> Dict:
+        with self.lock:
+            self._produce_blocks()
+            return {'n_txs': str(len(self.mempool)), 'txs': self.mempool[:100]}
+
+    def broadcast_tx(self, tx: str) -> Dict:
+        tx_hash = hashlib.sha256(base64.b64decode(tx)).hexdigest().upper()
+        with self.lock:
+            self._produce_blocks()
+            # like the tendermint mempool cache, the same tx is only accepted once
+            if tx_hash in self.seen:
+                return {'code': 1, 'log': 'tx already exists in cache', 'hash': tx_hash}
+            self.seen.add(tx_hash)
+            if random.random() < self.failure_rate:
+                return {'code': 1, 'log': 'mock rejection', 'hash': tx_hash}
+            self.mempool.append(tx)
+            return {'code': 0, 'log': '', 'hash': tx_hash}
+
+
+def build_handler(chain: MockChain):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.strip('/').partition('?')
+            params = dict([param.split('=', 1) for param in query.split('&') if '=' in param])
+            if path == STATUS_ENDPOINT:
+                result = chain.status()
+            elif path in ['block', 'block_results']:
+                result = chain.block(int(params.get('height', chain.current_height())))[path == 'block_results']
+            elif path == 'unconfirmed_txs':
+                result = chain.unconfirmed_txs()
+            else:
+                self.send_error(404)
+                return
+            self._reply({'jsonrpc': '2.0', 'id': -1, 'result': result})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            method = request.get('method', '')
+            if method.startswith('broadcast_tx_'):
+                result = chain.broadcast_tx(request['params']['tx'])
+            elif method == STATUS_ENDPOINT:
+                result = chain.status()
+            else:
+                self._reply({'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'message': 'unknown method'}})
+                return
+            self._reply({'jsonrpc': '2.0', 'id': request.get('id'), 'result': result})
+
+        def _reply(self, body: Dict):
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host: str, port: int, chain: MockChain) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), build_handler(chain))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock tendermint rpc for the load tester.')
+    parser.add_argument("--host", type=str, action='store', default='127.0.0.1')
+    parser.add_argument("--port", type=int, action='store', default=26657)
+    parser.add_argument("--chain-id", type=str, action='store', default='mock-chain')
+    parser.add_argument("--failure-rate", type=float, action='store', default=0.0)
+    parser.add_argument("--block-time", type=float, action='store', default=0.0,
+                        help='Seconds per block, the height stays at 1 when 0.')
+    args = parser.parse_args()
+
+    chain = MockChain(args.chain_id, args.failure_rate, block_time=args.block_time)
+    ThreadingHTTPServer((args.host, args.port), build_handler(chain)).serve_forever()
@@ -0,0 +1,169 @@
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Union
+
+import requests
+
+from src.node_status import NodeStatus
+
+STRATEGIES = ['random', 'round_robin', 'least_outstanding', 'latency']
+
+
+@dataclass
+class NodeState:
+    node: str
+    weight: float = 1
+    healthy: bool = True
+    reason: str = ''
+    outstanding: int = 0
+    # ewma of the tx and /status latencies, seconds
+    latency: Optional[float] = None
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    current_weight: float = 0.0
+
+
+@dataclass
+class NodePool:
+    nodes: List[str]
+    strategy: str = 'random'
+    weights: Dict[str, float] = field(default_factory=dict)
+    poll_interval: float = 5
+    max_lag_blocks: int = 5
+    ewma_alpha: float = 0.3
+    max_failures: int = 5
+    eject_time: float = 30
+    states: Dict[str, NodeState] = field(init=False)
+    lock: Lock = field(init=False, default_factory=Lock)
+    stopped: Event = field(init=False, default_factory=Event)
+    session: requests.Session = field(init=False, default_factory=requests.Session)
+
+    def __post_init__(self):
+        if self.strategy not in STRATEGIES:
+            raise Exception("Unknown node pool strategy {}, expected one of {}.".format(self.strategy,
+                                                                                       ', '.join(STRATEGIES)))
+        self.states = {node: NodeState(node, float(self.weights.get(node, 1))) for node in self.nodes}
+
+    @staticmethod
+    def from_config(nodes: List[str], data: Dict[str, Union[str, int, float, Dict]]) -> 'NodePool':
+        return NodePool(
+            nodes=nodes,
+            strategy=data.get('strategy', 'random'),
+            weights=data.get('weights', {}),
+            poll_interval=float(data.get('poll_interval', 5)),
+            max_lag_blocks=int(data.get('max_lag_blocks', 5)),
+            ewma_alpha=float(data.get('ewma_alpha', 0.3)),
+            max_failures=int(data.get('max_failures', 5)),
+            eject_time=float(data.get('eject_time', 30))
+        )
+
+    def start(self):
+        Thread(target=self._poll_loop, name='node-pool', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def pick(self) -> str:
+        with self.lock:
+            return self._choose()
+
+    def acquire(self, node: Optional[str] = None) -> str:
+        # node is given when the target is already decided, e.g. a corpus entry, it is only accounted for.
+        # A node outside the pool (recorded against other nodes, dropped by readiness) is replaced by a pick
+        with self.lock:
+            if node not in self.states:
+                node = self._choose()
+            self.states[node].outstanding += 1
+            return node
+
+    def release(self, node: str, seconds: Optional[float], is_successful: bool):
+        with self.lock:
+            state = self.states.get(node)
+            if state is None:
+                return
+            state.outstanding = max(state.outstanding - 1, 0)
+            if seconds is not None:
+                self._observe_latency(state, seconds)
+            if is_successful:
+                state.consecutive_failures = 0
+                return
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= self.max_failures and state.healthy:
+                # the node answers /status but keeps failing txs, keep it out for a while even if it looks healthy
+                state.ejected_until = time.monotonic() + self.eject_time
+                self._set_health(state, False, "{} consecutive failed txs".format(state.consecutive_failures))
+
+    def poll(self):
+        statuses = {}
+        for node in self.nodes:
+            start_time = time.monotonic()
+            try:
+                statuses[node] = NodeStatus.fetch(node, self.session, timeout=self.poll_interval)
+                with self.lock:
+                    self._observe_latency(self.states[node], time.monotonic() - start_time)
+            except Exception as e:
+                statuses[node] = e
+
+        heights = [status.latest_block_height for status in statuses.values() if isinstance(status, NodeStatus)]
+        best_height = max(heights) if heights else 0
+        with self.lock:
+            for node, status in statuses.items():
+                state = self.states[node]
+                if isinstance(status, Exception):
+                    self._set_health(state, False, "status error: {}".format(status))
+                elif status.catching_up:
+                    self._set_health(state, False, "catching up")
+                elif best_height - status.latest_block_height > self.max_lag_blocks:
+                    self._set_health(state, False, "{} blocks behind".format(best_height - status.latest_block_height))
+                elif time.monotonic() >= state.ejected_until:
+                    state.consecutive_failures = 0
+                    self._set_health(state, True, '')
+
+    def _choose(self) -> str:
+        candidates = [state for state in self.states.values() if state.healthy]
+        if not candidates:
+            # better to keep sending to degraded nodes than to stop the load test
+            candidates = list(self.states.values())
+
+        if self.strategy == 'round_robin':
+            # smooth weighted round-robin, spreads the heavier nodes instead of sending them bursts
+            total_weight = sum([state.weight for state in candidates])
+            for state in candidates:
+                state.current_weight += state.weight
+            chosen = max(candidates, key=lambda state: state.current_weight)
+            chosen.current_weight -= total_weight
+            return chosen.node
+        elif self.strategy == 'least_outstanding':
+            fewest = min([state.outstanding for state in candidates])
+            return random.choice([state.node for state in candidates if state.outstanding == fewest])
+        elif self.strategy == 'latency':
+            # nodes without a sample yet score 0 so they get tried
+            return min(candidates, key=lambda state: ((state.latency or 0) * (state.outstanding + 1),
+                                                       state.outstanding)).node
+        return random.choice([state.node for state in candidates])
+
+    def _observe_latency(self, state: NodeState, seconds: float):
+        if state.latency is None:
+            state.latency = seconds
+        else:
+            state.latency = self.ewma_alpha * seconds + (1 - self.ewma_alpha) * state.latency
+
+    @staticmethod
+    def _set_health(state: NodeState, healthy: bool, reason: str):
+        if state.healthy != healthy:
+            if healthy:
+                logging.info("node-pool - Node {} is back in".format(state.node))
+            else:
+                logging.warning("node-pool - Node {} is out: {}".format(state.node, reason))
+        state.healthy = healthy
+        state.reason = reason
+
+    def _poll_loop(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.warning("node-pool - Can't poll nodes: {}".format(e))
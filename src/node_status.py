@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import requests
+
+from src.constants import STATUS_ENDPOINT
+
+
+@dataclass
+class NodeStatus:
+    node: str
+    chain_id: str
+    latest_block_height: int
+    latest_block_time: str
+    catching_up: bool
+
+    @staticmethod
+    def fetch(node: str, session: Optional[requests.Session] = None, timeout: float = 5) -> 'NodeStatus':
+        response = (session or requests).get("http://{}/{}".format(node, STATUS_ENDPOINT), timeout=timeout)
+        return NodeStatus.parse(node, response.json())
+
+    @staticmethod
+    def parse(node: str, body: Dict) -> 'NodeStatus':
+        # depending on the tendermint version the status is wrapped in a json-rpc 'result'
+        result = body['result'] if 'result' in body else body
+        return NodeStatus(
+            node=node,
+            chain_id=result['node_info']['network'],
+            latest_block_height=int(result['sync_info']['latest_block_height']),
+            latest_block_time=result['sync_info']['latest_block_time'],
+            catching_up=result['sync_info']['catching_up']
+        )
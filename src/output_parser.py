@@ -1,5 +1,57 @@
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from src.constants import (
+    VALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_EXECUTION_OUTPUT, NOT_ENOUGH_BALANCE,
+    SKIPPING_KEY
+)
+
+# every pattern is compiled once and run over the whole output, instead of splitting it line by line in python
+ADDRESS_LIST_RE = re.compile(r'^ *"(?P<alias>[^"]*)":[^:\n]*:\s*(?P<address>\S+)', re.M)
+VALIDATOR_RE = re.compile(r'^\s*(?P<address>[A-Za-z0-9]+):\s*\d', re.M)
+BALANCE_RE = re.compile(r'^Token (?P<token>\S+)|owned by [^:\n]*:\s*(?P<amount>-?\d+)', re.M)
+GEN_KEY_RE = re.compile(r'alias: "(?P<alias>[^"]*)"')
+INIT_ACCOUNT_RE = re.compile(r'^\S+ \S+ (?P<alias>\S+) .* (?P<address>\S+)\.\s*$', re.M)
+EPOCH_RE = re.compile(r'^\s*Last committed epoch: (?P<epoch>\d+)', re.M)
+UNBOND_RE = re.compile(r'^\s*\S+\s+(?P<amount>\d+)\b[^\n]*withdrawable starting from epoch\s+(?P<epoch>\d+)', re.M)
+TX_HASH_RE = re.compile(r'[Tt]ransaction hash:?\s*(?P<hash>[0-9A-Fa-f]{64})')
+GAS_RE = re.compile(r'[Gg]as used:?\s*(?P<gas>\d+)')
+TX_MARKERS_RE = re.compile('|'.join([re.escape(marker) for marker in [
+    VALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_EXECUTION_OUTPUT]]))
+# one alternation over the bonds dump, a single scan classifies every line that matters; findall returns the ten
+# groups of each matched line in this order, empty when not part of the alternative that matched
+BONDS_RE = re.compile(
+    r'^[ \t]*(?:'
+    r'Delegations from ([^\s:]+):? to ([^\s:]+)'
+    r'|Remaining active \S+ \S+ \S+ ([^\s:]+):? \S+ (\S+)'
+    r'|(Self-bonds)'
+    r'|Unbonded delegations from ([^\s:]+):?(?: to ([^\s:]+))?'
+    r'|Withdrawable[ \t]+from[ \t]+\S+[ \t]+(\S+)[ \t]+\S+[ \t]+\S+[ \t]+(\S+)[ \t]+\S+[ \t]+(\S+)'
+    r')', re.M)
+# query-proposal prints five 'label: value' lines per proposal after a three lines header
+PROPOSAL_RE = re.compile(r'^[^\n]*?: (?P<id>\d+)[^\n]*\n[^\n]*?: (?P<author>[^\n]*)\n[^\n]*?: (?P<start>\d+)[^\n]*\n'
+                         r'[^\n]*?: (?P<end>\d+)[^\n]*\n[^\n]*?: (?P<status>[^\n]*)$', re.M)
+SYMBOLS_RE = re.compile(r'[\W_]+')
+
+
+@dataclass
+class TxOutput:
+    is_valid: bool
+    epoch: Optional[int] = None
+    tx_hash: Optional[str] = None
+    gas_used: Optional[int] = None
+    # (epoch, amount) withdrawable after an unbond
+    withdrawals: List[Tuple[int, int]] = field(default_factory=list)
+
+
+@dataclass
+class BondsDump:
+    # (delegator, validator, epoch, amount)
+    delegations: List[Tuple[str, str, int, int]]
+    # (delegator, validator, epoch, active epoch, amount)
+    withdrawals: List[Tuple[str, str, int, int, int]]
 
 
 @dataclass
@@ -7,139 +59,145 @@ class Parser:
 
     @staticmethod
     def parse_wallet_address_list(output: str) -> Tuple[List[str], List[str]]:
-        start_parsing = False
-
+        start = output.find('Known addresses')
+        if start == -1:
+            return [], []
         aliases, addresses = [], []
-        for line in output.splitlines():
-            if start_parsing:
-                tmp = line.split(':')
-                alias = tmp[0][3:-1].strip()
-                address = tmp[2].strip()
-                aliases.append(alias)
-                addresses.append(address)
-            if "Known addresses" in line:
-                start_parsing = True
+        for match in ADDRESS_LIST_RE.finditer(output, output.find('\n', start) + 1):
+            aliases.append(match.group('alias').strip())
+            addresses.append(match.group('address'))
         return aliases, addresses
 
     @staticmethod
     def parse_client_validators(output: str) -> List[str]:
-        validator_addresses = []
-        for line in output.splitlines()[3:-1]:
-            address = line.split(':')[0].strip()
-            validator_addresses.append(address)
-        return validator_addresses
+        return VALIDATOR_RE.findall(output)
 
     @staticmethod
     def parse_client_balance_owner(output: str) -> Dict[str, int]:
         balance_map = {}
-
         token = None
         # First line is CHAIN_ID ...
-        for line in output.splitlines()[1:]:
-            if 'No balances owned' in line:
-                continue
-            if 'Token' in line:
-                token = line.split(' ')[1]
-                continue
-            elif ':' in line and 'owned by' in line:
-                tmp = line.split(':')[1].split(',')[0]
-                amount = int(tmp[1].strip())
-                balance_map[token] = amount
+        for match in BALANCE_RE.finditer(output, output.find('\n') + 1):
+            if match.group('token') is not None:
+                token = match.group('token')
+            elif token is not None:
+                balance_map[token] = int(match.group('amount'))
         return balance_map
 
     @staticmethod
     def parse_wallet_gen_key(output: str) -> str:
-        return output.splitlines()[1].split(':')[1].strip()[1:-1]
+        return GEN_KEY_RE.search(output).group('alias')
 
     @staticmethod
     def parse_client_init_account(output: str) -> Tuple[str, str]:
-        tmp = output.splitlines()[-1].split(' ')
-        return tmp[2].strip(), tmp[-1][:-1].strip()
+        match = None
+        for match in INIT_ACCOUNT_RE.finditer(output):
+            pass
+        return match.group('alias'), match.group('address')
 
     @staticmethod
     def parse_client_epoch(output: str) -> int:
-        return int(output.splitlines()[1].split(': ')[1])
+        return int(EPOCH_RE.search(output).group('epoch'))
 
     @staticmethod
     def parse_client_delegations(output: str) -> List[Tuple[str, str, int, int]]:
-        delegator_address = None
-        validator_address = None
-        bonds = []
-        for line in output.splitlines()[2:]:
-            if line.strip().startswith('Delegations from'):
-                tmp = line.split(' ')
-                delegator_address = Parser._remove_symbols(tmp[2])
-                validator_address = Parser._remove_symbols(tmp[4])
-             
-            elif line.strip().startswith('Remaining active') and (
-                    delegator_address is not None and validator_address is not None):
-                tmp = line.strip().split(' ')
-                epoch = Parser._remove_symbols(tmp[5])
-                amount = Parser._remove_symbols(tmp[7])
-                bonds.append((delegator_address, validator_address, int(epoch), int(amount)))
-            elif line.strip().startswith('Self-bonds'):
-                delegator_address = None
-                validator_address = None
-
-        return bonds
+        return Parser.parse_client_bonds(output).delegations
+
+    @staticmethod
+    def parse_client_all_withdrawals(output: str) -> List[Tuple[str, str, int, int, int]]:
+        return Parser.parse_client_bonds(output).withdrawals
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def parse_client_bonds(output: str) -> BondsDump:
+        # Init reads both the delegations and the withdrawals from the same dump, it is only scanned once
+        section, delegator_address, validator_address = None, None, None
+        delegations, withdrawals = [], []
+        for (delegator, validator, bond_epoch, bond_amount, self_bonds, unbond_delegator, unbond_validator,
+             withdraw_epoch, active_epoch, withdraw_amount) in BONDS_RE.findall(output):
+            if delegator:
+                section = 'bonds'
+                delegator_address, validator_address = Parser._remove_symbols(delegator), Parser._remove_symbols(
+                    validator)
+            elif unbond_delegator:
+                section = 'unbonds'
+                delegator_address = Parser._remove_symbols(unbond_delegator)
+                validator_address = Parser._remove_symbols(unbond_validator) or None
+            elif self_bonds:
+                section = None
+            elif validator_address is None:
+                continue
+            elif bond_epoch and section == 'bonds':
+                delegations.append((delegator_address, validator_address, Parser._to_int(bond_epoch),
+                                    Parser._to_int(bond_amount)))
+            elif withdraw_epoch and section == 'unbonds':
+                withdrawals.append((delegator_address, validator_address, Parser._to_int(withdraw_epoch),
+                                    Parser._to_int(active_epoch), Parser._to_int(withdraw_amount)))
+        return BondsDump(delegations, withdrawals)
 
     @staticmethod
     def parse_client_withdrawals(output: str, validator_address: str) -> List[Tuple[str, str, int, int, int]]:
+        # bonds of a single (owner, validator) pair, the validator is not printed
         delegator_address = None
-        # validator_address = None
         withdrawals = []
-        for line in output.splitlines()[2:]:
-            if line.strip().startswith('Unbonded delegations'):
-                tmp = line.split(' ')
-                delegator_address = Parser._remove_symbols(tmp[3])
-            #     validator_address = Parser._remove_symbols(tmp[4])
-            elif line.strip().startswith('Withdrawable from') and (
-                    delegator_address is not None):
-                tmp = line.strip().split()
-                epoch = Parser._remove_symbols(tmp[3])
-                epoch_active = Parser._remove_symbols(tmp[6])
-                amount = Parser._remove_symbols(tmp[8])
-                withdrawals.append((
-                    delegator_address, validator_address, epoch, epoch_active, amount
-                ))
-
+        for groups in BONDS_RE.findall(output):
+            unbond_delegator, withdraw_epoch, active_epoch, withdraw_amount = groups[5], *groups[7:]
+            if unbond_delegator:
+                delegator_address = Parser._remove_symbols(unbond_delegator)
+            elif withdraw_epoch and delegator_address is not None:
+                withdrawals.append((delegator_address, validator_address, Parser._to_int(withdraw_epoch),
+                                    Parser._to_int(active_epoch), Parser._to_int(withdraw_amount)))
         return withdrawals
 
-
     @staticmethod
     def parse_client_proposals(output: str) -> List[Tuple[int, str, int, int, str]]:
-        proposals = []
-        output = output.splitlines()[3:]
-        for index, line in enumerate(output[::5]):
-            proposal_id = int(line.split(': ')[1])
-            status = output[4 + index * 5].split(': ')[1].strip()
-            author = output[1 + index * 5].split(': ')[1].strip()
-            start_epoch = int(output[2 + index * 5].split(': ')[1].strip())
-            end_epoch = int(output[3 + index * 5].split(': ')[1].strip())
-            proposals.append((proposal_id, author, start_epoch, end_epoch, status))
+        start = 0
+        for _ in range(3):
+            start = output.find('\n', start) + 1
+        if start == 0:
+            return []
+        return [(int(match.group('id')), match.group('author').strip(), int(match.group('start')),
+                 int(match.group('end')), match.group('status').strip())
+                for match in PROPOSAL_RE.finditer(output, start)]
 
-        return proposals
+    @staticmethod
+    def parse_epoch_from_tx_execution(output: str) -> Optional[int]:
+        match = EPOCH_RE.search(output)
+        return int(match.group('epoch')) if match else None
 
     @staticmethod
-    def parse_epoch_from_tx_execution(output: str) -> int:
-        for line in output.splitlines():
-            if line.strip().startswith('Last committed epoch'):
-                return int(line.split(': ')[1])
-        # very unsafe but it should never happen
-        return None
+    def parse_withdrawal_from_unbond_tx(output: str) -> List[Tuple[int, int]]:
+        return [(int(epoch), int(amount)) for amount, epoch in UNBOND_RE.findall(output)]
 
     @staticmethod
-    def _remove_symbols(string: str):
-        return ''.join(c for c in string if c.isalnum())
+    @lru_cache(maxsize=1024)
+    def parse_tx(stdout: str, stderr: str) -> TxOutput:
+        # the outcome and everything a task reads from a tx output, cached as the engine and complete() both ask
+        return TxOutput(Parser._is_tx_valid(stdout, stderr), Parser.parse_epoch_from_tx_execution(stdout),
+                        Parser._search(TX_HASH_RE, 'hash', stdout), Parser._search(GAS_RE, 'gas', stdout, int),
+                        Parser.parse_withdrawal_from_unbond_tx(stdout))
 
     @staticmethod
-    def parse_withdrawal_from_unbond_tx(output: str) -> List[Tuple[int, int]]:
-        withdrawals = []
-        for line in output.splitlines():
-            if 'withdrawable starting from epoch' in line.strip():
-                tmp = line.strip().split()
-                amount = int(tmp[1])
-                epoch = int(Parser._remove_symbols(tmp[-1]))
-                withdrawals.append((epoch, amount))
+    def _is_tx_valid(stdout: str, stderr: str) -> bool:
+        # errors that show up on stderr but aren't a failed tx: not enough gas and a temporary bug
+        if len(stderr) > 0 and NOT_ENOUGH_BALANCE not in stderr and SKIPPING_KEY not in stderr:
+            return False
+        stdout_markers = set(TX_MARKERS_RE.findall(stdout))
+        markers = stdout_markers.union(TX_MARKERS_RE.findall(stderr))
+        if VALID_TRANSACTION_OUTPUT in stdout_markers:
+            return True
+        return INVALID_TRANSACTION_OUTPUT not in markers and INVALID_TRANSACTION_EXECUTION_OUTPUT not in markers
 
-        return withdrawals
+    @staticmethod
+    def _to_int(string: str) -> int:
+        return int(Parser._remove_symbols(string))
+
+    @staticmethod
+    def _search(pattern: re.Pattern, group: str, output: str, convert=str):
+        match = pattern.search(output)
+        return convert(match.group(group)) if match else None
+
+    @staticmethod
+    def _remove_symbols(string: str) -> str:
+        # most values are already clean, isalnum is much cheaper than a substitution
+        return string if string.isalnum() else SYMBOLS_RE.sub('', string)
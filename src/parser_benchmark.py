@@ -0,0 +1,98 @@
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from src.output_parser import Parser
+
+VALID_TX_OUTPUT = "Transaction is valid.\nTransaction hash: {}\nGas used: 24\nLast committed epoch: 12\n" \
+                  "Amount 5 withdrawable starting from epoch 15."
+
+
+def address_list_output(accounts: int) -> str:
+    return "Known addresses:\n" + ''.join(['  "lt-account-abc-def-ghi-{0:06d}-1": Established: atest1{0:074d}\n'.format(i)
+                                          for i in range(accounts)])
+
+
+def validators_output(validators: int) -> str:
+    return "Last committed epoch: 12\nConsensus validators:\n" + \
+        ''.join(['  atest1v{:073d}: 1000\n'.format(i) for i in range(validators)]) + "Total bonded stake: 3000\n"
+
+
+def balance_output(tokens: int) -> str:
+    return "Last committed epoch: 12\n" + ''.join(['Token T{0}\n  Balance owned by atest1: {1}\n'.format(i, 1000 + i)
+                                                   for i in range(tokens)])
+
+
+def bonds_output(delegators: int, validators: int = 10) -> str:
+    lines = ["Last committed epoch: 12", ""]
+    for validator in range(validators):
+        lines.append("Self-bonds from atest1v{0:073d}:".format(validator))
+        lines.append("  Remaining active bond from epoch 0: Δ 100000")
+        for delegator in range(delegators):
+            address = "atest1d{:073d}".format(delegator)
+            lines.append("Delegations from {} to atest1v{:073d}:".format(address, validator))
+            lines.append("  Remaining active bond from epoch {}: Δ {}".format(delegator % 20, 10 + delegator % 7))
+            lines.append("Unbonded delegations from {} to atest1v{:073d}:".format(address, validator))
+            lines.append("  Withdrawable from epoch {} (active from {}): Δ {}".format(delegator % 30, delegator % 25,
+                                                                                   5 + delegator % 3))
+    return '\n'.join(lines) + '\n'
+
+
+def proposals_output(proposals: int) -> str:
+    return "Last committed epoch: 12\nProposals:\n\n" + ''.join([
+        "Proposal Id: {0}\n  Author: atest1{0:074d}\n  Start Epoch: {1}\n  End Epoch: {2}\n  Status: pending\n".format(
+            i, i % 40, i % 40 + 9) for i in range(proposals)])
+
+
+# kind -> (output builder over a size, parser)
+BENCHMARKS: Dict[str, Tuple[Callable[[int], str], Callable[[str], object]]] = {
+    'address_list': (address_list_output, Parser.parse_wallet_address_list),
+    'validators': (validators_output, Parser.parse_client_validators),
+    'balance': (balance_output, Parser.parse_client_balance_owner),
+    # the cache would hide the parsing cost after the first round
+    'bonds': (bonds_output, Parser.parse_client_bonds.__wrapped__),
+    'proposals': (proposals_output, Parser.parse_client_proposals),
+    'tx': (lambda size: VALID_TX_OUTPUT.format('A' * 64), lambda output: Parser.parse_tx.__wrapped__(output, '')),
+}
+
+
+def load_outputs(directory: str, size: int) -> Dict[str, str]:
+    # recorded outputs are named after the benchmark, e.g. bonds.txt, the others are generated
+    outputs = {kind: builder(size) for kind, (builder, _) in BENCHMARKS.items()}
+    if directory:
+        for kind in BENCHMARKS.keys():
+            path = os.path.join(directory, '{}.txt'.format(kind))
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    outputs[kind] = f.read()
+    return outputs
+
+
+def run(outputs: Dict[str, str], kinds: List[str], rounds: int) -> List[str]:
+    lines = []
+    for kind in kinds:
+        output, parse = outputs[kind], BENCHMARKS[kind][1]
+        parse(output)
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            parse(output)
+        elapsed = (time.perf_counter() - start_time) / rounds
+        lines.append("{:<13} {:>10} bytes {:>10.3f} ms {:>8.1f} MB/s".format(
+            kind, len(output), elapsed * 1000, len(output) / elapsed / 1024 / 1024))
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the namada output parsers.')
+    parser.add_argument("-d", "--outputs", type=str, action='store', default=None,
+                        help='Directory of recorded outputs (<benchmark>.txt), generated when missing.')
+    parser.add_argument("-n", "--size", type=int, action='store', default=1000,
+                        help='Accounts, delegators or proposals in the generated outputs.')
+    parser.add_argument("-r", "--rounds", type=int, action='store', default=20, help='Runs per benchmark.')
+    parser.add_argument("-b", "--benchmarks", nargs='*', action='store', default=list(BENCHMARKS.keys()),
+                        help='Space separated list of benchmarks ({}).'.format(', '.join(BENCHMARKS.keys())))
+    args = parser.parse_args()
+
+    for line in run(load_outputs(args.outputs, args.size), args.benchmarks, args.rounds):
+        print(line)
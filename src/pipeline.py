@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Deque, Dict, FrozenSet, List, Optional, Tuple
+
+from src.constants import MAX_UNBOND_AMOUNT
+from src.workload import TaskSampler
+
+# tasks that can only go through once an earlier tx has matured, one follow-up each
+FOLLOW_UPS = ['Unbond', 'Withdraw']
+
+
+@dataclass
+class LifecyclePipeline:
+    # share of the dispatches that go to follow-ups when some are due, the rest follows the mix
+    follow_up_share: float = 0.5
+    epoch: Optional[int] = field(init=False, default=None)
+    # (epoch it becomes valid at, sequence, task name), not due yet
+    queue: List[Tuple[int, int, str]] = field(init=False, default_factory=list)
+    # task name -> epochs of the follow-ups that are valid now, oldest first
+    due: Dict[str, Deque[int]] = field(init=False, default_factory=lambda: {name: deque() for name in FOLLOW_UPS})
+    # matured delegations still in the store, the due Unbonds and those in flight
+    bonded: int = field(init=False, default=0)
+    # voting windows of the proposals, (start epoch, end epoch)
+    windows: List[Tuple[int, int]] = field(init=False, default_factory=list)
+    sequence: itertools.count = field(init=False, default_factory=itertools.count)
+    samplers: Dict[Tuple[int, FrozenSet[str]], Optional[TaskSampler]] = field(init=False, default_factory=dict)
+    lock: Lock = field(init=False, default_factory=Lock)
+    dispatched: int = field(init=False, default=0)
+    fired: int = field(init=False, default=0)
+    redirected: int = field(init=False, default=0)
+
+    @staticmethod
+    def from_config(data: Dict) -> 'LifecyclePipeline':
+        return LifecyclePipeline(float(data.get('follow_up_share', 0.5)))
+
+    def load(self, state: Dict[str, List[Dict]], epoch: int):
+        # the delegations, withdrawals and proposals found by Init
+        for delegation in state['delegations']:
+            if delegation['amount'] < MAX_UNBOND_AMOUNT:
+                self.follow_up('Unbond', delegation['epoch'])
+        for withdrawal in state['withdrawals']:
+            self.follow_up('Withdraw', withdrawal['epoch'])
+        for proposal in state['proposals']:
+            self.follow_up('VoteProposal', proposal['voting_start_epoch'], proposal['voting_end_epoch'])
+        self.observe(epoch)
+
+    def follow_up(self, task_name: str, epoch: int, until: Optional[int] = None):
+        with self.lock:
+            if until is not None:
+                self.windows.append((epoch, until))
+            else:
+                heapq.heappush(self.queue, (epoch, next(self.sequence), task_name))
+                self._promote()
+
+    def discard(self, task_name: str, count: int):
+        # a single tx settled several follow-ups, e.g. a withdraw of every withdrawable unbond of a pair
+        with self.lock:
+            for _ in range(min(count, len(self.due[task_name]))):
+                self.due[task_name].popleft()
+
+    def observe(self, epoch: Optional[int]):
+        if epoch is None:
+            return
+        with self.lock:
+            if self.epoch is None or epoch > self.epoch:
+                self.epoch = epoch
+                self._promote()
+                # the store still lets a proposal be voted one epoch after its end
+                self.windows = [(start, end) for start, end in self.windows if end >= epoch - 1]
+
+    def route(self, sampler: TaskSampler, r: random.Random) -> str:
+        with self.lock:
+            self.dispatched += 1
+            due = [name for name in FOLLOW_UPS if self._is_eligible(name, sampler)]
+            if due and self.fired < self.follow_up_share * self.dispatched:
+                # the follow-up that has been valid the longest goes first
+                task_name = min(due, key=lambda name: self.due[name][0])
+                self.due[task_name].popleft()
+                self.fired += 1
+                return task_name
+
+            task_name = sampler.pick(r)
+            if not self._is_eligible(task_name, sampler):
+                # send the budget to work that can go through instead of a skipped pick
+                ineligible = frozenset([name for name in sampler.task_types if not self._is_eligible(name, sampler)])
+                eligible_sampler = self._sampler_without(sampler, ineligible)
+                if eligible_sampler is not None:
+                    task_name = eligible_sampler.pick(r)
+                    self.redirected += 1
+            if task_name in FOLLOW_UPS and self.due[task_name]:
+                self.due[task_name].popleft()
+            return task_name
+
+    def settle(self, task_name: str, outcome: str):
+        if task_name not in FOLLOW_UPS:
+            return
+        with self.lock:
+            if outcome == 'failed':
+                # the state of a failed tx is still there
+                self.due[task_name].appendleft(self.epoch if self.epoch is not None else 0)
+                return
+            if task_name == 'Unbond':
+                self.bonded = max(self.bonded - 1, 0)
+            if outcome == 'skipped':
+                # e.g. every signer was busy, tried again from the next epoch, a follow-up that isn't valid anymore
+                # costs one pick per epoch instead of looping
+                epoch = self.epoch if self.epoch is not None else 0
+                heapq.heappush(self.queue, (epoch + 1, next(self.sequence), task_name))
+
+    def pending(self) -> int:
+        with self.lock:
+            return len(self.queue) + sum([len(epochs) for epochs in self.due.values()])
+
+    def _is_eligible(self, task_name: str, sampler: TaskSampler) -> bool:
+        if task_name == 'Unbond' and self.bonded <= 1 and 'VoteProposal' in sampler.task_types and self._is_votable():
+            # the last matured delegation is kept for the votes while a proposal can be voted
+            return False
+        if task_name in FOLLOW_UPS:
+            return len(self.due[task_name]) > 0
+        if task_name == 'VoteProposal':
+            # votes are signed by an account with a matured delegation
+            return self.bonded > 0 and self._is_votable()
+        return True
+
+    def _is_votable(self) -> bool:
+        return self.epoch is not None and any([start <= self.epoch <= end + 1 for start, end in self.windows])
+
+    def _promote(self):
+        while self.queue and self.epoch is not None and self.queue[0][0] <= self.epoch:
+            epoch, _, task_name = heapq.heappop(self.queue)
+            self.due[task_name].append(epoch)
+            if task_name == 'Unbond':
+                self.bonded += 1
+
+    def _sampler_without(self, sampler: TaskSampler, excluded: FrozenSet[str]) -> Optional[TaskSampler]:
+        key = (id(sampler), excluded)
+        if key not in self.samplers:
+            kept = [(name, probability) for name, probability in zip(sampler.task_types, sampler.probabilities)
+                    if name not in excluded and probability > 0]
+            self.samplers[key] = TaskSampler([name for name, _ in kept],
+                                             [probability for _, probability in kept]) if kept else None
+        return self.samplers[key]
@@ -0,0 +1,166 @@
+import fcntl
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from src.constants import ACCOUNT_FORMAT
+from src.task import Task
+
+# one lock file per treasury, shared by the seeds funding from it, in threads or processes
+TREASURY_LOCK_PATH = 'locks/treasury-{}.lock'
+
+
+@dataclass
+class Provisioner:
+    # runs the wallet and client commands of the Init task it is attached to
+    task: Task
+    generate_alias: Callable[[int], str]
+    accounts: int = 5
+    # accounts initialized between two progress logs
+    progress_interval: int = 50
+    # funding transfers in flight at once, from different sources
+    workers: int = 8
+    # wallet alias the initial funds come from, no funding without it, {seed} gives each seed its own
+    treasury: str = ''
+    amount: int = 0
+    tokens: List[str] = field(default_factory=lambda: ['NAM'])
+    # accounts funded by the treasury and by each funded account in turn
+    fanout: int = 4
+
+    @staticmethod
+    def from_config(task: Task, generate_alias: Callable[[int], str], data: Dict,
+                    min_accounts: int) -> 'Provisioner':
+        funding = data.get('funding', {})
+        return Provisioner(task, generate_alias, max(int(data.get('accounts', min_accounts)), min_accounts),
+                           int(data.get('progress_interval', 50)), int(data.get('workers', 8)),
+                           funding.get('treasury', '').format(seed=task.seed),
+                           int(funding.get('amount', 0)), funding.get('tokens', ['NAM']),
+                           int(funding.get('fanout', 4)))
+
+    def provision(self, aliases: List[str], addresses: List[str], ledger_address: str):
+        # the accounts already in the wallet are kept, only the missing ones are created
+        missing = self.accounts - len(aliases)
+        if missing <= 0:
+            return
+        # keys left without an account by an interrupted run are initialized before generating new ones
+        keys = self._orphan_keys()[:missing]
+        logging.info("Provisioning {} accounts ({} existing, {} keys to reuse)...".format(self.accounts, len(aliases),
+                                                                                     len(keys)))
+        if len(keys) < missing:
+            keys.extend(self._generate_keys(missing - len(keys)))
+
+        failed = 0
+        # init-account writes the alias of the new account, the wallet file is only written by one command at a time
+        for index, key in enumerate(keys, 1):
+            is_successful, stdout, stderr = self.task.execute_command(
+                self.task.client.init_account(key, ledger_address))
+            if not is_successful:
+                logging.debug(stderr)
+                failed += 1
+            else:
+                alias, address = self.task.parser.parse_client_init_account(stdout)
+                aliases.append(alias)
+                addresses.append(address)
+            if index % self.progress_interval == 0 or index == len(keys):
+                logging.info("Provisioned {}/{} accounts".format(len(aliases), self.accounts))
+        if failed:
+            logging.warning("Can't init {} accounts, their keys are reused on the next run".format(failed))
+
+    def fund(self, aliases: List[str], balances: Dict[str, Dict[str, int]], ledger_address: str) -> List[str]:
+        if not self.treasury or self.amount <= 0:
+            return []
+        funded = set()
+        for token in self.tokens:
+            targets = [alias for alias in aliases if balances[alias].get(token, 0) < self.amount]
+            if targets:
+                funded.update(self._fund_tree(targets, token, ledger_address))
+        return sorted(funded)
+
+    def _fund_tree(self, targets: List[str], token: str, ledger_address: str) -> List[str]:
+        # heap layout: the treasury funds targets[:fanout] and targets[i] funds the fanout targets starting at
+        # (i + 1) * fanout, each transfer carries the funds of the whole subtree below its target
+        sizes = [1] * len(targets)
+        for index in reversed(range(self.fanout, len(targets))):
+            sizes[index // self.fanout - 1] += sizes[index]
+
+        funded = []
+        wave = {self.treasury: list(range(min(self.fanout, len(targets))))}
+        level = 0
+        while wave:
+            transfers = sum([len(children) for children in wave.values()])
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                # the transfers of one source are sent one after the other, concurrent txs of a signer collide
+                results = list(executor.map(lambda item: self._fund_children(item[0], item[1], targets, sizes, token,
+                                                                             ledger_address), wave.items()))
+            wave = {}
+            for succeeded in results:
+                for index in succeeded:
+                    funded.append(targets[index])
+                    children = list(range((index + 1) * self.fanout, min((index + 2) * self.fanout, len(targets))))
+                    if children:
+                        wave[targets[index]] = children
+            logging.info("Funding {} - level {}: {}/{} transfers, {}/{} accounts funded".format(
+                token, level, sum([len(succeeded) for succeeded in results]), transfers, len(funded), len(targets)))
+            level += 1
+
+        if len(funded) < len(targets):
+            logging.warning("Can't fund {} of {} accounts with {}".format(len(targets) - len(funded), len(targets),
+                                                                         token))
+        return funded
+
+    def _fund_children(self, source: str, children: List[int], targets: List[str], sizes: List[int], token: str,
+                       ledger_address: str) -> List[int]:
+        succeeded = []
+        with self._source_lock(source):
+            for index in children:
+                command = self.task.client.transfer(source, targets[index], token, self.amount * sizes[index],
+                                                    ledger_address)
+                is_successful, stdout, stderr = self.task.execute_command(command)
+                if is_successful:
+                    succeeded.append(index)
+                else:
+                    logging.debug(stderr)
+        return succeeded
+
+    @contextmanager
+    def _source_lock(self, source: str):
+        # the seeds run their Inits in parallel, the transfers of a treasury they share are sent one seed at a time
+        if source != self.treasury:
+            yield
+            return
+        lock_path = TREASURY_LOCK_PATH.format(source)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _orphan_keys(self) -> List[str]:
+        is_successful, stdout, _stderr = self.task.execute_command(self.task.wallet.address_list())
+        if not is_successful:
+            raise Exception("Can't list wallet addresses.")
+        all_aliases = set(self.task.parser.parse_wallet_address_list(stdout)[0])
+        return sorted([alias for alias in all_aliases
+                       if alias.endswith('-{}'.format(self.task.seed)) and not alias.startswith(ACCOUNT_FORMAT)
+                       and '{}-{}'.format(ACCOUNT_FORMAT, alias) not in all_aliases])
+
+    def _generate_keys(self, count: int) -> List[str]:
+        new_aliases = set()
+        while len(new_aliases) < count:
+            new_aliases.add(self.generate_alias(self.task.seed))
+        new_aliases = sorted(new_aliases)
+
+        keys = []
+        for alias in new_aliases:
+            # like init-account, key gen rewrites the wallet file
+            is_successful, stdout, stderr = self.task.execute_command(self.task.wallet.generate_key(alias))
+            if not is_successful:
+                logging.debug(stderr)
+                continue
+            keys.append(self.task.parser.parse_wallet_gen_key(stdout))
+        if len(keys) < count:
+            logging.warning("Can't generate {} of {} keys".format(count - len(keys), count))
+        logging.info("Generated {} keys".format(len(keys)))
+        return keys
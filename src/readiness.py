@@ -0,0 +1,89 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.node_status import NodeStatus
+
+
+@dataclass
+class Readiness:
+    nodes: List[str]
+    # seconds before giving up on the nodes that are still not ready
+    deadline: float = 600
+    # nodes that must be ready to start, the others are dropped from the run
+    quorum: int = 1
+    timeout: float = 5
+    initial_backoff: float = 1
+    max_backoff: float = 15
+    statuses: Dict[str, Union[NodeStatus, Exception]] = field(init=False, default_factory=dict)
+    session: requests.Session = field(init=False)
+
+    def __post_init__(self):
+        if self.quorum > len(self.nodes):
+            raise Exception("Readiness quorum {} is larger than the {} nodes.".format(self.quorum, len(self.nodes)))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.nodes), pool_maxsize=len(self.nodes))
+        self.session.mount('http://', adapter)
+
+    @staticmethod
+    def from_config(nodes: List[str], data: Dict[str, Union[int, float]]) -> 'Readiness':
+        return Readiness(
+            nodes=nodes,
+            deadline=float(data.get('deadline', 600)),
+            quorum=int(data.get('quorum', 1)),
+            timeout=float(data.get('timeout', 5)),
+            initial_backoff=float(data.get('initial_backoff', 1)),
+            max_backoff=float(data.get('max_backoff', 15))
+        )
+
+    def wait(self) -> List[str]:
+        deadline = time.monotonic() + self.deadline
+        backoff = self.initial_backoff
+        with ThreadPoolExecutor(max_workers=len(self.nodes), thread_name_prefix='readiness') as executor:
+            while True:
+                pending = [node for node in self.nodes if not self.is_ready(node)]
+                # every pending node is probed at once, a dead node only costs its own timeout
+                for node, status in zip(pending, executor.map(self._probe, pending)):
+                    self.statuses[node] = status
+                self.report()
+
+                if all([self.is_ready(node) for node in self.nodes]) or time.monotonic() + backoff > deadline:
+                    break
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        ready = [node for node in self.nodes if self.is_ready(node)]
+        if len(ready) < self.quorum:
+            raise Exception("Only {} of {} nodes are ready, {} needed.".format(len(ready), len(self.nodes),
+                                                                            self.quorum))
+        for node in self.nodes:
+            if node not in ready:
+                logging.warning("readiness - Dropping node {} from the run".format(node))
+        return ready
+
+    def is_ready(self, node: str) -> bool:
+        status = self.statuses.get(node)
+        return isinstance(status, NodeStatus) and not status.catching_up
+
+    def report(self):
+        heights = [status.latest_block_height for status in self.statuses.values() if isinstance(status, NodeStatus)]
+        best_height = max(heights) if heights else 0
+        for node in self.nodes:
+            status = self.statuses.get(node)
+            if isinstance(status, NodeStatus):
+                logging.info("readiness - {}: {}, height {}, {} blocks behind".format(
+                    node, 'catching up' if status.catching_up else 'ready', status.latest_block_height,
+                    best_height - status.latest_block_height))
+            else:
+                logging.info("readiness - {}: unreachable ({})".format(node, status))
+
+    def _probe(self, node: str) -> Union[NodeStatus, Exception]:
+        try:
+            return NodeStatus.fetch(node, self.session, self.timeout)
+        except Exception as e:
+            return e
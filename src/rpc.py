@@ -0,0 +1,144 @@
+import base64
+import itertools
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from shutil import rmtree
+from threading import Lock
+from typing import Deque, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.task import TaskResult, TransactionTask
+
+BROADCAST_MODES = ['async', 'sync', 'commit']
+
+
+@dataclass
+class RpcClient:
+    pool_size: int = 32
+    timeout: float = 10
+    session: requests.Session = field(init=False)
+    ids: itertools.count = field(init=False, default_factory=itertools.count)
+
+    def __post_init__(self):
+        # one keep-alive pool per node, shared by every in-flight submission
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def call(self, node: str, method: str, params: Dict) -> Dict:
+        payload = {'jsonrpc': '2.0', 'id': next(self.ids), 'method': method, 'params': params}
+        response = self.session.post("http://{}".format(node), json=payload, timeout=self.timeout)
+        body = response.json()
+        if 'error' in body:
+            raise Exception("{} failed on {}: {}".format(method, node, body['error']))
+        return body['result']
+
+    def broadcast_tx(self, node: str, tx: bytes, mode: str = 'sync') -> Dict:
+        return self.call(node, 'broadcast_tx_{}'.format(mode), {'tx': base64.b64encode(tx).decode()})
+
+
+@dataclass
+class TxTemplates:
+    # signed txs exported ahead of the run, one folder per task type: <templates_dir>/<TaskName>/*.tx
+    templates_dir: str
+    templates: Dict[str, Deque[str]] = field(init=False, default_factory=dict)
+    lock: Lock = field(init=False, default_factory=Lock)
+
+    def __post_init__(self):
+        if not os.path.isdir(self.templates_dir):
+            raise Exception("Can't find tx templates folder {}.".format(self.templates_dir))
+        for task_name in sorted(os.listdir(self.templates_dir)):
+            task_folder = os.path.join(self.templates_dir, task_name)
+            if os.path.isdir(task_folder):
+                self.templates[task_name] = deque([os.path.join(task_folder, file_name)
+                                                   for file_name in sorted(os.listdir(task_folder))
+                                                   if file_name.endswith('.tx')])
+        logging.info("Loaded tx templates: {}".format(
+            ', '.join(['{} {}'.format(task_name, len(paths)) for task_name, paths in self.templates.items()])))
+
+    def take(self, task_name: str) -> Optional[str]:
+        # a signed tx can only be included once, each template is handed out a single time
+        with self.lock:
+            paths = self.templates.get(task_name)
+            return paths.popleft() if paths else None
+
+
+@dataclass
+class TxTemplateExporter:
+    # signs txs with the client before the run, into the folders read by TxTemplates
+    templates_dir: str
+    count: int
+    timeout: int = 130
+
+    def export(self, task: TransactionTask, ledger_address: str, current_epoch: Optional[int]) -> int:
+        task_folder = os.path.abspath(os.path.join(self.templates_dir, task.task_name))
+        # the templates of an earlier run were already included, the mempool would reject them
+        rmtree(task_folder, ignore_errors=True)
+        os.makedirs(task_folder)
+        for index in range(1, self.count + 1):
+            # like a corpus plan, assumed to go through so the next templates see its effect on the store
+            plan = task.plan(index, ledger_address, current_epoch)
+            if plan is None:
+                return index - 1
+            with tempfile.TemporaryDirectory(dir=task_folder) as dump_folder:
+                plan.write_files()
+                try:
+                    process = subprocess.run(task.client.dump_tx(plan.command, dump_folder), stdout=subprocess.PIPE,
+                                             stderr=subprocess.PIPE, text=True, cwd=task.base_diretory,
+                                             timeout=self.timeout)
+                finally:
+                    plan.remove_files()
+                dumped = [file_name for file_name in os.listdir(dump_folder) if file_name.endswith('.tx')]
+                if process.returncode != 0 or len(dumped) != 1:
+                    raise Exception("Can't export a {} template: {}".format(task.task_name,
+                                                                           process.stderr or process.stdout))
+                # named by index, the templates are sent in the order they were planned
+                os.replace(os.path.join(dump_folder, dumped[0]), os.path.join(task_folder, '{:06d}.tx'.format(index)))
+        return self.count
+
+
+@dataclass
+class RpcSubmitter:
+    client: RpcClient
+    templates: TxTemplates
+    mode: str = 'sync'
+
+    def __post_init__(self):
+        if self.mode not in BROADCAST_MODES:
+            raise Exception("Unknown broadcast mode {}, expected one of {}.".format(self.mode,
+                                                                                   ', '.join(BROADCAST_MODES)))
+
+    def submit(self, task_name: str, step_index: int, seed: int, ledger_address: str) -> Optional[TaskResult]:
+        # None when no template is left for this task type, the caller falls back to the namada client
+        template_path = self.templates.take(task_name)
+        if template_path is None:
+            return None
+
+        with open(template_path, "rb") as f:
+            tx = f.read()
+
+        command = "broadcast_tx_{} {} {}".format(self.mode, ledger_address, template_path)
+        start_time = time.time()
+        try:
+            result = self.client.broadcast_tx(ledger_address, tx, self.mode)
+        except Exception as e:
+            return TaskResult(task_name, command, "", str(e), step_index, seed)
+        # commit only answers once the tx is in a block
+        phases = {'inclusion' if self.mode == 'commit' else 'submit': time.time() - start_time}
+
+        stdout = json.dumps(result, sort_keys=True)
+        # commit mode reports the check and the deliver results separately
+        codes = [result.get('code', 0)] + [result[key].get('code', 0) for key in ['check_tx', 'deliver_tx']
+                                           if key in result]
+        stderr = "" if all([code == 0 for code in codes]) else result.get('log', stdout)
+        return TaskResult(task_name, command, stdout, stderr, step_index, seed).set_phases(phases).set_submission(
+            result.get('hash'), start_time)
@@ -0,0 +1,181 @@
+import math
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from src.histogram import Histogram
+from src.manager import ManagerResult
+
+
+@dataclass
+class Slo:
+    min_success_rate: float = 0.95
+    # p99 of the whole task, milliseconds
+    max_p99_ms: Optional[float] = None
+    # p99 from the submission to the block, needs an inclusion block, milliseconds
+    max_inclusion_p99_ms: Optional[float] = None
+    # sent over offered tx/s, below it the load tester can't keep the rate up
+    min_achieved_ratio: float = 0.9
+
+    @staticmethod
+    def from_config(data: Dict) -> 'Slo':
+        return Slo(float(data.get('min_success_rate', 0.95)), data.get('max_p99_ms', None),
+                   data.get('max_inclusion_p99_ms', None), float(data.get('min_achieved_ratio', 0.9)))
+
+
+@dataclass
+class Probe:
+    # offered tx/s, over every seed
+    rate: float
+    achieved_rate: float
+    succeeded: int
+    failed: int
+    skipped: int
+    success_rate: Optional[float]
+    p99_ms: Optional[float]
+    inclusion_p99_ms: Optional[float]
+    late: int
+    dropped: int
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.violations
+
+
+def _sum_phase(results: List[ManagerResult], phase: str) -> Histogram:
+    merged = Histogram()
+    for result in results:
+        for phases in result.latencies.values():
+            if phase in phases:
+                merged.merge(phases[phase])
+    return merged
+
+
+def _sum_outcome(results: List[ManagerResult], outcome: str) -> int:
+    return sum([sum([stats[outcome] for stats in result.stats.values()]) for result in results])
+
+
+@dataclass
+class SaturationSearch:
+    # every probe sends at a constant rate: doubled while the SLOs hold, then bisected between the highest rate that
+    # held and the lowest one that didn't
+    slo: Slo
+    start_rate: float = 1
+    max_rate: float = 1000
+    step_factor: float = 2
+    # seconds measured per probe, after settle seconds that aren't
+    step_duration: float = 60
+    settle: float = 10
+    # tx/s, the search stops once the knee is known this precisely
+    resolution: float = 1
+    max_probes: int = 12
+    # per seed
+    max_in_flight: int = 200
+    probes: List[Probe] = field(init=False, default_factory=list)
+    passed: Optional[float] = field(init=False, default=None)
+    failed: Optional[float] = field(init=False, default=None)
+
+    def __post_init__(self):
+        if self.start_rate <= 0 or self.max_rate < self.start_rate:
+            raise Exception("Saturation rates must be positive, with start_rate <= max_rate.")
+        if self.step_factor <= 1:
+            raise Exception("Saturation step_factor must be above 1.")
+
+    @staticmethod
+    def from_config(data: Dict) -> 'SaturationSearch':
+        return SaturationSearch(Slo.from_config(data.get('slo', {})), float(data.get('start_rate', 1)),
+                                float(data.get('max_rate', 1000)), float(data.get('step_factor', 2)),
+                                float(data.get('step_duration', 60)), float(data.get('settle', 10)),
+                                float(data.get('resolution', 1)), int(data.get('max_probes', 12)),
+                                int(data.get('max_in_flight', 200)))
+
+    def next_rate(self) -> Optional[float]:
+        # None once the search is over
+        if len(self.probes) >= self.max_probes:
+            return None
+        if not self.probes:
+            return self.start_rate
+        if self.failed is None:
+            return None if self.passed >= self.max_rate else min(self.passed * self.step_factor, self.max_rate)
+        if self.passed is None:
+            rate = self.failed / self.step_factor
+            return None if rate < self.resolution else rate
+        if self.failed - self.passed <= self.resolution:
+            return None
+        return (self.passed + self.failed) / 2
+
+    def scheduler(self, rate: float, seeds: int) -> Dict:
+        return {'rate': rate / seeds, 'duration': self.settle + self.step_duration,
+                'max_in_flight': self.max_in_flight}
+
+    def measure(self, rate: float, window_start: float, before: List[ManagerResult],
+                after: List[ManagerResult]) -> Probe:
+        # only what was sent between the end of the settle time and the end of the probe counts, in whole seconds
+        # as the send timeline is
+        first, last = math.ceil(window_start), math.floor(window_start + self.step_duration)
+        seeds_before = {result.seed: result for result in before}
+        sent = sum([count for result in after for second, count in result.sent.items() if first <= second < last])
+        succeeded = _sum_outcome(after, 'succeeded') - _sum_outcome(before, 'succeeded')
+        failed = _sum_outcome(after, 'failed') - _sum_outcome(before, 'failed')
+        skipped = _sum_outcome(after, 'skipped') - _sum_outcome(before, 'skipped')
+        total = _sum_phase(after, 'total').subtract(_sum_phase(before, 'total'))
+        inclusion = _sum_phase(after, 'submit_to_block').subtract(_sum_phase(before, 'submit_to_block'))
+        probe = Probe(
+            rate=round(rate, 3),
+            achieved_rate=round(sent / max(last - first, 1), 3),
+            succeeded=succeeded, failed=failed, skipped=skipped,
+            success_rate=None if succeeded + failed == 0 else round(succeeded / (succeeded + failed), 4),
+            p99_ms=total.percentile(99),
+            inclusion_p99_ms=inclusion.percentile(99),
+            late=sum([result.late - seeds_before[result.seed].late for result in after]),
+            dropped=sum([result.dropped - seeds_before[result.seed].dropped for result in after]))
+        probe.violations = self._violations(probe)
+        return probe
+
+    def record(self, probe: Probe):
+        self.probes.append(probe)
+        if probe.passed:
+            self.passed = probe.rate if self.passed is None else max(self.passed, probe.rate)
+        else:
+            self.failed = probe.rate if self.failed is None else min(self.failed, probe.rate)
+
+    def report(self) -> Dict:
+        knee = [probe for probe in self.probes if probe.passed and probe.rate == self.passed]
+        above = [probe for probe in self.probes if not probe.passed and probe.rate == self.failed]
+        return {'knee_rate': self.passed,
+                'knee': asdict(knee[0]) if knee else None,
+                # what broke first above the knee
+                'limited_by': above[0].violations if above else None,
+                'slo': asdict(self.slo),
+                'probes': [dict(asdict(probe), passed=probe.passed) for probe in self.probes]}
+
+    def _violations(self, probe: Probe) -> List[str]:
+        violations = []
+        if probe.success_rate is None:
+            violations.append('no_txs')
+        elif probe.success_rate < self.slo.min_success_rate:
+            violations.append('success_rate')
+        if self.slo.max_p99_ms is not None and probe.p99_ms is not None and probe.p99_ms > self.slo.max_p99_ms:
+            violations.append('p99')
+        if self.slo.max_inclusion_p99_ms is not None and (probe.inclusion_p99_ms is None or
+                                                          probe.inclusion_p99_ms > self.slo.max_inclusion_p99_ms):
+            violations.append('inclusion_p99')
+        if probe.achieved_rate < self.slo.min_achieved_ratio * probe.rate:
+            violations.append('achieved_rate')
+        return violations
+
+
+def format_report(report: Dict) -> List[str]:
+    lines = ["- {:>10} {:>10} {:>8} {:>10} {:>14} {:>8}  {}".format(
+        'offered', 'achieved', 'success', 'p99 (ms)', 'inclusion p99', 'dropped', 'violations')]
+    for probe in report['probes']:
+        lines.append("- {:>10} {:>10} {:>8} {:>10} {:>14} {:>8}  {}".format(
+            probe['rate'], probe['achieved_rate'], str(probe['success_rate']), str(probe['p99_ms']),
+            str(probe['inclusion_p99_ms']), probe['dropped'], ', '.join(probe['violations']) or 'ok'))
+    if report['knee_rate'] is None:
+        lines.append("- No rate held the SLOs.")
+    else:
+        lines.append("- Max sustainable rate: {} tx/s{}".format(
+            report['knee_rate'], ', limited by {} above it'.format(', '.join(report['limited_by']))
+            if report['limited_by'] else ''))
+    return lines
@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+PROFILES = ['constant', 'step', 'spike']
+
+
+@dataclass
+class Scheduler:
+    rate: float
+    ramp_up: float = 0
+    profile: str = 'constant'
+    steps: List[Dict[str, float]] = field(default_factory=list)
+    spike: Dict[str, float] = field(default_factory=dict)
+    max_in_flight: int = 50
+    late_threshold: float = 0.05
+    duration: Optional[float] = None
+
+    def __post_init__(self):
+        if self.profile not in PROFILES:
+            raise Exception("Unknown scheduler profile {}, expected one of {}.".format(self.profile, ', '.join(PROFILES)))
+        if self.rate <= 0:
+            raise Exception("Scheduler rate must be positive.")
+        if any(step['rate'] <= 0 for step in self.steps) or self.spike.get('rate', 1) <= 0:
+            raise Exception("Scheduler step and spike rates must be positive.")
+        if self.max_in_flight <= 0:
+            raise Exception("Scheduler max_in_flight must be positive.")
+        self.steps = sorted(self.steps, key=lambda step: step['after'])
+
+    @staticmethod
+    def from_config(data: Dict[str, Union[str, int, float, List, Dict]]) -> 'Scheduler':
+        return Scheduler(
+            rate=float(data['rate']),
+            ramp_up=float(data.get('ramp_up', 0)),
+            profile=data.get('profile', 'constant'),
+            steps=data.get('steps', []),
+            spike=data.get('spike', {}),
+            max_in_flight=int(data.get('max_in_flight', 50)),
+            late_threshold=float(data.get('late_threshold', 0.05)),
+            duration=data.get('duration', None)
+        )
+
+    def rate_at(self, elapsed: float) -> float:
+        rate = self.rate
+        if self.profile == 'step':
+            for step in self.steps:
+                if elapsed >= step['after']:
+                    rate = step['rate']
+        elif self.profile == 'spike' and self.spike:
+            if self.spike['after'] <= elapsed < self.spike['after'] + self.spike['duration']:
+                rate = self.spike['rate']
+
+        if self.ramp_up > 0 and elapsed < self.ramp_up:
+            # never go fully to zero, otherwise the first dispatch would never be scheduled
+            rate = rate * max(elapsed / self.ramp_up, 0.01)
+        return rate
+
+    def next_offset(self, offset: float) -> float:
+        return offset + 1 / self.rate_at(offset)
+
+    def is_over(self, offset: float) -> bool:
+        return self.duration is not None and offset >= self.duration
@@ -0,0 +1,40 @@
+import datetime
+import json
+import os
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from src.node_status import NodeStatus
+from src.store import Store
+
+SNAPSHOT_PATH = 'snapshots/{}.json'
+
+
+@dataclass
+class Snapshot:
+    seed: int
+    chain_id: str
+    block_height: int
+    created_at: str
+    state: Dict[str, List[Dict]]
+
+    @staticmethod
+    def capture(store: Store, seed: int, node_status: NodeStatus) -> 'Snapshot':
+        return Snapshot(seed, node_status.chain_id, node_status.latest_block_height,
+                        datetime.datetime.now().replace(microsecond=0).isoformat(), store.export(seed))
+
+    @staticmethod
+    def load(seed: int) -> Optional['Snapshot']:
+        file_path = SNAPSHOT_PATH.format(seed)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r") as f:
+            return Snapshot(**json.load(f))
+
+    def dump(self):
+        file_path = SNAPSHOT_PATH.format(self.seed)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # write then rename, a crash while dumping must not corrupt the previous snapshot
+        with open(file_path + '.tmp', "w") as f:
+            json.dump(asdict(self), f, sort_keys=True)
+        os.replace(file_path + '.tmp', file_path)
@@ -1,8 +1,10 @@
-from typing import List
+import random
+from dataclasses import dataclass
+from typing import List, Any, Dict, Optional, Tuple
 
 from peewee import Model, CharField, IntegerField, fn, ForeignKeyField, SqliteDatabase
 
-from src.constants import TOKENS
+from src.constants import MAX_UNBOND_AMOUNT, TOKENS
 
 db: SqliteDatabase = SqliteDatabase('db.db')
 
@@ -11,6 +13,20 @@ class BaseModel(Model):
     class Meta:
         database = db
 
+    @classmethod
+    def _pick(cls, query, r: Optional[random.Random]):
+        # sqlite's RANDOM() can't be seeded, an offset drawn from the manager's generator keeps the picks of a seed
+        # reproducible, see Manager._generate_corpus
+        count = query.count()
+        if count == 0:
+            return None
+        return query.order_by(cls.id).offset((r or random).randrange(count)).first()
+
+    @classmethod
+    def get_by_id(cls, record_id: int):
+        # None for a deleted row instead of DoesNotExist, like the in-memory indexes
+        return cls.get_or_none(cls.id == record_id)
+
 
 class Account(BaseModel):
     alias = CharField()
@@ -19,22 +35,30 @@ class Account(BaseModel):
     amount = IntegerField()
     seed = IntegerField()
 
+    class Meta:
+        indexes = (
+            (('seed', 'token', 'amount'), False),
+            (('seed', 'alias', 'token'), False),
+            (('seed', 'address'), False),
+        )
+
     @classmethod
     def create_account(cls, alias: str, address: str, token: str, amount: int, seed: int):
         return cls.create(alias=alias, address=address, token=token, amount=amount, seed=seed)
 
     @classmethod
-    def get_random_account(cls, seed: int, tokens: List[str] = TOKENS):
-        return cls.select().where(cls.seed == seed, cls.token << tokens).order_by(fn.Random()).get()
+    def get_random_account(cls, seed: int, tokens: List[str] = TOKENS, r: Optional[random.Random] = None):
+        return cls._pick(cls.select().where(cls.seed == seed, cls.token << tokens), r)
 
     @classmethod
-    def get_random_account_with_positive_balance(cls, seed: int, tokens: List[str] = TOKENS):
-        return cls.get_random_account_with_balance_greater_than(0, seed, tokens)
+    def get_random_account_with_positive_balance(cls, seed: int, tokens: List[str] = TOKENS,
+                                                 r: Optional[random.Random] = None):
+        return cls.get_random_account_with_balance_greater_than(0, seed, tokens, r)
 
     @classmethod
-    def get_random_account_with_balance_greater_than(cls, amount: int, seed: int, tokens: List[str] = TOKENS):
-        return cls.select().where(cls.amount > amount, cls.token << tokens, cls.seed == seed).order_by(
-            fn.Random()).get_or_none()
+    def get_random_account_with_balance_greater_than(cls, amount: int, seed: int, tokens: List[str] = TOKENS,
+                                                     r: Optional[random.Random] = None):
+        return cls._pick(cls.select().where(cls.amount > amount, cls.token << tokens, cls.seed == seed), r)
 
     @classmethod
     def get_by_address(cls, address: str, seed: int):
@@ -42,23 +66,22 @@ class Account(BaseModel):
 
     @classmethod
     def update_account_balance(cls, alias: str, token: str, delta_amount: int, seed: int):
-        user = cls.get(cls.alias == alias, cls.token == token, cls.seed == seed)
-        old_amount = user.amount
-        return cls.update({cls.amount: old_amount + delta_amount}).where(cls.alias == user.alias, cls.token == token,
+        # a single relative update, concurrent deltas on the same row can't overwrite each other
+        return cls.update({cls.amount: cls.amount + delta_amount}).where(cls.alias == alias, cls.token == token,
                                                                          cls.seed == seed).execute()
 
 
 class Validator(BaseModel):
     address = CharField()
-    seed = IntegerField()
+    seed = IntegerField(index=True)
 
     @classmethod
     def create_validator(cls, address: str, seed: int):
         return cls.create(address=address, seed=seed)
 
     @classmethod
-    def get_random_validator(cls, seed: int):
-        return cls.select().where(cls.seed == seed).order_by(fn.Random()).get()
+    def get_random_validator(cls, seed: int, r: Optional[random.Random] = None):
+        return cls._pick(cls.select().where(cls.seed == seed), r)
 
     @classmethod
     def get_by_address(cls, address: str, seed: int):
@@ -72,14 +95,19 @@ class Delegation(BaseModel):
     epoch = IntegerField()
     seed = IntegerField()
 
+    class Meta:
+        indexes = (
+            (('seed', 'epoch'), False),
+        )
+
     @classmethod
     def create_delegation(cls, account_id: int, validator_id: int, amount: int, epoch: int, seed: int):
         return cls.create(account_id=account_id, validator_id=validator_id, amount=amount, epoch=epoch, seed=seed)
 
     @classmethod
-    def get_random_valid_delegation(cls, current_epoch: int, seed: int):
-        return cls.select().where(cls.epoch <= current_epoch, cls.amount < 50000, cls.seed == seed).order_by(
-            fn.Random()).get_or_none()
+    def get_random_valid_delegation(cls, current_epoch: int, seed: int, r: Optional[random.Random] = None):
+        return cls._pick(cls.select().where(cls.epoch <= current_epoch, cls.amount < MAX_UNBOND_AMOUNT,
+                                            cls.seed == seed), r)
 
 
 class Withdrawal(BaseModel):
@@ -89,14 +117,20 @@ class Withdrawal(BaseModel):
     epoch = IntegerField()
     seed = IntegerField()
 
+    class Meta:
+        indexes = (
+            (('seed', 'epoch'), False),
+            (('seed', 'account_id', 'validator_id', 'epoch'), False),
+        )
+
     @classmethod
     def create_withdrawal(cls, account_id: int, validator_id: int, amount: int, epoch: int, seed: int):
         return cls.create(account_id=account_id, validator_id=validator_id, amount=amount, epoch=epoch,
                                  seed=seed)
 
     @classmethod
-    def get_random_withdrawable_withdraw(cls, current_epoch: int, seed: int):
-        return cls.select().where(cls.epoch <= current_epoch, cls.seed == seed).order_by(fn.Random()).get_or_none()
+    def get_random_withdrawable_withdraw(cls, current_epoch: int, seed: int, r: Optional[random.Random] = None):
+        return cls._pick(cls.select().where(cls.epoch <= current_epoch, cls.seed == seed), r)
 
     @classmethod
     def get_compatible_withdrawals(cls, delegator_id: int, validator_id: int, epoch: int, seed: int):
@@ -117,7 +151,7 @@ class Proposal(BaseModel):
     author = ForeignKeyField(Account, to_field='id')
     voting_start_epoch = IntegerField()
     voting_end_epoch = IntegerField()
-    seed = IntegerField()
+    seed = IntegerField(index=True)
 
     @classmethod
     def create_proposal(cls, proposal_id: int, author_id: int, voting_start_epoch: int, voting_end_epoch: int,
@@ -134,15 +168,58 @@ class Proposal(BaseModel):
         return cls.select(fn.MAX(cls.proposal_id)).where(cls.seed == seed).scalar()
 
     @classmethod
-    def get_random_votable_proposal(cls, epoch: int, seed: int):
-        return cls.select().where(
+    def get_random_votable_proposal(cls, epoch: int, seed: int, r: Optional[random.Random] = None):
+        return cls._pick(cls.select().where(
             cls.seed == seed,
             cls.voting_start_epoch <= epoch,
             cls.voting_end_epoch >= epoch - 1  # this is done to avoid an epoch change during vote transactions
-        ).order_by(fn.Random()).get_or_none()
-
-
-def connect():
+        ), r)
+
+
+# The tables a task reads and writes, either the sqlite models themselves or in-memory indexes
+# exposing the same methods (see src/memory_store.py).
+@dataclass
+class Store:
+    accounts: Any
+    validators: Any
+    delegations: Any
+    withdrawals: Any
+    proposals: Any
+
+    def close(self):
+        pass
+
+    def tables(self) -> List[Tuple[str, Any]]:
+        return [('accounts', self.accounts), ('validators', self.validators), ('delegations', self.delegations),
+                ('withdrawals', self.withdrawals), ('proposals', self.proposals)]
+
+    def export(self, seed: int) -> Dict[str, List[Dict]]:
+        return {name: list(table.select().where(table.seed == seed).dicts()) for name, table in self.tables()}
+
+    def restore(self, seed: int, data: Dict[str, List[Dict]]):
+        # ids are assigned by the store on creation, foreign keys are remapped to the new ids
+        account_ids = {row['id']: self.accounts.create_account(row['alias'], row['address'], row['token'],
+                                                               row['amount'], seed).get_id()
+                       for row in data['accounts']}
+        validator_ids = {row['id']: self.validators.create_validator(row['address'], seed).get_id()
+                         for row in data['validators']}
+        for row in data['delegations']:
+            self.delegations.create_delegation(account_ids[row['account_id']], validator_ids[row['validator_id']],
+                                               row['amount'], row['epoch'], seed)
+        for row in data['withdrawals']:
+            self.withdrawals.create_withdrawal(account_ids[row['account_id']], validator_ids[row['validator_id']],
+                                               row['amount'], row['epoch'], seed)
+        for row in data['proposals']:
+            self.proposals.create_proposal(row['proposal_id'], account_ids[row['author']], row['voting_start_epoch'],
+                                           row['voting_end_epoch'], seed)
+
+
+def sqlite_store() -> Store:
+    return Store(Account, Validator, Delegation, Withdrawal, Proposal)
+
+
+def connect(database: str = 'db.db'):
     models = [Account, Validator, Delegation, Withdrawal, Proposal]
+    db.init(database)
     db.connect()
     db.create_tables(models)
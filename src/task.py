@@ -1,18 +1,23 @@
+import asyncio
 import json
 import os
+import random
 import subprocess
 import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Tuple, List
+from typing import Tuple, List, Dict, Any, Optional, Union, Callable, TypeVar
 
+from src.balance_ledger import BalanceLedger, Reservation
 from src.commands import WalletCommands, ClientCommands
-from src.constants import (
-    VALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_OUTPUT, 
-    INVALID_TRANSACTION_EXECUTION_OUTPUT, NOT_ENOUGH_BALANCE, SKIPPING_KEY
-)
+from src.epoch_tracker import EpochTracker
+from src.leases import AccountLeases, LeasesExhausted
+from src.constants import NOT_ENOUGH_BALANCE, SKIPPING_KEY
 from src.output_parser import Parser
-import logging
+from src.pipeline import LifecyclePipeline
+from src.store import Store
+
+T = TypeVar('T')
 
 
 @dataclass
@@ -24,6 +29,11 @@ class TaskResult:
     index: int
     seed: int
     time_elapsed: float = field(init=False)
+    # phase -> seconds, see src.histogram.PHASES
+    phases: Dict[str, float] = field(init=False, default_factory=dict)
+    # matched against the blocks by src.block_watcher
+    tx_hash: Optional[str] = field(init=False, default=None)
+    submitted_at: Optional[float] = field(init=False, default=None)
 
     def is_error(self):
         if len(self.stderr) > 0:
@@ -47,10 +57,22 @@ class TaskResult:
             'task_name': self.task_name,
             'index': self.index,
             'seed': self.seed,
+            'phases': self.phases,
+            'tx_hash': self.tx_hash,
         }
 
     def set_time_elapsed(self, start_time: float):
-        self.time_elapsed = round(time.time() - start_time, 2)
+        self.phases['total'] = time.time() - start_time
+        self.time_elapsed = round(self.phases['total'], 2)
+        return self
+
+    def set_phases(self, phases: Dict[str, float]):
+        self.phases.update(phases)
+        return self
+
+    def set_submission(self, tx_hash: Optional[str], submitted_at: float):
+        self.tx_hash = tx_hash
+        self.submitted_at = submitted_at
         return self
 
     def dump(self):
@@ -62,6 +84,28 @@ class TaskResult:
             f.write(json.dumps(log, sort_keys=True, indent=4))
 
 
+@dataclass
+class TaskPlan:
+    command: List[str]
+    context: Dict[str, Any] = field(default_factory=dict)
+    # files that must exist while the command runs (path -> content)
+    files: Dict[str, str] = field(default_factory=dict)
+    # signers checked out for this tx, released once it completes
+    leases: List[str] = field(default_factory=list)
+    # balances held until it completes, see src.balance_ledger
+    reservations: List[Reservation] = field(default_factory=list)
+
+    def write_files(self):
+        for path, content in self.files.items():
+            with open(path, "w") as f:
+                f.write(content)
+
+    def remove_files(self):
+        for path in self.files.keys():
+            if os.path.exists(path):
+                os.remove(path)
+
+
 @dataclass
 class Task(ABC):
     task_name: str
@@ -71,6 +115,16 @@ class Task(ABC):
     wallet: WalletCommands = field(init=False)
     client: ClientCommands = field(init=False)
     parser: Parser = field(init=False)
+    command_timeout: int = field(init=False, default=130)
+    epoch_tracker: Optional[EpochTracker] = field(init=False, default=None)
+    store: Optional[Store] = field(init=False, default=None)
+    leases: Optional[AccountLeases] = field(init=False, default=None)
+    ledger: Optional[BalanceLedger] = field(init=False, default=None)
+    pipeline: Optional[LifecyclePipeline] = field(init=False, default=None)
+    # the manager's generator, the picks and amounts of a seed don't depend on the other seeds of the process
+    r: random.Random = field(init=False, default_factory=random.Random)
+    # src.rpc.RpcSubmitter, replays pre-signed txs straight to the node rpc instead of spawning the client
+    submitter: Optional[Any] = field(init=False, default=None)
 
     def __post_init__(self):
         self.wallet = WalletCommands(self.base_binary, self.base_diretory)
@@ -85,44 +139,267 @@ class Task(ABC):
     def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
         raise Exception("Handler must be implemented!")
 
-    def execute_command(self, command: List[str], timeout: int = 130) -> Tuple[bool, str, str]:
+    def execute_command(self, command: List[str], timeout: Optional[int] = None,
+                        phases: Optional[Dict[str, float]] = None) -> Tuple[bool, str, str]:
         # If a command fails due to a timeout error, it may be because the ledger is prompting it to replace already existing keys
         # To resolve this, try a different set of seeds, or clear the wallet
-        process_result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                                        cwd=self.base_diretory, timeout=timeout)
+        start_time = time.time()
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                              cwd=self.base_diretory) as process:
+            spawned_time = time.time()
+            try:
+                stdout, stderr = process.communicate(timeout=timeout or self.command_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+        # the client only returns once the tx is applied, everything after the spawn is waiting for inclusion
+        self._record_command_phases(phases, start_time, spawned_time)
+
+        process_result = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+        if not self._is_tx_valid(process_result):
+            return False, process_result.stdout, process_result.stderr
+        return True, process_result.stdout, process_result.stderr
+
+    async def execute_command_async(self, command: List[str], timeout: Optional[int] = None,
+                                    phases: Optional[Dict[str, float]] = None) -> Tuple[bool, str, str]:
+        timeout = timeout or self.command_timeout
+        start_time = time.time()
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE, cwd=self.base_diretory)
+        spawned_time = time.time()
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill_process(process)
+            raise subprocess.TimeoutExpired(command, timeout)
+        except asyncio.CancelledError:
+            await self._kill_process(process)
+            raise
+        self._record_command_phases(phases, start_time, spawned_time)
+
+        process_result = subprocess.CompletedProcess(command, process.returncode, stdout.decode(), stderr.decode())
         if not self._is_tx_valid(process_result):
             return False, process_result.stdout, process_result.stderr
         return True, process_result.stdout, process_result.stderr
 
     @staticmethod
-    def _is_tx_valid(process_result: subprocess.CompletedProcess) -> bool:
-        if len(process_result.stderr) > 0:
-            if NOT_ENOUGH_BALANCE in process_result.stderr:
-                pass
-            #Temporary bug
-            elif SKIPPING_KEY in process_result.stderr:
-                pass
-            else:
-                logging.debug('failed because stderr is present that isnt not enough gas')
-                return False
+    def _record_command_phases(phases: Optional[Dict[str, float]], start_time: float, spawned_time: float):
+        if phases is not None:
+            phases['spawn'] = spawned_time - start_time
+            phases['inclusion'] = time.time() - spawned_time
+
+    @staticmethod
+    async def _kill_process(process: asyncio.subprocess.Process):
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    def get_current_epoch(self, ledger_address: str) -> int:
+        cached_epoch = self.epoch_tracker.get() if self.epoch_tracker else None
+        if cached_epoch is not None:
+            return cached_epoch
+
+        return self._observe_epoch(self.query_current_epoch(ledger_address))
+
+    def query_current_epoch(self, ledger_address: str) -> int:
+        epoch_command = self.client.get_current_epoch(ledger_address)
+        is_successful, epoch_stdout, _epoch_stderr = self.execute_command(epoch_command)
+
+        if not is_successful:
+            raise Exception("Can't query current epoch.")
+
+        return self.parser.parse_client_epoch(epoch_stdout)
+
+    async def get_current_epoch_async(self, ledger_address: str) -> int:
+        cached_epoch = self.epoch_tracker.get() if self.epoch_tracker else None
+        if cached_epoch is not None:
+            return cached_epoch
+
+        epoch_command = self.client.get_current_epoch(ledger_address)
+        is_successful, epoch_stdout, _epoch_stderr = await self.execute_command_async(epoch_command)
+
+        if not is_successful:
+            raise Exception("Can't query current epoch.")
+
+        return self._observe_epoch(self.parser.parse_client_epoch(epoch_stdout))
+
+    def _observe_epoch(self, epoch: Optional[int]) -> Optional[int]:
+        if self.epoch_tracker:
+            self.epoch_tracker.observe(epoch)
+        if self.pipeline:
+            self.pipeline.observe(epoch)
+        return epoch
 
-        if not any(output in process_result.stdout for output in [VALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_OUTPUT,
-                                                                  INVALID_TRANSACTION_EXECUTION_OUTPUT]) and not any(
-                output in process_result.stderr for output in
-                [VALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_OUTPUT, INVALID_TRANSACTION_EXECUTION_OUTPUT]):
-            return True
-
-        if VALID_TRANSACTION_OUTPUT in process_result.stdout:
-            return True
-        elif INVALID_TRANSACTION_OUTPUT in process_result.stdout or INVALID_TRANSACTION_OUTPUT in process_result.stderr:
-            logging.debug('failed bacuase of 96')
-            return False
-        elif INVALID_TRANSACTION_EXECUTION_OUTPUT in process_result.stdout or INVALID_TRANSACTION_EXECUTION_OUTPUT in process_result.stderr:
-            logging.debug('failed because of 98')
-            return False
-        else:
-            return True
+    @staticmethod
+    def _is_tx_valid(process_result: subprocess.CompletedProcess) -> bool:
+        return Parser.parse_tx(process_result.stdout, process_result.stderr).is_valid
 
     @staticmethod
     def assert_row_affected(affected_rows: int, expected_affected_rows: int):
         assert (affected_rows == expected_affected_rows)
+
+
+# Picking the state (prepare) and updating the store after a successful tx (complete) are kept apart from the
+# command execution, so the same task can be driven by the blocking or by the asyncio engine.
+@dataclass
+class TransactionTask(Task):
+    NEEDS_EPOCH = False
+
+    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
+        if self.submitter is not None:
+            task_result = self.submitter.submit(self.task_name, step_index, self.seed, ledger_address)
+            if task_result is not None:
+                return task_result
+
+        phases = {}
+        epoch_start_time = time.time()
+        current_epoch = self.get_current_epoch(ledger_address) if self.NEEDS_EPOCH else None
+        if self.NEEDS_EPOCH:
+            phases['epoch'] = time.time() - epoch_start_time
+        plan = self.prepare(step_index, ledger_address, current_epoch)
+        if plan is None:
+            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+
+        try:
+            submitted_at = time.time()
+            is_successful, stdout, stderr = self._execute_plan(plan, phases)
+            return self._finalize(plan, step_index, is_successful, stdout, stderr, submitted_at).set_phases(phases)
+        finally:
+            self.release(plan)
+
+    async def run_async(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
+        start_time = time.time()
+        if self.submitter is not None:
+            task_result = await asyncio.get_event_loop().run_in_executor(
+                None, self.submitter.submit, self.task_name, step_index, self.seed, ledger_address)
+            if task_result is not None:
+                return task_result.set_time_elapsed(start_time)
+
+        phases = {}
+        current_epoch = await self.get_current_epoch_async(ledger_address) if self.NEEDS_EPOCH else None
+        if self.NEEDS_EPOCH:
+            phases['epoch'] = time.time() - start_time
+        plan = await self._prepare_async(step_index, ledger_address, current_epoch)
+        if plan is None:
+            return TaskResult(self.task_name, "", "", "", step_index, self.seed).set_time_elapsed(start_time)
+
+        try:
+            submitted_at = time.time()
+            is_successful, stdout, stderr = await self._execute_plan_async(plan, phases)
+            return self._finalize(plan, step_index, is_successful, stdout, stderr, submitted_at).set_phases(
+                phases).set_time_elapsed(start_time)
+        finally:
+            self.release(plan)
+
+    async def _prepare_async(self, step_index: int, ledger_address: str,
+                             current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        deadline = time.monotonic() + (self.leases.wait_timeout if self.leases else 0)
+        while True:
+            try:
+                return self.prepare(step_index, ledger_address, current_epoch)
+            except LeasesExhausted as e:
+                # every signer is busy, picked again once an in-flight tx of this loop gives one back
+                if not await self.leases.wait_async(e.releases, deadline - time.monotonic()):
+                    return None
+
+    def plan(self, step_index: int, ledger_address: str, current_epoch: int) -> Union[TaskPlan, None]:
+        # corpus generation: assume the tx goes through, so the following plans see its effect on the store
+        plan = self.prepare(step_index, ledger_address, current_epoch)
+        if plan is not None:
+            self.complete(plan, self.simulated_output(plan, current_epoch))
+            self.release(plan)
+        return plan
+
+    def simulated_output(self, plan: TaskPlan, current_epoch: int) -> str:
+        return "Last committed epoch: {}".format(current_epoch)
+
+    def replay(self, step_index: int, plan: TaskPlan) -> TaskResult:
+        start_time = time.time()
+        phases = {}
+        is_successful, stdout, stderr = self._execute_plan(plan, phases)
+        return TaskResult(self.task_name, ' '.join(plan.command), stdout, stderr, step_index,
+                          self.seed).set_phases(phases).set_submission(
+            self.parser.parse_tx(stdout, stderr).tx_hash, start_time).set_time_elapsed(start_time)
+
+    async def replay_async(self, step_index: int, plan: TaskPlan) -> TaskResult:
+        start_time = time.time()
+        phases = {}
+        is_successful, stdout, stderr = await self._execute_plan_async(plan, phases)
+        return TaskResult(self.task_name, ' '.join(plan.command), stdout, stderr, step_index,
+                          self.seed).set_phases(phases).set_submission(
+            self.parser.parse_tx(stdout, stderr).tx_hash, start_time).set_time_elapsed(start_time)
+
+    def checkout(self, pick: Callable[[], Optional[T]], key: Callable[[T], str]) -> Tuple[Optional[T], List[str]]:
+        # picks a record whose signer is not already busy with another in-flight tx, see src.leases
+        if self.leases is None:
+            return pick(), []
+        return self.leases.checkout(pick, key)
+
+    def release(self, plan: TaskPlan):
+        # only called once complete has updated the store, so the next checkout of the account sees it
+        if self.leases is not None:
+            self.leases.release(plan.leases)
+        if self.ledger is not None:
+            self.ledger.release(plan.reservations)
+
+    def spendable(self, account: Any) -> int:
+        if self.ledger is None:
+            return account.amount
+        return self.ledger.available(account.alias, account.token)
+
+    def reserve(self, alias: str, token: str, amount: int) -> Optional[List[Reservation]]:
+        # None when the txs already in flight spend too much of the balance for this one to go through
+        if self.ledger is None:
+            return []
+        reservation = self.ledger.reserve(alias, token, amount)
+        return None if reservation is None else [reservation]
+
+    def update_balance(self, alias: str, token: str, delta_amount: int) -> int:
+        affected_rows = self.store.accounts.update_account_balance(alias, token, delta_amount, self.seed)
+        if self.ledger is not None and affected_rows:
+            self.ledger.apply(alias, token, delta_amount)
+        return affected_rows
+
+    def follow_up(self, task_name: str, epoch: int, until: Optional[int] = None):
+        # the state this tx created lets task_name go through from epoch on, see src.pipeline
+        if self.pipeline is not None:
+            self.pipeline.follow_up(task_name, epoch, until)
+
+    def signer_of(self, account_id: int) -> str:
+        account = self.store.accounts.get_by_id(account_id)
+        return account.alias if account is not None else 'account:{}'.format(account_id)
+
+    def _execute_plan(self, plan: TaskPlan, phases: Dict[str, float]) -> Tuple[bool, str, str]:
+        plan.write_files()
+        try:
+            return self.execute_command(plan.command, phases=phases)
+        finally:
+            plan.remove_files()
+
+    async def _execute_plan_async(self, plan: TaskPlan, phases: Dict[str, float]) -> Tuple[bool, str, str]:
+        plan.write_files()
+        try:
+            return await self.execute_command_async(plan.command, phases=phases)
+        finally:
+            plan.remove_files()
+
+    def _finalize(self, plan: TaskPlan, step_index: int, is_successful: bool, stdout: str, stderr: str,
+                  submitted_at: float) -> TaskResult:
+        if is_successful:
+            # txs report the epoch they were applied in, keep the shared epoch fresh for free
+            self._observe_epoch(self.parser.parse_tx(stdout, stderr).epoch)
+            self.complete(plan, stdout)
+        elif self.ledger is not None and NOT_ENOUGH_BALANCE in stderr:
+            # the store thinks these accounts can pay, have the reconciler look at them first
+            self.ledger.suspect([alias for alias, _, _ in plan.reservations] + plan.leases)
+        return TaskResult(self.task_name, ' '.join(plan.command), stdout, stderr, step_index,
+                          self.seed).set_submission(self.parser.parse_tx(stdout, stderr).tx_hash, submitted_at)
+
+    @abstractmethod
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        raise Exception("Prepare must be implemented!")
+
+    @abstractmethod
+    def complete(self, plan: TaskPlan, stdout: str):
+        raise Exception("Complete must be implemented!")
@@ -1,36 +1,42 @@
-import random
 from dataclasses import dataclass
+from typing import Optional, Union
 
-from src.store import Account, Validator, Delegation
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class Delegate(Task):
+class Delegate(TransactionTask):
     BOND_AMOUNT_MAX: int = 10
     BOND_AMOUNT_MIN: int = 1
     BOND_WAIT_EPOCH: int = 2
 
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        amount = random.randint(self.BOND_AMOUNT_MIN, self.BOND_AMOUNT_MAX)
-        delegator = Account.get_random_account_with_balance_greater_than(amount, self.seed, tokens=['NAM'])
-        if not delegator:            
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
-
-        validator = Validator.get_random_validator(self.seed)
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        amount = self.r.randint(self.BOND_AMOUNT_MIN, self.BOND_AMOUNT_MAX)
+        delegator, leases = self.checkout(
+            lambda: self.store.accounts.get_random_account_with_balance_greater_than(amount, self.seed, tokens=['NAM'],
+                                                                                   r=self.r),
+            lambda account: account.alias)
+        if not delegator:
+            return None
+        reservations = self.reserve(delegator.alias, 'NAM', amount)
+        if reservations is None:
+            self.release(TaskPlan([], leases=leases))
+            return None
+
+        validator = self.store.validators.get_random_validator(self.seed, r=self.r)
 
         command = self.client.bond(delegator.alias, validator.address, amount, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
-
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
+        return TaskPlan(command, {'delegator': delegator, 'validator': validator, 'amount': amount}, leases=leases,
+                        reservations=reservations)
 
+    def complete(self, plan: TaskPlan, stdout: str):
+        delegator, validator, amount = plan.context['delegator'], plan.context['validator'], plan.context['amount']
         tx_epoch_execution = self.parser.parse_epoch_from_tx_execution(stdout)
 
-        Delegation.create_delegation(delegator.get_id(), validator.get_id(), amount,
-                                     tx_epoch_execution + self.BOND_WAIT_EPOCH, self.seed)  # try to unbond from next epoch
+        self.store.delegations.create_delegation(delegator.get_id(), validator.get_id(), amount,
+                                                 tx_epoch_execution + self.BOND_WAIT_EPOCH,
+                                                 self.seed)  # try to unbond from next epoch
+        self.follow_up('Unbond', tx_epoch_execution + self.BOND_WAIT_EPOCH)
 
-        affected_rows = Account.update_account_balance(delegator.alias, 'NAM', -amount, self.seed)
+        affected_rows = self.update_balance(delegator.alias, 'NAM', -amount)
         self.assert_row_affected(affected_rows, 1)
-
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
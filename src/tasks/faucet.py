@@ -1,28 +1,27 @@
-import random
 from dataclasses import dataclass
 from math import floor
+from typing import Optional, Union
 
-from src.constants import TOKENS, TOKEN_PROBABILITIES
-from src.store import Account
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class Faucet(Task):
+class Faucet(TransactionTask):
     FAUCET_AMOUNT_LIMIT: int = 1000
 
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        account = Account.get_random_account(self.seed)
-        amount = random.randint(floor(self.FAUCET_AMOUNT_LIMIT * 0.9), self.FAUCET_AMOUNT_LIMIT)
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        account, leases = self.checkout(lambda: self.store.accounts.get_random_account(self.seed, r=self.r),
+                                        lambda account: account.alias)
+        if account is None:
+            return None
+        amount = self.r.randint(floor(self.FAUCET_AMOUNT_LIMIT * 0.9), self.FAUCET_AMOUNT_LIMIT)
         token = account.token
 
         command = self.client.faucet(account.alias, token, amount, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
+        return TaskPlan(command, {'account': account, 'token': token, 'amount': amount}, leases=leases)
 
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
+    def complete(self, plan: TaskPlan, stdout: str):
+        account, token, amount = plan.context['account'], plan.context['token'], plan.context['amount']
 
-        changed_rows = Account.update_account_balance(account.alias, token, amount, self.seed)
+        changed_rows = self.update_balance(account.alias, token, amount)
         self.assert_row_affected(1, changed_rows)
-
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
@@ -1,47 +1,134 @@
 import logging
 import string
-from dataclasses import dataclass
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from random import choice
-from time import sleep
-from typing import Tuple, List, Dict
+from threading import Lock
+from typing import Tuple, List, Dict, ClassVar
 
 from src.constants import TOKENS, ACCOUNT_FORMAT
-from src.store import Account, Validator, Delegation, Withdrawal, Proposal
+from src.provisioning import Provisioner
 from src.task import Task, TaskResult
-import logging
 
 
 @dataclass
 class Init(Task):
     MIN_ACCOUNT_PER_RUN = 5
+    # chain-wide query outputs (validators, bonds, proposals) shared by the Init of every seed
+    SHARED_OUTPUTS: ClassVar[Dict[Tuple[str, str], str]] = {}
+    SHARED_OUTPUTS_LOCK: ClassVar[Lock] = Lock()
+    workers: int = 8
+    global_bonds: bool = True
+    # settings.init, see src.provisioning
+    provisioning: Dict = field(default_factory=dict)
+    phase_times: Dict[str, float] = field(init=False, default_factory=dict)
 
     def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        logging.info("Parsing aliases and addresses...")
-        aliases, addresses = self._get_all_alias_and_addresses()
-        logging.info("Parsed {} aliases and {} addresses!".format(len(aliases), len(addresses)))
-        logging.info("Parsing validators...")
-        validator_addresses = self._get_all_validators(ledger_address)
-        logging.info("Parsed {} validators!".format(len(validator_addresses)))
-        logging.info("Parsing delegations...")
-        delegations = self._get_delegations(addresses, validator_addresses, ledger_address)
-        logging.info("Parsed {} delegations!".format(len(delegations)))
-        logging.info("Parsing withdrawals...")
-        withdrawals = self._get_withdrawals(addresses, validator_addresses, ledger_address)
-        logging.info("Parsed {} withdrawals!".format(len(withdrawals)))
-        logging.info("Parsing proposals...")
-        proposals = self._get_all_proposals(ledger_address)
-        logging.info("Parsed {} proposals!".format(len(proposals)))
-
-        logging.info("Setup accounts...")
-        self._setup_accounts(aliases, addresses, ledger_address)
-        logging.info("Setup balances...")
-        alias_balances = self._get_all_balances(aliases, ledger_address)
-        logging.info("Init storage...")
-        self._init_storage(aliases, addresses, validator_addresses, alias_balances, delegations, withdrawals, proposals)
+        self.phase_times = {}
+        with self._phase('wallet'):
+            logging.info("Parsing aliases and addresses...")
+            aliases, addresses = self._get_all_alias_and_addresses()
+            logging.info("Parsed {} aliases and {} addresses!".format(len(aliases), len(addresses)))
+        with self._phase('validators'):
+            logging.info("Parsing validators...")
+            validator_addresses = self._get_all_validators(ledger_address)
+            logging.info("Parsed {} validators!".format(len(validator_addresses)))
+        with self._phase('delegations'):
+            logging.info("Parsing delegations...")
+            delegations = self._get_delegations(addresses, validator_addresses, ledger_address)
+            logging.info("Parsed {} delegations!".format(len(delegations)))
+        with self._phase('withdrawals'):
+            logging.info("Parsing withdrawals...")
+            withdrawals = self._get_withdrawals(addresses, validator_addresses, ledger_address)
+            logging.info("Parsed {} withdrawals!".format(len(withdrawals)))
+        with self._phase('proposals'):
+            logging.info("Parsing proposals...")
+            proposals = self._get_all_proposals(ledger_address)
+            logging.info("Parsed {} proposals!".format(len(proposals)))
+
+        provisioner = Provisioner.from_config(self, self._generate_alias, self.provisioning, self.MIN_ACCOUNT_PER_RUN)
+        with self._phase('accounts'):
+            logging.info("Setup accounts...")
+            provisioner.provision(aliases, addresses, ledger_address)
+        with self._phase('balances'):
+            logging.info("Setup balances...")
+            alias_balances = self._get_all_balances(aliases, ledger_address)
+        with self._phase('funding'):
+            funded = provisioner.fund(aliases, alias_balances, ledger_address)
+            alias_balances.update(self._get_all_balances(funded, ledger_address))
+        with self._phase('storage'):
+            logging.info("Init storage...")
+            self._init_storage(aliases, addresses, validator_addresses, alias_balances, delegations, withdrawals,
+                               proposals)
         logging.info("Done!")
+        logging.info("Init phase times: {} (total {}s)".format(
+            ', '.join(['{} {}s'.format(phase, elapsed) for phase, elapsed in self.phase_times.items()]),
+            round(sum(self.phase_times.values()), 2)))
 
         return TaskResult(self.task_name, "", "", "", step_index, self.seed)
 
+    def reconcile(self, step_index: int, ledger_address: str, known_accounts: List[Dict]) -> TaskResult:
+        # the store was restored from a snapshot, only refresh what may have moved since it was taken
+        self.phase_times = {}
+        known_amounts = {(account['alias'], account['token']): account['amount'] for account in known_accounts}
+        provisioner = Provisioner.from_config(self, self._generate_alias, self.provisioning, self.MIN_ACCOUNT_PER_RUN)
+        with self._phase('wallet'):
+            aliases, addresses = self._get_all_alias_and_addresses()
+        with self._phase('accounts'):
+            provisioner.provision(aliases, addresses, ledger_address)
+        with self._phase('balances'):
+            alias_balances = self._get_all_balances(aliases, ledger_address)
+        with self._phase('funding'):
+            funded = provisioner.fund(aliases, alias_balances, ledger_address)
+            alias_balances.update(self._get_all_balances(funded, ledger_address))
+        with self._phase('storage'):
+            new_accounts = 0
+            for alias, address in zip(aliases, addresses):
+                for token in TOKENS:
+                    token_amount = alias_balances[alias].get(token, 0)
+                    if (alias, token) in known_amounts:
+                        self.store.accounts.update_account_balance(alias, token,
+                                                                   token_amount - known_amounts[(alias, token)],
+                                                                   self.seed)
+                    else:
+                        self.store.accounts.create_account(alias, address, token, token_amount, self.seed)
+                        new_accounts += 1
+        with self._phase('proposals'):
+            last_proposal_id = self.store.proposals.get_last_proposal_id(self.seed)
+            proposals = [proposal for proposal in self._get_all_proposals(ledger_address)
+                         if last_proposal_id is None or proposal[0] > last_proposal_id]
+            self._store_proposals(proposals)
+        logging.info("Reconciled {} accounts ({} new) and {} new proposals.".format(len(aliases), new_accounts,
+                                                                                    len(proposals)))
+        logging.info("Init phase times: {} (total {}s)".format(
+            ', '.join(['{} {}s'.format(phase, elapsed) for phase, elapsed in self.phase_times.items()]),
+            round(sum(self.phase_times.values()), 2)))
+
+        return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+
+    @contextmanager
+    def _phase(self, name: str):
+        start_time = time.time()
+        yield
+        self.phase_times[name] = round(time.time() - start_time, 2)
+
+    def _execute_commands(self, commands: List[List[str]]) -> List[Tuple[bool, str, str]]:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.execute_command, commands))
+
+    def _execute_shared_query(self, command: List[str], ledger_address: str) -> Tuple[bool, str, str]:
+        key = (' '.join(command), ledger_address)
+        with self.SHARED_OUTPUTS_LOCK:
+            if key in self.SHARED_OUTPUTS:
+                return True, self.SHARED_OUTPUTS[key], ""
+        is_successful, stdout, stderr = self.execute_command(command)
+        if is_successful:
+            with self.SHARED_OUTPUTS_LOCK:
+                self.SHARED_OUTPUTS[key] = stdout
+        return is_successful, stdout, stderr
+
     def _get_all_alias_and_addresses(self) -> Tuple[List[str], List[str]]:
         command = self.wallet.address_list()
         is_successful, stdout, _stderr = self.execute_command(command)
@@ -64,9 +151,7 @@ class Init(Task):
 
     def _get_all_validators(self, ledger_address: str):
         command = self.client.get_current_validators(ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
-
-        print(stdout)
+        is_successful, stdout, stderr = self._execute_shared_query(command, ledger_address)
 
         if not is_successful:
             logging.debug(stdout)
@@ -77,10 +162,8 @@ class Init(Task):
 
     def _get_all_balances(self, aliases: List[str], ledger_address: str) -> Dict[str, Dict[str, int]]:
         balance_map = {}
-        for alias in aliases:
-            command = self.client.get_account_balance(alias, ledger_address)
-            is_successful, stdout, stderr = self.execute_command(command)
-
+        commands = [self.client.get_account_balance(alias, ledger_address) for alias in aliases]
+        for alias, (is_successful, stdout, stderr) in zip(aliases, self._execute_commands(commands)):
             if not is_successful:
                 logging.debug(stderr)
                 raise Exception("Can't get balance of {}.".format(alias))
@@ -89,51 +172,26 @@ class Init(Task):
             balance_map[alias] = owner_balances
         return balance_map
 
+    def query_balances(self, alias: str, ledger_address: str) -> Dict[str, int]:
+        is_successful, stdout, stderr = self.execute_command(self.client.get_account_balance(alias, ledger_address))
+        if not is_successful:
+            logging.debug(stderr)
+            raise Exception("Can't get balance of {}.".format(alias))
+        return self.parser.parse_client_balance_owner(stdout)
+
     def _get_all_proposals(self, ledger_address: str) -> List[Tuple[int, str, int, int, str]]:
         command = self.client.get_proposal(None, ledger_address)
-        is_successful, stdout, _stderr = self.execute_command(command)
+        is_successful, stdout, _stderr = self._execute_shared_query(command, ledger_address)
 
         if not is_successful:
             raise Exception("Can't get proposals")
 
         return self.parser.parse_client_proposals(stdout)
 
-    def _setup_accounts(self, aliases: List[str], addresses: List[str], ledger_address: str):
-        i = len(aliases)
-        while i < self.MIN_ACCOUNT_PER_RUN:
-            alias, address = self._create_account(ledger_address)
-            aliases.append(alias)
-            addresses.append(address)
-            logging.info("Created new account {} with alias {}...".format(address, alias))
-            i += 1
-
-    def _create_account(self, ledger_address: str) -> Tuple[str, str]:
-        alias = self._generate_alias(self.seed)
-        command = self.wallet.generate_key(alias)
-        is_successful, stdout, stderr = self.execute_command(command)
-
-        if not is_successful:
-            raise Exception("Can't create wallet key.")
-
-        key_alias = self.parser.parse_wallet_gen_key(stdout)
-
-        command = self.client.init_account(key_alias, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
-
-        if not is_successful:
-            logging.debug(stdout)
-            logging.debug('stderr is:')
-            logging.debug(stderr)
-            raise Exception("Can't init account with alias {}.".format(alias))
-
-        account_alias, account_address = self.parser.parse_client_init_account(stdout)
-
-        return account_alias, account_address
-
     def _get_delegations(self, account_addresses: List[str], validator_addresses: List[str], ledger_address: str) -> \
             List[Tuple[str, str, int, int]]:
         command = self.client.get_delegations(ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
+        is_successful, stdout, stderr = self._execute_shared_query(command, ledger_address)
 
         if not is_successful:
             raise Exception("Can't read bonds.")
@@ -152,23 +210,32 @@ class Init(Task):
 
     def _get_withdrawals(self, account_addresses: List[str], validator_addresses: List[str], ledger_address: str) -> \
             List[Tuple[str, str, int, int, int]]:
+        if self.global_bonds:
+            # the global bonds dump already lists the unbonded delegations of every (account, validator) pair
+            command = self.client.get_delegations(ledger_address)
+            is_successful, stdout, stderr = self._execute_shared_query(command, ledger_address)
 
-        all_withdrawals = []
+            if not is_successful:
+                logging.debug(stderr)
+                raise Exception("Can't read bonds.")
 
-        print(validator_addresses)
+            return [withdrawal for withdrawal in self.parser.parse_client_all_withdrawals(stdout)
+                    if withdrawal[0] in account_addresses and withdrawal[1] in validator_addresses]
 
-        for validator_address in validator_addresses:
-            for account_address in account_addresses:
-                command = self.client.get_delegations_by_owner_and_validator(account_address, validator_address, ledger_address)
-                print(command)
-                is_successful, stdout, stderr = self.execute_command(command)
+        pairs = [(validator_address, account_address) for validator_address in validator_addresses
+                 for account_address in account_addresses]
+        commands = [self.client.get_delegations_by_owner_and_validator(account_address, validator_address,
+                                                                       ledger_address)
+                    for validator_address, account_address in pairs]
 
-                if not is_successful:
-                    print(stderr)
-                    raise Exception("Can't read bonds.")
+        all_withdrawals = []
+        for (validator_address, _), (is_successful, stdout, stderr) in zip(pairs, self._execute_commands(commands)):
+            if not is_successful:
+                logging.debug(stderr)
+                raise Exception("Can't read bonds.")
 
-                withdrawals = self.parser.parse_client_withdrawals(stdout, validator_address)
-                all_withdrawals.extend(withdrawals)
+            withdrawals = self.parser.parse_client_withdrawals(stdout, validator_address)
+            all_withdrawals.extend(withdrawals)
 
         return all_withdrawals
 
@@ -180,10 +247,10 @@ class Init(Task):
             alias, address = account
             for token in TOKENS:
                 token_amount = alias_balances[alias].get(token, 0)
-                Account.create_account(alias, address, token, token_amount, self.seed)
+                self.store.accounts.create_account(alias, address, token, token_amount, self.seed)
 
         for address in validator_addresses:
-            Validator.create_validator(address, self.seed)
+            self.store.validators.create_validator(address, self.seed)
 
         for delegation in delegations:
             delegator_address = delegation[0]
@@ -191,14 +258,14 @@ class Init(Task):
             epoch = delegation[2]
             amount = delegation[3]
 
-            delegator_account = Account.get_by_address(delegator_address, self.seed)
-            validator_account = Validator.get_by_address(validator_address, self.seed)
+            delegator_account = self.store.accounts.get_by_address(delegator_address, self.seed)
+            validator_account = self.store.validators.get_by_address(validator_address, self.seed)
 
             if validator_account is None or delegator_account is None:
                 continue
 
-            Delegation.create_delegation(delegator_account.get_id(), validator_account.get_id(), amount, epoch,
-                                         self.seed)
+            self.store.delegations.create_delegation(delegator_account.get_id(), validator_account.get_id(), amount,
+                                                     epoch, self.seed)
 
         for withdrawal in withdrawals:
             delegator_address = withdrawal[0]
@@ -206,15 +273,18 @@ class Init(Task):
             epoch = withdrawal[2]
             amount = withdrawal[4]
 
-            delegator_account = Account.get_by_address(delegator_address, self.seed)
-            validator_account = Validator.get_by_address(validator_address, self.seed)
+            delegator_account = self.store.accounts.get_by_address(delegator_address, self.seed)
+            validator_account = self.store.validators.get_by_address(validator_address, self.seed)
 
             if validator_account is None or delegator_account is None:
                 continue
 
-            Withdrawal.create_withdrawal(delegator_account.get_id(), validator_account.get_id(), amount, epoch,
-                                         self.seed)
+            self.store.withdrawals.create_withdrawal(delegator_account.get_id(), validator_account.get_id(), amount,
+                                                     epoch, self.seed)
+
+        self._store_proposals(proposals)
 
+    def _store_proposals(self, proposals: List[Tuple[int, str, int, int, str]]):
         for proposal in proposals:
             proposal_id = proposal[0]
             proposal_author = proposal[1]
@@ -225,12 +295,12 @@ class Init(Task):
             if proposal_status != 'pending' and proposal_status != 'on-going':
                 continue
 
-            proposer_account = Account.get_by_address(proposal_author, self.seed)
+            proposer_account = self.store.accounts.get_by_address(proposal_author, self.seed)
             if proposer_account is None:
                 continue
 
-            Proposal.create_proposal(proposal_id, proposer_account.get_id(), proposal_start_epoch, proposal_end_epoch,
-                                     self.seed)
+            self.store.proposals.create_proposal(proposal_id, proposer_account.get_id(), proposal_start_epoch,
+                                                 proposal_end_epoch, self.seed)
 
     @staticmethod
     def _generate_alias(seed: int) -> str:
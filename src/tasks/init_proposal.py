@@ -1,22 +1,24 @@
+import copy
 import datetime
 import json
 import os
-import random
 import string
 from dataclasses import dataclass
+from typing import Optional, Union
 
-from src.store import Account, Proposal
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class InitProposal(Task):
-    PROPOSAL_PATH: str = os.path.abspath(os.path.join(os.path.curdir, "proposal.json"))
+class InitProposal(TransactionTask):
+    PROPOSAL_PATH: str = os.path.abspath(os.path.join(os.path.curdir, "proposal-{}-{}.json"))
     END_EPOCH_FACTOR: int = 3
     MAX_START_END_EPOCH_DIFFERENCE: int = 27
     GRACE_EPOCH_FACTOR: int = 6
     PROPOSAL_MIN_FUNDS: int = 500
     PROPOSAL_DISCUSSION_URL_FORMAT: str = "www.github.com/namada/nip/{}"
+    # creation time of the first proposal, one second per step after it, the wall clock would change the corpus
+    PROPOSAL_CREATED_AT: datetime.datetime = datetime.datetime(2023, 1, 1)
     PROPOSAL_CONTENT = {
         "content": {
             "title": "Proposal title",
@@ -34,49 +36,49 @@ class InitProposal(Task):
         "voting_end_epoch": -1,
         "grace_epoch": -1,
     }
+    NEEDS_EPOCH = True
 
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        epoch_command = self.client.get_current_epoch(ledger_address)
-        is_successful, epoch_stdout, _epoch_stderr = self.execute_command(epoch_command)
-
-        if not is_successful:
-            raise Exception("Can't query current epoch.")
-
-        current_epoch = self.parser.parse_client_epoch(epoch_stdout)
-
-        proposer_account = Account.get_random_account_with_balance_greater_than(self.PROPOSAL_MIN_FUNDS, self.seed,
-                                                                                ['NAM'])
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        proposer_account, leases = self.checkout(
+            lambda: self.store.accounts.get_random_account_with_balance_greater_than(self.PROPOSAL_MIN_FUNDS,
+                                                                                     self.seed, ['NAM'], self.r),
+            lambda account: account.alias)
         if proposer_account is None:
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            return None
+        reservations = self.reserve(proposer_account.alias, 'NAM', self.PROPOSAL_MIN_FUNDS)
+        if reservations is None:
+            self.release(TaskPlan([], leases=leases))
+            return None
 
-        voting_start_epoch = current_epoch + random.randint(2, 45)
-        voting_end_epoch = voting_start_epoch + random.randint(self.END_EPOCH_FACTOR, self.MAX_START_END_EPOCH_DIFFERENCE)
-        grace_epoch = voting_end_epoch + random.randint(self.GRACE_EPOCH_FACTOR, 20)
-        discussion_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+        voting_start_epoch = current_epoch + self.r.randint(2, 45)
+        voting_end_epoch = voting_start_epoch + self.r.randint(self.END_EPOCH_FACTOR, self.MAX_START_END_EPOCH_DIFFERENCE)
+        grace_epoch = voting_end_epoch + self.r.randint(self.GRACE_EPOCH_FACTOR, 20)
+        discussion_id = ''.join(self.r.choices(string.ascii_uppercase + string.digits, k=10))
 
-        self.PROPOSAL_CONTENT["voting_start_epoch"] = voting_start_epoch - voting_start_epoch % self.END_EPOCH_FACTOR
-        self.PROPOSAL_CONTENT["voting_end_epoch"] = voting_end_epoch - voting_end_epoch % self.END_EPOCH_FACTOR
-        self.PROPOSAL_CONTENT["grace_epoch"] = grace_epoch
-        self.PROPOSAL_CONTENT["author"] = proposer_account.address
-        self.PROPOSAL_CONTENT['content']['discussion-to'] = self.PROPOSAL_DISCUSSION_URL_FORMAT.format(discussion_id)
-        self.PROPOSAL_CONTENT['content']['created'] = str(datetime.datetime.now().replace(microsecond=0).isoformat())
+        # each in-flight proposal gets its own content and data file
+        proposal_content = copy.deepcopy(self.PROPOSAL_CONTENT)
+        proposal_content["voting_start_epoch"] = voting_start_epoch - voting_start_epoch % self.END_EPOCH_FACTOR
+        proposal_content["voting_end_epoch"] = voting_end_epoch - voting_end_epoch % self.END_EPOCH_FACTOR
+        proposal_content["grace_epoch"] = grace_epoch
+        proposal_content["author"] = proposer_account.address
+        proposal_content['content']['discussion-to'] = self.PROPOSAL_DISCUSSION_URL_FORMAT.format(discussion_id)
+        proposal_content['content']['created'] = (self.PROPOSAL_CREATED_AT +
+                                                  datetime.timedelta(seconds=step_index)).isoformat()
 
-        with open(self.PROPOSAL_PATH, "w") as f:
-            json.dump(self.PROPOSAL_CONTENT, f)
+        proposal_path = self.PROPOSAL_PATH.format(self.seed, step_index)
+        command = self.client.init_proposal(proposal_path, ledger_address)
+        return TaskPlan(command, {'proposer_account': proposer_account, 'voting_start_epoch': voting_start_epoch,
+                                  'voting_end_epoch': voting_end_epoch},
+                        {proposal_path: json.dumps(proposal_content)}, leases, reservations)
 
-        command = self.client.init_proposal(self.PROPOSAL_PATH, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
+    def complete(self, plan: TaskPlan, stdout: str):
+        proposer_account = plan.context['proposer_account']
 
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
-
-        proposal_id = Proposal.get_last_proposal_id(self.seed)
+        proposal_id = self.store.proposals.get_last_proposal_id(self.seed)
         proposal_id = 0 if not proposal_id and proposal_id != 0 else proposal_id + 1
 
-        Proposal.create_proposal(proposal_id, proposer_account.get_id(), voting_start_epoch, voting_end_epoch,
-                                 self.seed)
-        affected_rows = Account.update_account_balance(proposer_account.alias, 'NAM', -self.PROPOSAL_MIN_FUNDS,
-                                                       self.seed)
+        self.store.proposals.create_proposal(proposal_id, proposer_account.get_id(), plan.context['voting_start_epoch'],
+                                             plan.context['voting_end_epoch'], self.seed)
+        self.follow_up('VoteProposal', plan.context['voting_start_epoch'], plan.context['voting_end_epoch'])
+        affected_rows = self.update_balance(proposer_account.alias, 'NAM', -self.PROPOSAL_MIN_FUNDS)
         self.assert_row_affected(affected_rows, 1)
-
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
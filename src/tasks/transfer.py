@@ -1,32 +1,39 @@
-import random
 from dataclasses import dataclass
+from typing import Optional, Union
 
-from src.store import Account
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class Transfer(Task):
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        from_account = Account.get_random_account_with_positive_balance(self.seed)
+class Transfer(TransactionTask):
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        from_account, leases = self.checkout(
+            lambda: self.store.accounts.get_random_account_with_positive_balance(self.seed, r=self.r),
+            lambda account: account.alias)
         if not from_account:
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            return None
 
         token = from_account.token
-
-        to_account = Account.get_random_account(self.seed, tokens=[token])
+        spendable = self.spendable(from_account)
+        amount = self.r.randint(0, max(spendable, 0))
+        reservations = self.reserve(from_account.alias, token, amount) if spendable > 0 else None
+        if reservations is None:
+            self.release(TaskPlan([], leases=leases))
+            return None
+
+        to_account = self.store.accounts.get_random_account(self.seed, tokens=[token], r=self.r)
         while to_account.alias == from_account.alias:
-            to_account = Account.get_random_account(self.seed, tokens=[token])
-        amount = random.randint(0, from_account.amount)
+            to_account = self.store.accounts.get_random_account(self.seed, tokens=[token], r=self.r)
 
         command = self.client.transfer(from_account.alias, to_account.alias, token, amount, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
+        return TaskPlan(command, {'from_account': from_account, 'to_account': to_account, 'token': token,
+                                  'amount': amount}, leases=leases, reservations=reservations)
+
+    def complete(self, plan: TaskPlan, stdout: str):
+        from_account, to_account = plan.context['from_account'], plan.context['to_account']
+        token, amount = plan.context['token'], plan.context['amount']
 
-        changed_rows = Account.update_account_balance(from_account.alias, token, -amount, self.seed)
+        changed_rows = self.update_balance(from_account.alias, token, -amount)
         self.assert_row_affected(1, changed_rows)
-        changed_rows = Account.update_account_balance(to_account.alias, token, amount, self.seed)
+        changed_rows = self.update_balance(to_account.alias, token, amount)
         self.assert_row_affected(1, changed_rows)
-
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
@@ -1,42 +1,42 @@
 from dataclasses import dataclass
+from typing import Optional, Union
 
-from src.store import Delegation, Account, Validator, Withdrawal
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class Unbond(Task):
+class Unbond(TransactionTask):
     WITHDRAWAL_EPOCH_WAIT: int = 7
+    NEEDS_EPOCH = True
 
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        epoch_command = self.client.get_current_epoch(ledger_address)
-        is_successful, epoch_stdout, epoch_stderr = self.execute_command(epoch_command)
-
-        if not is_successful:
-            raise Exception("Can't query current epoch.")
-
-        current_epoch = self.parser.parse_client_epoch(epoch_stdout)
-
-        delegation = Delegation.get_random_valid_delegation(current_epoch, self.seed)
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        delegation, leases = self.checkout(
+            lambda: self.store.delegations.get_random_valid_delegation(current_epoch, self.seed, r=self.r),
+            lambda delegation: self.signer_of(delegation.account_id))
         if not delegation:
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            return None
 
-        delegation_account = Account.get_by_id(delegation.account_id)
-        validator_account = Validator.get_by_id(delegation.validator_id)
+        delegation_account = self.store.accounts.get_by_id(delegation.account_id)
+        validator_account = self.store.validators.get_by_id(delegation.validator_id)
 
         command = self.client.unbond(delegation_account.alias, validator_account.address, delegation.amount,
                                      ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
+        return TaskPlan(command, {'delegation': delegation, 'delegation_account': delegation_account,
+                                  'validator_account': validator_account}, leases=leases)
 
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
+    def complete(self, plan: TaskPlan, stdout: str):
+        delegation = plan.context['delegation']
+        delegation_account, validator_account = plan.context['delegation_account'], plan.context['validator_account']
 
         withdrawals = self.parser.parse_withdrawal_from_unbond_tx(stdout)
         for withdrawal in withdrawals:
-            Withdrawal.create_withdrawal(delegation_account.get_id(), validator_account.get_id(), withdrawal[1],
-                                         withdrawal[0], self.seed)
+            self.store.withdrawals.create_withdrawal(delegation_account.get_id(), validator_account.get_id(),
+                                                     withdrawal[1], withdrawal[0], self.seed)
+            self.follow_up('Withdraw', withdrawal[0])
 
-        affected_rows = Delegation.delete_by_id(delegation.get_id())
+        affected_rows = self.store.delegations.delete_by_id(delegation.get_id())
         self.assert_row_affected(affected_rows, 1)
 
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
+    def simulated_output(self, plan: TaskPlan, current_epoch: int) -> str:
+        return "Last committed epoch: {}\nAmount {} withdrawable starting from epoch {}.".format(
+            current_epoch, plan.context['delegation'].amount, current_epoch + self.WITHDRAWAL_EPOCH_WAIT)
@@ -1,39 +1,30 @@
-import random
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Tuple, Optional, Union
 
-from src.store import Account, Proposal, Delegation
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class VoteProposal(Task):
+class VoteProposal(TransactionTask):
     votes: Tuple[str, str] = ('yay', 'nay')
+    NEEDS_EPOCH = True
 
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        epoch_command = self.client.get_current_epoch(ledger_address)
-        is_successful, epoch_stdout, epoch_stderr = self.execute_command(epoch_command)
-
-        if not is_successful:
-            raise Exception("Can't query current epoch.")
-
-        current_epoch = self.parser.parse_client_epoch(epoch_stdout)
-
-        proposal = Proposal.get_random_votable_proposal(current_epoch, self.seed)
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        proposal = self.store.proposals.get_random_votable_proposal(current_epoch, self.seed, r=self.r)
         if proposal is None:
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            return None
 
-        delegation = Delegation.get_random_valid_delegation(current_epoch, self.seed)
+        delegation, leases = self.checkout(
+            lambda: self.store.delegations.get_random_valid_delegation(current_epoch, self.seed, r=self.r),
+            lambda delegation: self.signer_of(delegation.account_id))
         if delegation is None:
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            return None
 
-        delegation_account = Account.get_by_id(delegation.account_id)
-        vote = random.choice(self.votes)
+        delegation_account = self.store.accounts.get_by_id(delegation.account_id)
+        vote = self.r.choice(self.votes)
 
         command = self.client.vote_proposal(proposal.proposal_id, vote, delegation_account.alias, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
-
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
+        return TaskPlan(command, leases=leases)
 
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
+    def complete(self, plan: TaskPlan, stdout: str):
+        pass
@@ -1,47 +1,46 @@
 from dataclasses import dataclass
+from typing import Optional, Union
 
-from src.store import Account, Validator, Withdrawal
-from src.task import Task, TaskResult
+from src.task import TransactionTask, TaskPlan
 
 
 @dataclass
-class Withdraw(Task):
+class Withdraw(TransactionTask):
+    NEEDS_EPOCH = True
 
-    def handler(self, step_index: int, base_directory: str, ledger_address: str, dry_run: bool) -> TaskResult:
-        epoch_command = self.client.get_current_epoch(ledger_address)
-        is_successful, epoch_stdout, epoch_stderr = self.execute_command(epoch_command)
-
-        if not is_successful:
-            raise Exception("Can't query current epoch.")
-
-        current_epoch = self.parser.parse_client_epoch(epoch_stdout)
-
-        withdraw = Withdrawal.get_random_withdrawable_withdraw(current_epoch, self.seed)
+    def prepare(self, step_index: int, ledger_address: str, current_epoch: Optional[int]) -> Union[TaskPlan, None]:
+        withdraw, leases = self.checkout(
+            lambda: self.store.withdrawals.get_random_withdrawable_withdraw(current_epoch, self.seed, r=self.r),
+            lambda withdraw: self.signer_of(withdraw.account_id))
         if not withdraw:
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            return None
 
-        delegation_account = Account.get_by_id(withdraw.account_id)
-        validator_account = Validator.get_by_id(withdraw.validator_id)
+        delegation_account = self.store.accounts.get_by_id(withdraw.account_id)
+        validator_account = self.store.validators.get_by_id(withdraw.validator_id)
 
         if delegation_account is None or validator_account is None:
-            Withdrawal.delete_by_id(withdraw.get_id())
-            return TaskResult(self.task_name, "", "", "", step_index, self.seed)
+            self.store.withdrawals.delete_by_id(withdraw.get_id())
+            self.release(TaskPlan([], leases=leases))
+            return None
 
-        compatible_withdraws = Withdrawal.get_compatible_withdrawals(delegation_account.get_id(),
-                                                                     validator_account.get_id(), current_epoch,
-                                                                     self.seed)
-        withdrawable_sum = sum([withdraw.amount for withdraw in compatible_withdraws])
+        compatible_withdraws = self.store.withdrawals.get_compatible_withdrawals(delegation_account.get_id(),
+                                                                                 validator_account.get_id(),
+                                                                                 current_epoch, self.seed)
 
         command = self.client.withdraw(delegation_account.alias, validator_account.address, ledger_address)
-        is_successful, stdout, stderr = self.execute_command(command)
+        return TaskPlan(command, {'delegation_account': delegation_account,
+                                  'compatible_withdraws': list(compatible_withdraws)}, leases=leases)
 
-        if not is_successful:
-            return TaskResult(self.task_name, command, stdout, stderr, step_index, self.seed)
+    def complete(self, plan: TaskPlan, stdout: str):
+        delegation_account = plan.context['delegation_account']
+        compatible_withdraws = plan.context['compatible_withdraws']
+        withdrawable_sum = sum([withdraw.amount for withdraw in compatible_withdraws])
 
         for withdraw in compatible_withdraws:
-            Withdrawal.delete_by_id(withdraw.get_id())
+            self.store.withdrawals.delete_by_id(withdraw.get_id())
+        if self.pipeline is not None:
+            # the follow-up of this tx was taken when it was picked, the other withdrawals went with it
+            self.pipeline.discard('Withdraw', len(compatible_withdraws) - 1)
 
-        affected_rows = Account.update_account_balance(delegation_account.alias, 'NAM', withdrawable_sum, self.seed)
+        affected_rows = self.update_balance(delegation_account.alias, 'NAM', withdrawable_sum)
         self.assert_row_affected(affected_rows, 1)
-
-        return TaskResult(self.task_name, ' '.join(command), stdout, stderr, step_index, self.seed)
@@ -0,0 +1,47 @@
+import logging
+import os
+import shutil
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+WALLET_MODES = ['shared', 'isolated']
+
+
+@dataclass
+class Wallets:
+    # --base-dir, the wallet every seed signs from, or the template of the per seed copies
+    template: str
+    mode: str = 'shared'
+    directory: str = 'wallets'
+    # node data that the client doesn't need, not copied
+    ignore: List[str] = field(default_factory=lambda: ['db', 'cometbft', 'tendermint', '*.lock'])
+
+    def __post_init__(self):
+        if self.mode not in WALLET_MODES:
+            raise Exception("Unknown wallets mode {}, expected one of {}.".format(self.mode, ', '.join(WALLET_MODES)))
+
+    @staticmethod
+    def from_config(template: str, data: Dict) -> 'Wallets':
+        wallets = Wallets(template, data.get('mode', 'shared'), data.get('directory', 'wallets'))
+        if 'ignore' in data:
+            wallets.ignore = data['ignore']
+        return wallets
+
+    @property
+    def isolated(self) -> bool:
+        return self.mode == 'isolated'
+
+    def base_directory(self, seed: int) -> str:
+        if not self.isolated:
+            return self.template
+        return os.path.abspath(os.path.join(self.directory, str(seed)))
+
+    def prepare(self, seed: int) -> str:
+        base_directory = self.base_directory(seed)
+        # an existing copy is kept, the accounts of the seed are in it
+        if self.isolated and not os.path.isdir(base_directory):
+            logging.info("wallets - Copying {} to {} for seed {}".format(self.template, base_directory, seed))
+            shutil.copytree(self.template, base_directory + '.tmp', ignore=shutil.ignore_patterns(*self.ignore),
+                            dirs_exist_ok=True)
+            os.replace(base_directory + '.tmp', base_directory)
+        return base_directory
@@ -0,0 +1,85 @@
+import random
+from bisect import bisect
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, List, Optional, Union
+
+
+@dataclass
+class TaskSampler:
+    task_types: List[str]
+    probabilities: List[float]
+    cum_weights: List[float] = field(init=False)
+    total: float = field(init=False)
+
+    def __post_init__(self):
+        if not self.task_types or len(self.task_types) != len(self.probabilities) \
+                or any([probability < 0 for probability in self.probabilities]) or sum(self.probabilities) <= 0:
+            raise Exception("Task probabilities must be positive, one per task type.")
+        # computed once per mix instead of on every pick
+        self.cum_weights = list(accumulate(self.probabilities))
+        self.total = self.cum_weights[-1] + 0.0
+
+    @staticmethod
+    def from_config(tasks: List[Dict[str, Union[str, int]]]) -> 'TaskSampler':
+        return TaskSampler([task['type'] for task in tasks], [task['probability'] for task in tasks])
+
+    def pick(self, r: random.Random) -> str:
+        # same draw as r.choices(task_types, probabilities), a seed keeps giving the same sequence of tasks
+        return self.task_types[bisect(self.cum_weights, r.random() * self.total, 0, len(self.task_types) - 1)]
+
+
+@dataclass
+class Phase:
+    name: str
+    sampler: TaskSampler
+    # the phase ends after this many seconds or txs, whichever comes first
+    duration: Optional[float] = None
+    total_tx: Optional[int] = None
+    # open-loop tx/s of each seed, closed loop (or the configured scheduler) when missing
+    rate: Optional[float] = None
+    max_in_flight: Optional[int] = None
+
+    def __post_init__(self):
+        if self.duration is None and self.total_tx is None:
+            raise Exception("Workload phase {} needs a duration or a total_tx.".format(self.name))
+
+    def describe(self) -> str:
+        limits = []
+        if self.duration is not None:
+            limits.append('{}s'.format(self.duration))
+        if self.total_tx is not None:
+            limits.append('{} txs'.format(self.total_tx))
+        return '{} for {}'.format('{} tx/s'.format(self.rate) if self.rate else 'closed loop', ' or '.join(limits))
+
+    def scheduler(self, configured: Optional[Dict]) -> Optional[Dict]:
+        if self.rate is None and configured is None:
+            return None
+        scheduler = dict(configured or {})
+        if self.rate is not None:
+            # the rate of the phase replaces the whole profile of the configured scheduler
+            scheduler.update({'rate': self.rate, 'profile': 'constant', 'ramp_up': 0})
+        if self.max_in_flight is not None:
+            scheduler['max_in_flight'] = self.max_in_flight
+        scheduler['duration'] = self.duration
+        return scheduler
+
+
+@dataclass
+class Workload:
+    phases: List[Phase]
+
+    @staticmethod
+    def from_config(data: Dict, tasks: List[Dict[str, Union[str, int]]]) -> 'Workload':
+        phases = []
+        for index, phase in enumerate(data.get('phases', [])):
+            # phases without their own mix send the top level tasks
+            phases.append(Phase(phase.get('name', 'phase-{}'.format(index)),
+                                TaskSampler.from_config(phase.get('tasks', tasks)), phase.get('duration', None),
+                                phase.get('total_tx', None), phase.get('rate', None), phase.get('max_in_flight', None)))
+        if not phases:
+            raise Exception("A workload needs at least one phase.")
+        return Workload(phases)
+
+    def task_types(self) -> List[str]:
+        return [task_type for phase in self.phases for task_type in phase.sampler.task_types]
@@ -0,0 +1,20 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from src.mock_rpc import MockChain, build_handler
+
+
+@pytest.fixture
+def chain():
+    return MockChain(block_time=0.5)
+
+
+@pytest.fixture
+def node(chain):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), build_handler(chain))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield '127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
@@ -0,0 +1,31 @@
+from src.epoch_tracker import EpochTracker
+from src.node_pool import NodePool
+
+
+def test_failed_refresh_at_start_leaves_the_cache_empty():
+    def query(node):
+        raise Exception("Can't query current epoch.")
+
+    tracker = EpochTracker(query, NodePool(['127.0.0.1:26657']), refresh_interval=60)
+    tracker.start()
+    tracker.stop()
+
+    assert tracker.get() is None
+    assert tracker.queries == 1
+
+
+def test_refresh_queries_a_node_of_the_pool():
+    pool = NodePool(['127.0.0.1:26657', '127.0.0.1:26658'])
+    pool.states['127.0.0.1:26658'].healthy = False
+    queried = []
+
+    def query(node):
+        queried.append(node)
+        return 12
+
+    tracker = EpochTracker(query, pool)
+    for _ in range(3):
+        tracker.refresh()
+
+    assert queried == ['127.0.0.1:26657'] * 3
+    assert tracker.get() == 12
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = """tasks:
+  - type: Faucet
+    probability: 1
+  - type: Transfer
+    probability: 1
+  - type: Delegate
+    probability: 1
+settings:
+  dry_run: false
+  total_tx: {total_tx}
+  engine: {engine}
+  concurrency: 4
+  store:
+    backend: memory
+"""
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_session_against_fake_namada(tmp_path, node, engine):
+    config_path = tmp_path / 'config.yaml'
+    config_path.write_text(CONFIG.format(total_tx=12, engine=engine))
+    base_directory = tmp_path / 'base'
+    base_directory.mkdir()
+    env = dict(os.environ, FAKE_NAMADA_TX_LATENCY='0.01', FAKE_NAMADA_QUERY_LATENCY='0')
+
+    process = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), '-bd', str(base_directory),
+                              '-bb', os.path.join(ROOT, 'bin', 'fake-namada'), '-s', '7', '-n', node,
+                              '-c', str(config_path), '-j'], cwd=tmp_path, env=env, capture_output=True, text=True,
+                             timeout=300)
+    assert process.returncode == 0, process.stderr
+
+    result = json.loads((tmp_path / 'result_7.json').read_text())
+    assert result['total_tx'] == 12
+    assert sum([stats['succeeded'] for stats in result['stats'].values()]) == 12
+    assert sum([stats['failed'] for stats in result['stats'].values()]) == 0
@@ -0,0 +1,54 @@
+import random
+import statistics
+
+import pytest
+
+from src.histogram import Histogram, PERCENTILES, merge_latencies
+
+
+def sample(seed: int, size: int):
+    # seconds, shaped like tx latencies: most around 200ms with a long tail
+    r = random.Random(seed)
+    return [r.lognormvariate(-1.5, 0.5) for _ in range(size)]
+
+
+def record(values) -> Histogram:
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    return histogram
+
+
+@pytest.mark.parametrize('percentile', PERCENTILES)
+def test_percentiles_match_the_exact_quantiles(percentile):
+    values = sample(7, 10000)
+    exact = statistics.quantiles(values, n=1000, method='inclusive')[int(percentile * 10) - 1] * 1000
+
+    assert record(values).percentile(percentile) == pytest.approx(exact, rel=0.005)
+
+
+def test_summary():
+    values = sample(7, 1000)
+    summary = record(values).summary()
+
+    assert summary['count'] == 1000
+    assert summary['max'] == pytest.approx(max(values) * 1000, abs=0.001)
+    assert Histogram().summary()['p50'] is None
+
+
+def test_merge_equals_recording_both_samples():
+    first, second = sample(7, 5000), sample(8, 3000)
+    merged = record(first)
+    merged.merge(record(second))
+
+    assert merged == record(first + second)
+    assert merged.summary() == record(first + second).summary()
+
+
+def test_merge_latencies_of_several_seeds():
+    first, second = sample(7, 500), sample(8, 500)
+    merged = merge_latencies([{'Transfer': {'total': record(first)}},
+                              {'Transfer': {'total': record(second)}, 'Faucet': {'total': record(second)}}])
+
+    assert merged['Transfer']['total'] == record(first + second)
+    assert merged['Faucet']['total'] == record(second)
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.leases import AccountLeases, LeasesExhausted
+
+
+def build_leases(on_exhausted: str, blocking: bool, wait_timeout: float = 5) -> AccountLeases:
+    leases = AccountLeases(limit=1, on_exhausted=on_exhausted, wait_timeout=wait_timeout)
+    leases.blocking = blocking
+    return leases
+
+
+def test_async_waiter_is_woken_by_a_release():
+    leases = build_leases('wait', False)
+    assert leases.checkout(lambda: 'albert', lambda alias: alias) == ('albert', ['albert'])
+
+    async def run():
+        with pytest.raises(LeasesExhausted) as e:
+            leases.checkout(lambda: 'albert', lambda alias: alias)
+        # given back from another thread, like a tx completing in the executor
+        threading.Timer(0.1, leases.release, [['albert']]).start()
+        start_time = time.monotonic()
+        assert await leases.wait_async(e.value.releases, leases.wait_timeout)
+        return time.monotonic() - start_time
+
+    # woken by the release, not by the timeout
+    assert asyncio.run(run()) < 1
+    assert leases.checkout(lambda: 'albert', lambda alias: alias) == ('albert', ['albert'])
+    assert leases.exhausted == 0
+    assert leases.waiters == []
+
+
+def test_blocking_checkout_is_woken_by_a_release():
+    leases = build_leases('wait', True)
+    leases.checkout(lambda: 'albert', lambda alias: alias)
+
+    threading.Timer(0.1, leases.release, [['albert']]).start()
+    start_time = time.monotonic()
+
+    assert leases.checkout(lambda: 'albert', lambda alias: alias) == ('albert', ['albert'])
+    assert time.monotonic() - start_time < 1
+
+
+def test_release_before_the_wait_is_not_missed():
+    leases = build_leases('wait', False)
+    leases.checkout(lambda: 'albert', lambda alias: alias)
+    with pytest.raises(LeasesExhausted) as e:
+        leases.checkout(lambda: 'albert', lambda alias: alias)
+    leases.release(['albert'])
+
+    assert asyncio.run(leases.wait_async(e.value.releases, 0.1))
+
+
+def test_wait_timeout_expires():
+    leases = build_leases('wait', False, wait_timeout=0.1)
+    leases.checkout(lambda: 'albert', lambda alias: alias)
+
+    with pytest.raises(LeasesExhausted) as e:
+        leases.checkout(lambda: 'albert', lambda alias: alias)
+    assert not asyncio.run(leases.wait_async(e.value.releases, leases.wait_timeout))
+    assert leases.exhausted == 1
+    assert leases.waiters == []
+
+    # past the timeout the blocking checkout gives up too
+    leases.blocking = True
+    assert leases.checkout(lambda: 'albert', lambda alias: alias) == (None, [])
+    assert leases.exhausted == 2
+
+
+@pytest.mark.parametrize('blocking', [True, False])
+def test_skip_gives_up_without_waiting(blocking):
+    leases = build_leases('skip', blocking)
+    leases.checkout(lambda: 'albert', lambda alias: alias)
+    start_time = time.monotonic()
+
+    assert leases.checkout(lambda: 'albert', lambda alias: alias) == (None, [])
+    assert time.monotonic() - start_time < 1
+    assert leases.exhausted == 1
+    assert leases.contended == leases.attempts
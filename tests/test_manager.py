@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import pytest
+
+from src.config import Config
+from src.manager import Manager
+from src.node_pool import NodePool
+from src.task import TaskResult
+from src.tasks.transfer import Transfer
+
+
+def build_manager(engine: str) -> Manager:
+    config = Config({'tasks': [{'type': 'Transfer', 'probability': 1}],
+                     'settings': {'dry_run': False, 'total_tx': 5, 'engine': engine, 'scheduler': {'rate': 0.5}}})
+    manager = Manager('manager:7', config, 7)
+    manager.node_pool = NodePool(['127.0.0.1:26657'])
+    manager.all_tasks = {'Transfer': Transfer('Transfer', '.', 'namada', 7)}
+    return manager
+
+
+def failed_result(index: int) -> TaskResult:
+    return TaskResult('Transfer', 'transfer', '', 'Error: rejected', index, 7).set_time_elapsed(time.time())
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_open_loop_sends_nothing_after_a_stop(tmp_path, monkeypatch, engine):
+    monkeypatch.chdir(tmp_path)
+    manager = build_manager(engine)
+    sent = []
+
+    def execute(index, task, base_directory, node_address, dry_run):
+        sent.append(index)
+        # fails once the scheduler is already waiting for the next dispatch
+        time.sleep(0.2)
+        return failed_result(index)
+
+    async def execute_async(index, task, base_directory, node_address, dry_run):
+        sent.append(index)
+        await asyncio.sleep(0.2)
+        return failed_result(index)
+
+    monkeypatch.setattr(manager, '_execute_task', execute)
+    monkeypatch.setattr(manager, '_execute_task_async', execute_async)
+
+    result = manager.run_load('.', ['127.0.0.1:26657'], True)
+
+    # fail fast: the second tx, due 2s after the first one, is never sent
+    assert sent == [1]
+    assert result.stats['Transfer']['failed'] == 1
+    assert manager.last_index == 1
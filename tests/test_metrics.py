@@ -0,0 +1,25 @@
+from src.histogram import Histogram
+from src.manager import ManagerResult
+from src.metrics import LiveMetrics
+
+
+def test_every_latency_percentile_is_its_own_gauge(tmp_path):
+    latency = Histogram()
+    for seconds in [0.1, 0.2, 0.4]:
+        latency.record(seconds)
+    result = ManagerResult(7, {'Transfer': {'succeeded': 3, 'failed': 0, 'skipped': 0}},
+                           latencies={'Transfer': {'total': latency}})
+    metrics = LiveMetrics(lambda: [result], jsonl_path=str(tmp_path / 'metrics.jsonl'))
+
+    metrics.sample()
+    lines = metrics.exposition.splitlines()
+
+    for metric in ['namada_load_latency_p50_seconds', 'namada_load_latency_p99_9_seconds',
+                   'namada_load_latency_max_seconds']:
+        assert '# TYPE {} gauge'.format(metric) in lines
+    assert 'namada_load_latency_p50_seconds{seed="7",scope="task",name="Transfer"} 0.2' in lines
+    assert 'namada_load_latency_max_seconds{seed="7",scope="task",name="Transfer"} 0.4' in lines
+    assert not [line for line in lines if 'quantile=' in line]
+    # every series is declared once, before its samples
+    types = [line.split(' ')[2] for line in lines if line.startswith('# TYPE')]
+    assert len(types) == len(set(types))
@@ -0,0 +1,19 @@
+from src.node_pool import NodePool
+
+
+def test_unknown_node_is_replaced_by_a_pick():
+    pool = NodePool(['127.0.0.1:26657'])
+
+    node = pool.acquire('10.0.0.1:26657')
+
+    assert node == '127.0.0.1:26657'
+    assert pool.states[node].outstanding == 1
+
+
+def test_release_of_an_unknown_node_is_ignored():
+    pool = NodePool(['127.0.0.1:26657'])
+
+    pool.release('10.0.0.1:26657', 0.5, False)
+
+    assert list(pool.states.keys()) == ['127.0.0.1:26657']
+    assert pool.states['127.0.0.1:26657'].consecutive_failures == 0
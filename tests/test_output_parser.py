@@ -0,0 +1,71 @@
+import os
+
+from src.output_parser import Parser
+
+OUTPUTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
+V1 = 'atest1v4ehgw36x3prswzxggunzv6pxqmnvdj9xvcyzvpsggeyvs3cg9qnywf589qnwvfsg5erg3fkl09rg5'
+V2 = 'atest1v4ehgw36gc6yxvpjxccyzvphxycrxw2xxsuyydesxgcnjs3cg9znwv3cxgmnj32yxy6rssf5tcqjm3'
+V3 = 'atest1v4ehgw36xuunwd6989prwdfkxqmnvsfjxs6nvv6xxucrs3f3xcmns3fcxdzrvvz9xverzvzr56le8f'
+D1 = 'atest1d9khqw36xvcnsdpjx56rgv3s89z5xdjpxqmrsvejxvcnss3exc6rzd35xymnqwfcxy6ygse4wqzcv7'
+D2 = 'atest1d9khqw368qcyx3jxxu6njs2yxs6y2sjyxdzrwvjy8pzyzd2pxv6rvdzpgcmyy3zzx5cnydzytfwlly'
+
+
+def read_output(name: str) -> str:
+    with open(os.path.join(OUTPUTS, '{}.txt'.format(name)), 'r') as f:
+        return f.read()
+
+
+def test_validators_include_the_below_capacity_ones():
+    assert Parser.parse_client_validators(read_output('bonded_stake')) == [V1, V2, V3]
+
+
+def test_bonds_dump():
+    bonds = Parser.parse_client_bonds(read_output('bonds'))
+
+    # self-bonds are left out
+    assert bonds.delegations == [(D1, V1, 3, 3000), (D1, V1, 7, 250), (D2, V2, 41, 49999)]
+    assert bonds.withdrawals == [(D1, V1, 10, 4, 500), (D1, V1, 14, 9, 1200), (D2, V2, 60, 50, 75)]
+    assert Parser.parse_client_delegations(read_output('bonds')) == bonds.delegations
+    assert Parser.parse_client_all_withdrawals(read_output('bonds')) == bonds.withdrawals
+
+
+def test_withdrawals_of_a_pair():
+    assert Parser.parse_client_withdrawals(read_output('bonds_pair'), V1) == [(D1, V1, 10, 4, 500),
+                                                                              (D1, V1, 14, 9, 1200)]
+
+
+def test_proposals():
+    assert Parser.parse_client_proposals(read_output('proposals')) == [(0, D1, 12, 24, 'ended'),
+                                                                       (1, D2, 51, 60, 'on-going')]
+
+
+def test_balances_skip_the_tokens_without_balance():
+    assert Parser.parse_client_balance_owner(read_output('balance')) == {'NAM': 1000000, 'DOT': 25, 'BTC': 0}
+
+
+def test_address_list():
+    assert Parser.parse_wallet_address_list(read_output('address_list')) == (
+        ['lt-account-mzd-qve-kop-000001-7', 'faucet'],
+        [D1, 'atest1v4ehgw36g4pyg3j9x3qnjd3cxgmyz3fk8qcrys3hxdp5xwfnx3zyxsj9xgunxsfjg5u5xvzyzrrqtn'])
+
+
+def test_valid_tx():
+    tx = Parser.parse_tx(read_output('tx_valid'), '')
+
+    assert tx.is_valid
+    assert tx.tx_hash == '7E8F0D6C84D3E9C1A8E3BF5B9EEF2A5B2D0E6A1C4F3B2A19087E6D5C4B3A2918'
+    assert tx.gas_used == 2367
+    assert tx.epoch == 52
+    assert tx.withdrawals == [(59, 500)]
+
+
+def test_invalid_tx():
+    tx = Parser.parse_tx(read_output('tx_invalid'), '')
+
+    assert not tx.is_valid
+    assert tx.tx_hash == '0A1B2C3D4E5F60718293A4B5C6D7E8F90A1B2C3D4E5F60718293A4B5C6D7E8F9'
+    assert tx.epoch is None
+    assert tx.withdrawals == []
+    # stderr fails the tx, except for the known harmless errors
+    assert not Parser.parse_tx(read_output('tx_valid'), 'Error: connection refused').is_valid
+    assert Parser.parse_tx(read_output('tx_valid'), "Error: the source doesn't have enough balance").is_valid
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+from src.rpc import RpcClient, RpcSubmitter, TxTemplates
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = """tasks:
+  - type: Faucet
+    probability: 1
+  - type: Transfer
+    probability: 1
+settings:
+  dry_run: false
+  total_tx: {total_tx}
+  store:
+    backend: memory
+  rpc:
+    templates_dir: templates/{{seed}}
+    export: {export}
+"""
+
+
+def write_templates(templates_dir, task_name, txs):
+    os.makedirs(templates_dir / task_name)
+    for index, tx in enumerate(txs):
+        (templates_dir / task_name / '{:06d}.tx'.format(index)).write_bytes(tx)
+
+
+def test_submitter_broadcasts_each_template_once(tmp_path, chain, node):
+    write_templates(tmp_path, 'Transfer', [b'first signed tx', b'second signed tx'])
+    submitter = RpcSubmitter(RpcClient(), TxTemplates(str(tmp_path)))
+
+    results = [submitter.submit('Transfer', index, 7, node) for index in range(3)]
+
+    assert not any([result.is_error() for result in results[:2]])
+    assert results[0].tx_hash == hashlib.sha256(b'first signed tx').hexdigest().upper()
+    assert chain.seen == {hashlib.sha256(tx).hexdigest().upper() for tx in [b'first signed tx', b'second signed tx']}
+    # nothing left for the task, it falls back to the client
+    assert results[2] is None
+    assert submitter.submit('Faucet', 3, 7, node) is None
+
+
+def test_submitter_reports_rejected_txs(tmp_path, chain, node):
+    write_templates(tmp_path, 'Transfer', [b'signed tx', b'signed tx'])
+    submitter = RpcSubmitter(RpcClient(), TxTemplates(str(tmp_path)))
+
+    accepted, rejected = [submitter.submit('Transfer', index, 7, node) for index in range(2)]
+
+    assert not accepted.is_error()
+    assert rejected.is_error()
+    assert 'already exists' in rejected.stderr
+    assert len(chain.seen) == 1
+
+
+def test_exported_templates_are_broadcast(tmp_path, chain, node):
+    config_path = tmp_path / 'config.yaml'
+    config_path.write_text(CONFIG.format(total_tx=6, export=6))
+    base_directory = tmp_path / 'base'
+    base_directory.mkdir()
+    env = dict(os.environ, FAKE_NAMADA_TX_LATENCY='0', FAKE_NAMADA_QUERY_LATENCY='0')
+
+    process = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), '-bd', str(base_directory),
+                              '-bb', os.path.join(ROOT, 'bin', 'fake-namada'), '-s', '7', '-n', node,
+                              '-c', str(config_path), '-j'], cwd=tmp_path, env=env, capture_output=True, text=True,
+                             timeout=300)
+    assert process.returncode == 0, process.stderr
+
+    for task_name in ['Faucet', 'Transfer']:
+        assert sorted(os.listdir(tmp_path / 'templates' / '7' / task_name)) == [
+            '{:06d}.tx'.format(index) for index in range(1, 7)]
+    result = json.loads((tmp_path / 'result_7.json').read_text())
+    assert sum([stats['succeeded'] for stats in result['stats'].values()]) == 6
+    # every tx of the run went through the rpc, none through the client
+    assert len(chain.seen) == 6
@@ -0,0 +1,24 @@
+import pytest
+
+from src import store
+from src.memory_store import MemoryStore
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryStore.build(7)
+        return
+    store.connect(str(tmp_path / 'db.db'))
+    yield store.sqlite_store()
+    store.db.close()
+
+
+def test_unknown_ids_are_none_on_both_backends(backend):
+    account = backend.accounts.create_account('albert', 'atest1albert', 'NAM', 100, 7)
+    validator = backend.validators.create_validator('atest1validator', 7)
+
+    assert backend.accounts.get_by_id(account.get_id()).alias == 'albert'
+    assert backend.validators.get_by_id(validator.get_id()).address == 'atest1validator'
+    assert backend.accounts.get_by_id(account.get_id() + 1) is None
+    assert backend.validators.get_by_id(validator.get_id() + 1) is None